@@ -0,0 +1,312 @@
+"""
+Analysis of a converted build: the critical path through the process tree, the
+number of running jobs over time and the time spent per process type and per
+host.
+
+All functions take a dictionary that maps pids to processes, as returned by
+``backend.strace.parse_strace_output`` or kept by ``dataset.Dataset`` (an
+optional ``root`` item is ignored). The analysis is done with a few sorts and
+linear passes over the processes, so it scales to millions of processes.
+"""
+
+
+def iter_items(processes):
+    return ((pid, p) for pid, p in processes.iteritems() if pid != 'root')
+
+
+def last_command(process):
+    """
+    Return the command of the last syscall of a process, skipping the
+    ``<... execve resumed>`` line of a split ``execve``. Syscalls are either
+    ``Syscall`` objects or dictionaries.
+    """
+    cmd = ''
+
+    for syscall in reversed(process['syscalls']):
+        cmd = syscall['cmd'] if isinstance(syscall, dict) else syscall.cmd
+
+        if not cmd.startswith('<... execve resumed>'):
+            break
+
+    return cmd
+
+
+def command(process):
+    """
+    Return the executable of the last ``execve`` of a process.
+    """
+    cmd = last_command(process)
+
+    if cmd.startswith('execve("'):
+        return cmd[8:cmd.find('"', 8)]
+
+    return cmd
+
+
+def critical_path(processes, root):
+    """
+    Return the critical path of the build as a list of ``(pid, start, end,
+    depth)`` tuples in order of start time. Starting at the end of a process,
+    the path continues in the child that ends last. Before the start of that
+    child, it continues in the sibling that ends last before that start, and so
+    on. The time of a process on the path that is not covered by its children
+    on the path is the process' own contribution to the wall time.
+    """
+    path = []
+    stack = [(root, 0)]
+
+    while stack:
+        pid, depth = stack.pop()
+        process = processes[pid]
+        path.append((pid, process['start'], process['end'], depth))
+
+        children = sorted((processes[c]['end'], c)
+                          for c in process['children'] if c in processes)
+        limit = process['end']
+
+        # The critical children are pushed from last to first, so the first
+        # one is visited next.
+        for end, c in reversed(children):
+            if end <= limit:
+                stack.append((c, depth + 1))
+                limit = processes[c]['start']
+
+    return path
+
+
+def jobs(processes):
+    """
+    Return the ``(start, end)`` intervals of the processes that do the actual
+    work of a build, i.e. the processes without children (compilers, linkers,
+    etc.). Make and shell processes only wait for their children.
+    """
+    return [(p['start'], p['end']) for pid, p in iter_items(processes)
+            if not p['children']]
+
+
+def concurrency(intervals):
+    """
+    Calculate the number of running jobs over time with a sweep line over the
+    start and end times of the intervals. Returns a step function as a list of
+    ``(time, count)`` tuples, sorted by time: from ``time`` on, ``count`` jobs
+    are running.
+    """
+    # At equal times, ends (-1) are sorted before starts (+1).
+    events = sorted([(end, -1) for start, end in intervals] +
+                    [(start, 1) for start, end in intervals])
+    steps = []
+    count = 0
+
+    for time, delta in events:
+        count += delta
+
+        if steps and steps[-1][0] == time:
+            steps[-1] = time, count
+        else:
+            steps.append((time, count))
+
+    return steps
+
+
+def low_concurrency(steps, start, end, max_jobs=1, min_duration=0):
+    """
+    Return the ``(start, end)`` periods within ``[start, end]`` in which at most
+    ``max_jobs`` jobs are running, ordered by decreasing duration.
+    """
+    periods = []
+    period_start = start
+
+    for time, count in steps + [(end, max_jobs + 1)]:
+        time = min(max(time, start), end)
+
+        if count <= max_jobs:
+            if period_start is None:
+                period_start = time
+        elif period_start is not None:
+            if time > period_start and time - period_start >= min_duration:
+                periods.append((period_start, time))
+
+            period_start = None
+
+    periods.sort(key=lambda p: p[0] - p[1])
+
+    return periods
+
+
+def profile(steps, start, end, buckets=1000):
+    """
+    Resample a concurrency step function into at most ``buckets`` buckets of
+    equal duration. Returns a list of ``(bucket start, mean count)`` tuples.
+    """
+    size = max(1, -(-(end - start) // buckets))
+    totals = [0] * (-(-(end - start) // size) or 1)
+
+    # Add the area of each step to the buckets it covers.
+    for (time, count), (next_time, _) in zip(steps, steps[1:]):
+        time, next_time = max(time, start), min(next_time, end)
+
+        while time < next_time and count:
+            bucket = (time - start) // size
+            bucket_end = min(start + (bucket + 1) * size, next_time)
+            totals[bucket] += count * (bucket_end - time)
+            time = bucket_end
+
+    return [(start + i * size, float(total) / size)
+            for i, total in enumerate(totals)]
+
+
+def covered(intervals, start, end):
+    """
+    Return the length of the union of the intervals, clipped to ``[start,
+    end]``.
+    """
+    total = 0
+    cur_start = cur_end = start
+
+    for s, e in sorted(intervals):
+        s, e = max(s, start), min(e, end)
+
+        if s > cur_end:
+            total += cur_end - cur_start
+            cur_start = s
+
+        cur_end = max(cur_end, e)
+
+    return total + cur_end - cur_start
+
+
+def type_times(processes):
+    """
+    Return the number of processes, total time and self time per process
+    type. The self time of a process is the part of its duration in which
+    none of its children was running.
+    """
+    types = {}
+
+    for pid, process in iter_items(processes):
+        children = [(processes[c]['start'], processes[c]['end'])
+                    for c in process['children'] if c in processes]
+        self_time = process['duration'] - covered(children, process['start'],
+                                                  process['end'])
+
+        stats = types.setdefault(process['type'],
+                                 {'count': 0, 'total': 0, 'self': 0})
+        stats['count'] += 1
+        stats['total'] += process['duration']
+        stats['self'] += self_time
+
+    return types
+
+
+def covered_area(steps):
+    """
+    Return the integral of a concurrency step function (the total job time).
+    """
+    return sum(count * (next_time - time) for (time, count), (next_time, _)
+               in zip(steps, steps[1:]))
+
+
+def host_utilization(processes):
+    """
+    Return the number of jobs (see ``jobs``), the total time of the jobs and
+    the maximum and mean number of running jobs per host, for the processes
+    that have a ``host`` (see ``merge``).
+    """
+    hosts = {}
+
+    for pid, process in iter_items(processes):
+        if 'host' in process and not process['children']:
+            hosts.setdefault(process['host'], {})[pid] = process
+
+    if not hosts:
+        return {}
+
+    start = min(p['start'] for pid, p in iter_items(processes))
+    end = max(p['end'] for pid, p in iter_items(processes))
+    result = {}
+
+    for host, host_jobs in hosts.iteritems():
+        steps = concurrency(jobs(host_jobs))
+        job_time = covered_area(steps)
+        result[host] = {
+            'jobs': len(host_jobs),
+            'job_time': job_time,
+            'max': max(count for time, count in steps),
+            'mean': float(job_time) / (end - start or 1),
+        }
+
+    return result
+
+
+def analyze(processes, root, buckets=1000):
+    """
+    Run all analyses on a build and return the results as a dictionary, which
+    can be encoded as JSON.
+    """
+    start, end = processes[root]['start'], processes[root]['end']
+    steps = concurrency(jobs(processes))
+    running = [c for t, c in steps]
+
+    path = [{'pid': pid, 'type': processes[pid]['type'],
+             'command': command(processes[pid]), 'start': s, 'end': e,
+             'depth': depth}
+            for pid, s, e, depth in critical_path(processes, root)]
+
+    return {
+        'wall_time': end - start,
+        'critical_path': path,
+        'concurrency': {
+            'max': max(running) if running else 0,
+            'mean': float(covered_area(steps)) / (end - start or 1),
+            'profile': profile(steps, start, end, buckets),
+            'serial': low_concurrency(steps, start, end, 1,
+                                      (end - start) // 100),
+        },
+        'types': type_times(processes),
+        'hosts': host_utilization(processes),
+    }
+
+
+def print_report(fd, result):
+    """
+    Write a human readable report of the result of ``analyze`` to ``fd``.
+    """
+    print >>fd, 'Wall time: %.3f s' % (result['wall_time'] / 1000.0)
+    print >>fd
+    print >>fd, 'Critical path:'
+
+    for step in result['critical_path']:
+        print >>fd, '  %9.3f %9.3f %8.3f s  %s%-7s #%d %s' % (
+                step['start'] / 1000.0, step['end'] / 1000.0,
+                (step['end'] - step['start']) / 1000.0, '  ' * step['depth'],
+                step['type'], step['pid'], step['command'])
+
+    c = result['concurrency']
+    print >>fd
+    print >>fd, 'Running jobs: at most %d, %.2f on average.' \
+            % (c['max'], c['mean'])
+
+    if c['serial']:
+        print >>fd, 'Periods with at most one running job:'
+
+        for start, end in c['serial']:
+            print >>fd, '  %9.3f %9.3f %8.3f s' % (start / 1000.0,
+                    end / 1000.0, (end - start) / 1000.0)
+
+    print >>fd
+    print >>fd, '%-10s %8s %12s %12s' % ('Type', 'Count', 'Total (s)',
+                                         'Self (s)')
+
+    for name, stats in sorted(result['types'].iteritems(),
+                              key=lambda t: -t[1]['total']):
+        print >>fd, '%-10s %8d %12.3f %12.3f' % (name, stats['count'],
+                stats['total'] / 1000.0, stats['self'] / 1000.0)
+
+    if result['hosts']:
+        print >>fd
+        print >>fd, '%-20s %8s %12s %8s %8s' % ('Host', 'Jobs', 'Job time (s)',
+                                                'Mean', 'Max')
+
+        for name, stats in sorted(result['hosts'].iteritems()):
+            print >>fd, '%-20s %8d %12.3f %8.2f %8d' % (name, stats['jobs'],
+                    stats['job_time'] / 1000.0, stats['mean'], stats['max'])
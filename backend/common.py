@@ -0,0 +1,267 @@
+"""
+Data structures and output of the backends, which convert the logs of a build
+into processes.
+"""
+
+from os import rename
+from os.path import basename
+from sys import stderr
+
+import simplejson as json
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+from analysis import analyze, print_report
+from columnar import dump_columnar
+from database import dump_database
+from details import DetailsWriter, split_details
+from tokens import TokenTable, encode_processes
+from trace_events import dump_chrome_trace, dump_perfetto
+from lod import build_pyramid, dump_pyramid
+import simulate
+
+# Number of bytes of encoded processes that are written to the output at once.
+WRITE_SIZE = 1 << 20
+
+
+class Syscall(object):
+    __slots__ = ('cmd', 'duration', 'end', 'start')
+
+    def __init__(self, start_time, cmd, end=0, duration=0):
+        self.cmd = cmd
+        self.duration = duration
+        self.end = end
+        self.start = start_time
+
+    # Pickle syscalls (e.g. in a checkpoint) as their constructor arguments,
+    # which is much faster than the default pickling of slots.
+    def __reduce__(self):
+        return Syscall, (self.start, self.cmd, self.end, self.duration)
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self):
+        return str(self.to_dict())
+
+    def to_dict(self):
+        return {'cmd': self.cmd, 'duration': self.duration,
+                'start': self.start, 'end': self.end}
+
+    # Used by ujson to encode syscalls.
+    toDict = to_dict
+
+
+def command_type(command):
+    """
+    Determine the process type of a command line, by the name of the
+    executable (see ``backend.strace.parse_syscall_type``).
+    """
+    words = command.lstrip('@-+ \t').split()
+
+    # Skip environment variable assignments, e.g. ``LANG=C gcc ...``.
+    while words and '=' in words[0] and not words[0].startswith('/'):
+        words = words[1:]
+
+    name = basename(words[0]) if words else ''
+
+    if name in ('make', 'gmake', 'pymake', 'make.py') \
+            or name.endswith('make_bsa.py'):
+        return 'make'
+    elif name in ('g++', 'c++', 'cc1plus', 'clang++'):
+        return 'cpp'
+    elif name in ('gcc', 'cc', 'cc1', 'clang'):
+        return 'cc'
+    elif name in ('sh', 'bash'):
+        return 'sh'
+
+    return 'unknown'
+
+
+class JSONSyscallEncoder(json.JSONEncoder):
+
+    def default(self, syscall):
+        if isinstance(syscall, Syscall):
+            return syscall.to_dict()
+        return json.JSONEncoder.default(self, syscall)
+
+
+def json_encoder(native=None):
+    """
+    Return a function that encodes a value (containing ``Syscall`` objects) as
+    JSON. The native ujson encoder is used if it is installed, unless
+    ``native`` is ``False``. Its output is equivalent but more compact than the
+    output of simplejson, which is used otherwise.
+    """
+    if native is None:
+        native = ujson is not None
+
+    if native:
+        return lambda value: ujson.dumps(value, escape_forward_slashes=False)
+
+    return JSONSyscallEncoder().encode
+
+
+def dump_json(fd, processes, properties, native=None, table=None):
+    """
+    Write the processes to ``fd`` in the JSON format. The processes are either
+    a dictionary or an iterable of ``(pid, process)`` pairs (e.g. the generator
+    ``backend.strace.iter_strace_processes``), which is consumed while it is
+    written. Encoded processes are written in chunks of ``WRITE_SIZE`` bytes.
+    See ``json_encoder`` for ``native``. The strings of the ``TokenTable``
+    that encoded the commands of the processes (if any) are written after the
+    processes.
+    """
+    if isinstance(processes, dict):
+        processes = processes.iteritems()
+
+    encode = json_encoder(native)
+    chunk = []
+    size = 0
+
+    fd.write('{"version": 100, "processes": {')
+
+    for i, (pid, process) in enumerate(processes):
+        item = '%s"%s": %s' % (', ' if i else '', pid, encode(process))
+        chunk.append(item)
+        size += len(item)
+
+        if size >= WRITE_SIZE:
+            fd.write(''.join(chunk))
+            chunk = []
+            size = 0
+
+    fd.write(''.join(chunk))
+    fd.write('}')
+
+    if table is not None:
+        fd.write(', "strings": %s' % encode(table.strings))
+
+    print >>fd, ', "properties": %s}' % encode(properties)
+
+
+def summarize(processes, properties):
+    """
+    Generate the ``(pid, process)`` pairs of the processes, and add the number
+    of processes (``process_count``) and the wall time of the build
+    (``wall_time``) to the properties once all pairs are consumed. Both output
+    formats encode the properties after the processes, so the dataset catalog
+    of the viewer can show them without loading the processes.
+    """
+    if isinstance(processes, dict):
+        processes = processes.iteritems()
+
+    count = 0
+    start = end = 0
+
+    for pid, process in processes:
+        if pid != 'root':
+            if not count:
+                start, end = process['start'], process['end']
+
+            count += 1
+            start = min(start, process['start'])
+            end = max(end, process['end'])
+
+        yield pid, process
+
+    properties['process_count'] = count
+    properties['wall_time'] = end - start
+
+
+def dump(fd, processes, properties, output_format='json', table=None):
+    """
+    Write the processes to ``fd`` in the given output format. The commands are
+    encoded with ``table`` if given (only for the JSON format).
+    """
+    processes = summarize(processes, properties)
+
+    if output_format == 'columnar':
+        dump_columnar(fd, processes, properties)
+    elif output_format == 'chrome-trace':
+        dump_chrome_trace(fd, processes, properties)
+    elif output_format == 'perfetto':
+        dump_perfetto(fd, processes, properties)
+    else:
+        if table is not None:
+            processes = encode_processes(processes, table)
+
+        dump_json(fd, processes, properties, table=table)
+
+
+def write_snapshot(path, processes, properties, output_format='json'):
+    """
+    Atomically replace the JSON file at ``path`` with a snapshot of the given
+    processes, so a polling viewer never reads a partially written file.
+    """
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'w') as fd:
+        dump(fd, processes, properties, output_format)
+
+    rename(tmp_path, path)
+
+
+def write_output(args, processes, properties):
+    """
+    Write the processes to the output file in the output format given on the
+    command line, and write the requested details file, pyramid, database and
+    reports.
+    ``processes`` is a dictionary or an iterable of ``(pid, process)`` pairs
+    that ends with the ``('root', pid)`` pair.
+
+    The details file is written from a dictionary as well (e.g. with
+    ``--lod``, or from the ``pymake`` and ``wrapper`` backends):
+
+    >>> import os, tempfile
+    >>> from argparse import Namespace
+    >>> from dataset import load_dataset
+    >>> path = os.path.join(tempfile.mkdtemp(), 'bsa.json')
+    >>> args = Namespace(output=open(path, 'w'), output_format='json',
+    ...                  lod=True, details=True, tokens=False, analyze=False,
+    ...                  simulate=None, sqlite=False)
+    >>> make = {'parent': 0, 'type': 'make', 'start': 0, 'end': 10,
+    ...         'duration': 10, 'children': [],
+    ...         'syscalls': [Syscall(0, 'make', 10, 10)]}
+    >>> write_output(args, {1: make, 'root': 1}, {'threshold': 0.1})
+    >>> args.output.close()
+    >>> print json.loads(load_dataset(path).syscalls(1))[0]['cmd']
+    make
+    """
+    if args.lod or args.analyze or args.simulate or args.sqlite:
+        processes = dict(processes)
+
+    if args.lod:
+        with open(args.output.name + '.lod', 'w') as fd:
+            dump_pyramid(fd, build_pyramid(processes, processes['root']))
+
+    table = None
+
+    if args.tokens:
+        table = TokenTable()
+        properties['tokens'] = True
+
+    if args.details:
+        with open(args.output.name + '.details', 'wb') as fd:
+            writer = DetailsWriter(fd)
+            properties['details'] = True
+            dump(args.output, split_details(processes, writer,
+                                            json_encoder()),
+                 properties, args.output_format, table)
+            writer.finish()
+    else:
+        dump(args.output, processes, properties, args.output_format, table)
+
+    # After the output, so the properties include the summary of ``dump``.
+    if args.sqlite:
+        dump_database(args.output.name + '.sqlite', processes, properties)
+
+    if args.analyze:
+        print_report(stderr, analyze(processes, processes['root']))
+
+    if args.simulate:
+        simulate.print_report(stderr, simulate.simulate_levels(processes,
+                processes['root'], args.simulate, args.policy))
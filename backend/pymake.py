@@ -0,0 +1,152 @@
+"""
+Construct a build order diagram from a PyMake build, without tracing the
+build. The log file is written by ``pymake_bsa.py``, which runs PyMake with
+hooks in its job execution. Each line of the log is a JSON object with an
+``event`` and the ``time`` of the event (seconds since the epoch):
+
+``make``
+  A Makefile is loaded by a (recursive) PyMake process. Contains the ``id`` of
+  the make, the ``parent`` job that runs it (``null`` for the master make) and
+  its working directory ``cwd``.
+
+``start``
+  A command of a recipe is started. Contains the ``id`` of the job, the
+  ``make`` it belongs to, the ``target`` and its ``prerequisites``, the
+  ``command`` line and its ``location`` in the Makefile.
+
+``end``
+  A job has finished. Contains the ``id`` of the job and its exit ``status``.
+
+The makes and jobs are converted into the same processes as the strace
+backend. Jobs additionally have a ``target``, its ``prerequisites`` and the
+``dependencies``: the pids of the jobs of the same make that build these
+prerequisites.
+"""
+
+from sys import exit, stderr
+
+import simplejson as json
+
+from backend.common import Syscall, command_type, write_output
+
+
+def parse_pymake_log(fd):
+    """
+    Convert a PyMake log file into processes. Pids are assigned to the makes
+    and jobs in order of their first event.
+    """
+    makes = {}
+    jobs = {}
+    pids = {}
+    zero_time = None
+    last_time = 0
+
+    for line in fd:
+        event = json.loads(line)
+        time = event['time']
+
+        if zero_time is None:
+            zero_time = time
+
+        time = int((time - zero_time) * 1000)
+        last_time = max(last_time, time)
+
+        if event['event'] == 'make':
+            makes[event['id']] = event
+        elif event['event'] == 'start':
+            jobs[event['id']] = event
+        elif event['event'] == 'end':
+            jobs[event['id']]['end'] = time
+            jobs[event['id']]['status'] = event.get('status', 0)
+            continue
+
+        event['start'] = time
+        pids[event['id']] = len(pids) + 1
+
+    if not makes:
+        raise ValueError('The log does not contain any make.')
+
+    root = min(makes.itervalues(), key=lambda m: m['start'])['id']
+    processes = {}
+
+    for job_id, job in jobs.iteritems():
+        syscall = Syscall(job['start'], job['command'])
+        syscall.end = job.get('end', last_time)
+        syscall.duration = syscall.end - syscall.start
+
+        processes[pids[job_id]] = {
+            'type': command_type(job['command']),
+            'parent': pids[job['make']], 'syscalls': [syscall],
+            'start': syscall.start, 'end': syscall.end,
+            'duration': syscall.duration, 'children': [],
+            'target': job.get('target'),
+            'prerequisites': job.get('prerequisites', []),
+            'location': job.get('location')}
+
+    for make_id, make in makes.iteritems():
+        if make_id == root:
+            parent = 0
+        elif make.get('parent') in jobs:
+            parent = pids[make['parent']]
+        else:
+            parent = pids[root]
+
+        processes[pids[make_id]] = {
+            'type': 'make', 'parent': parent,
+            'syscalls': [Syscall(make['start'], 'pymake -C %s' % make['cwd'])],
+            'start': make['start'], 'end': make['start'], 'children': []}
+
+    for pid, process in processes.iteritems():
+        if process['parent']:
+            processes[process['parent']]['children'].append(pid)
+
+    # Makes end with the last of their jobs. Walk the process tree in
+    # post-order, so the children of a make are done before it.
+    order = []
+    stack = [pids[root]]
+
+    while stack:
+        pid = stack.pop()
+        order.append(pid)
+        stack.extend(processes[pid]['children'])
+
+    for pid in reversed(order):
+        process = processes[pid]
+
+        for c in process['children']:
+            process['end'] = max(process['end'], processes[c]['end'])
+
+        if process['type'] == 'make':
+            process['duration'] = process['end'] - process['start']
+            process['syscalls'][0].end = process['end']
+            process['syscalls'][0].duration = process['duration']
+
+    # Dependency edges between the jobs of the same make.
+    targets = {}
+
+    for pid, process in processes.iteritems():
+        if process.get('target') is not None:
+            targets.setdefault((process['parent'], process['target']),
+                               []).append(pid)
+
+    for pid, process in processes.iteritems():
+        process['children'].sort(key=lambda c: processes[c]['start'])
+
+        if 'target' in process:
+            process['dependencies'] = sorted(
+                    d for name in process['prerequisites']
+                    for d in targets.get((process['parent'], name), ()))
+
+    processes['root'] = pids[root]
+
+    return processes
+
+
+def main(args):
+    if args.follow or args.jobs > 1:
+        print >>stderr, 'Follow mode and -j are not supported for PyMake logs.'
+        exit(1)
+
+    properties = {'threshold': args.threshold}
+    processes = parse_pymake_log(args.input)
+    write_output(args, processes, properties)
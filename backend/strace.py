@@ -4,159 +4,613 @@ Construct a build order diagram from a Make build system. In order to get all
 required information (start time, end time, arguments) about the invoked sub
 processes, strace is used.
 
-To use this utility, a filtered strace log file of Make is required:
+To use this utility, a strace log file of Make is required:
 
-  strace -ftts 1024 make -Bsj12 2>&1|egrep exit_group\|vfork\|execve > make.log
-  cat make.log | ./build_order.py > static/data/strace.json
+  strace -ftts 1024 -o make.log make -Bsj12
+  ./convert.py -o static/data/strace.json make.log
 
+The log does not have to be filtered: lines of other syscalls are dropped by
+``relevant`` before they are parsed. The times of the lines are either times
+of day (``-tt``) or Unix times (``-ttt``). A time of day does not contain the
+date, so a time that is more than half a day before the previous one is taken
+to be on the next day.
+
+Logs of the same build from several hosts (e.g. with distributed compile jobs)
+are combined with ``merge``.
 """
 
-# TODO: strace does not output the date (only the time), so strace logs
-# containing time string from two or more days will result in garbage.
+from itertools import ifilter, imap
+from multiprocessing import Pool
+from os.path import getsize
+import re
+from sys import stderr
+from time import sleep, time
+
+from backend.common import Syscall, JSONSyscallEncoder, dump_json, dump, \
+        write_output, write_snapshot
+from checkpoint import load_checkpoint, complete_size
+from merge import DAY, merge_hosts
+
+# The output functions are defined in backend.common. They are exported here
+# as well for callers that import them from this module, where they used to be.
+__all__ = [
+    'Syscall', 'JSONSyscallEncoder', 'dump_json', 'dump', 'ptime',
+    'CHUNK_SIZE', 'EXECVE', 'EXIT_GROUP', 'FORK', 'WAIT', 'THREAD', 'OTHER',
+    'RUSAGE_TIMES', 'RUSAGE_COUNTS', 'relevant', 'filter_lines', 'parse_line',
+    'parse_rusage', 'ProcessState', 'StraceParser', 'iter_processes',
+    'iter_strace_processes', 'parse_chunk', 'iter_chunk_events',
+    'iter_strace_processes_parallel', 'iter_checkpoint_processes', 'parse_log',
+    'parse_strace_output', 'parse_syscall_type', 'follow_lines', 'follow',
+    'main',
+]
 
-import simplejson as json
 
+def ptime(x):
+    """
+    Convert an ISO time string (of ``strace -tt``) or a Unix time (of ``strace
+    -ttt``) into milliseconds.
+    
+    >>> ptime('16:09:18.502932')
+    58158502
+    >>> ptime('1697040000.123456')
+    1697040000123
+    """
+    if x[2:3] == ':':
+        h, m, s, micro = int(x[0:2]), int(x[3:5]), int(x[6:8]), int(x[9:15])
+        return (micro / 1000) + 1000 * (s + 60 * (m + 60 * h))
 
-class Syscall(object):
-    def __init__(self, start_time, cmd):
-        self.cmd = cmd
-        self.duration = 0
-        self.end = 0
-        self.start = start_time
-        self.children = []
+    s, _, micro = x.partition('.')
+    return int(micro[:6].ljust(6, '0')) / 1000 + 1000 * int(s)
 
-    def __repr__(self):
-        return self.__str__()
 
-    def __str__(self):
-        return str(self.to_dict())
+# Number of bytes of the log file that are parsed at once by a worker process.
+CHUNK_SIZE = 8 << 20
 
-    def to_dict(self):
-        return {'cmd': self.cmd, 'duration': self.duration,
-                'start': self.start, 'end': self.end}
+# Kinds of events in a strace log, see ``parse_line``.
+EXECVE, EXIT_GROUP, FORK, WAIT, THREAD, OTHER = range(6)
 
+# Resource usage of a reaped child in the result of ``wait4``. Newer versions
+# of strace print the time values as ``{tv_sec=0, tv_usec=1999}``, older ones
+# as ``{0, 1999}``. The other fields are only printed if wait4 is not
+# abbreviated (e.g. with ``-e abbrev='!wait4'`` or ``-v``).
+RUSAGE_TIMES = re.compile(r'ru_(utime|stime)=\{(?:tv_sec=)?(\d+), '
+                          r'(?:tv_usec=)?(\d+)\}')
+RUSAGE_COUNTS = re.compile(r'ru_(maxrss|nvcsw|nivcsw)=(\d+)')
 
-class JSONSyscallEncoder(json.JSONEncoder):
 
-    def default(self, syscall):
-        if isinstance(syscall, Syscall):
-            return syscall.to_dict()
-        return json.JSONEncoder.default(self, syscall)
+def relevant(line):
+    """
+    Return whether a line of a raw strace log may contain an event of
+    ``parse_line`` other than ``OTHER``. This is a substring test on the raw
+    line, which is much cheaper than parsing it, and is equivalent to ``egrep
+    'execve|exit_group|vfork|clone|wait4'``, except that clones of threads are
+    dropped as well. The first half of a thread clone that is split in two
+    lines is kept, since its second half (``<... clone resumed>``) does not
+    show the flags and is only recognized by the parser after the first one.
+    This is the only definition of the test; ``filter_lines`` and
+    ``parse_chunk`` call it for every line.
+
+    >>> relevant('1 10:00:00.000000 clone(flags=CLONE_VM|CLONE_THREAD) = 2')
+    False
+    >>> relevant('1 10:00:00.000000 clone(flags=CLONE_VM|CLONE_THREAD'
+    ...          ' <unfinished ...>')
+    True
+    """
+    return 'execve' in line or 'exit_group' in line or 'vfork' in line \
+            or 'wait4' in line or ('clone' in line
+                and ('CLONE_THREAD' not in line or '<unfinished' in line))
 
-def ptime(x):
+
+def filter_lines(lines):
     """
-    Convert an ISO time string into milliseconds.
-    
-    >>> ptime('16:09:18.502932')
-    332
+    Generate the lines of a raw strace log that are ``relevant``.
     """
-    h, m, s, micro = int(x[0:2]), int(x[3:5]), int(x[6:8]), int(x[9:15])
-    return (micro / 1000) + 1000 * (s + 60 * (m + 60 * h))
+    return ifilter(relevant, lines)
 
 
-def parse_strace_output(fd, duration_threshold):
+def parse_line(line):
     """
-    Transform the strace log file into processes and a timeline. Processes are
-    returned as a dictionary, which maps pids to their corresponding process
-    structure. The timeline is a list of pids, sorted by start time of the
-    process.
+    Split a line of a filtered strace log into a ``(pid, time, kind, value)``
+    event. The time is the absolute time of the line in milliseconds. The
+    value is the child pid for ``FORK`` events, a ``(child pid, rusage)`` pair
+    for ``WAIT`` events (see ``parse_rusage``, the pid is 0 if no child was
+    reaped) and the system call for the other kinds of events. A ``THREAD``
+    event is the first half of a thread clone that is split in two lines, see
+    ``relevant``. Thread clones on a single line are ``OTHER`` events.
+    """
+    pid, time_string, cmd = line.split(None, 2)
+    pid = int(pid)
+    cmd = cmd.strip()
 
-    The lines of the given file descriptor should contain the process id, a
-    space, the absolute start time (format in ``%H:%M:%S.%f``) of the event,
-    followed by a space and the complete ``execve`` system call.
+    try:
+        cur_time = ptime(time_string)
+    except ValueError:
+        print >>stderr, 'line = ', line
+        raise
+
+    if cmd.startswith('execve') or cmd.startswith('<... execve resumed>'):
+        return pid, cur_time, EXECVE, cmd
+
+    if cmd.startswith('exit_group'):
+        return pid, cur_time, EXIT_GROUP, cmd
+
+    if cmd.startswith('vfork') or cmd.startswith('<... vfork resumed>') \
+            or cmd.startswith('clone') \
+            or cmd.startswith('<... clone resumed>'):
+
+        # Make sure the vfork call is not unfinished.
+        if '<unfinished ...>' in cmd:
+            if 'CLONE_THREAD' in cmd:
+                return pid, cur_time, THREAD, cmd
+
+            return pid, cur_time, OTHER, cmd
+
+        if 'CLONE_THREAD' in cmd:
+            return pid, cur_time, OTHER, cmd
+
+        # FIXME: what to do with these ERESTARTNOINTR kernel signals?
+        if ' ERESTARTNOINTR ' in cmd:
+            return pid, cur_time, OTHER, cmd
+
+        pos = cmd.find(' = ')
+        assert pos > -1
+        return pid, cur_time, FORK, int(cmd[pos+3:])
+
+    if cmd.startswith('wait4') or cmd.startswith('<... wait4 resumed>'):
+        pos = cmd.rfind(' = ')
+
+        # Unfinished, failed and WNOHANG calls do not reap a child.
+        if '<unfinished ...>' in cmd or pos == -1:
+            return pid, cur_time, WAIT, (0, None)
+
+        result = cmd[pos+3:].split(None, 1)[0]
+
+        if not result.isdigit():
+            return pid, cur_time, WAIT, (0, None)
+
+        return pid, cur_time, WAIT, (int(result), parse_rusage(cmd))
+
+    return pid, cur_time, OTHER, cmd
+
+
+def parse_rusage(cmd):
     """
-    # Convert threshold in seconds to milliseconds.
-    duration_threshold = duration_threshold * 1000
+    Return the resource usage in a ``wait4`` system call as a dictionary with
+    the user and system CPU time (``utime`` and ``stime``, in milliseconds),
+    the maximum resident set size (``maxrss``, in KiB) and the number of
+    voluntary and involuntary context switches (``nvcsw`` and ``nivcsw``), as
+    far as they are printed. Returns ``None`` if the call did not request the
+    resource usage.
+    """
+    rusage = {}
 
-    syscalls = {}
-    parents = {}
-    zero_time = 0
-    zero_pid = 0
+    for field, sec, usec in RUSAGE_TIMES.findall(cmd):
+        rusage[field] = int(sec) * 1000 + int(usec) // 1000
 
-    for line in fd:
-        pid, time_string, cmd = line.split(None, 2)
-        pid = int(pid)
-        cmd = cmd.strip()
+    for field, value in RUSAGE_COUNTS.findall(cmd):
+        rusage[field] = int(value)
 
-        try:
-            cur_time = ptime(time_string) - zero_time
-        except ValueError:
-            print 'line = ', line
-            raise
-        
+    return rusage or None
+
+
+class ProcessState(object):
+    """
+    Parser state of a single process that has not been emitted yet. The state
+    is dropped as soon as the process has exited and its parent is known (and
+    it has been reaped, see ``StraceParser``).
+    """
+    __slots__ = ('syscalls', 'children', 'parent', 'exited', 'reaped',
+                 'rusage')
+
+    def __init__(self):
+        self.syscalls = []
+        self.children = []
+        self.parent = None
+        self.exited = False
+        self.reaped = False
+        self.rusage = None
+
+
+class StraceParser(object):
+    """
+    Incremental parser of a filtered strace log. Lines are fed one at a time
+    using ``feed`` (or as events produced by ``parse_line`` using
+    ``feed_event``), which returns the ``(pid, process)`` pairs of the
+    processes that are completed by that line. A process is completed when its
+    ``exit_group`` is seen and its parent (``vfork`` or ``clone`` result) is
+    known. Only the state of running processes is kept in memory.
+
+    Times are relative to the first line (``zero_time``). ``day`` is the
+    number of milliseconds that is added to the times of day after midnight.
+    ``threads`` holds the pids whose last clone was an unfinished thread
+    clone, so its resumed half does not create a process.
+
+    The resource usage of a process is only known when it is reaped by a
+    ``wait4`` call (if the call requests it). Hence, once a ``wait4`` call has
+    been seen (i.e. the log is not filtered to the syscalls above), processes
+    are only completed when they have been reaped as well. Make blocks in
+    ``wait4`` before its first job exits, so this is known in time.
+    """
+
+    def __init__(self):
+        self.states = {}
+        self.zero_time = 0
+        self.zero_pid = 0
+        self.cur_time = 0
+        self.day = 0
+        self.reaping = False
+        self.threads = set()
+
+    def state(self, pid):
+        state = self.states.get(pid)
+
+        if state is None:
+            state = self.states[pid] = ProcessState()
+
+        return state
+
+    def feed(self, line):
+        return self.feed_event(*parse_line(line))
+
+    def feed_event(self, pid, cur_time, kind, value):
         # First line is the master Make process, which defines the zero time.
-        if zero_time == 0:
-            zero_time = cur_time
-            zero_pid = pid
-            syscall = Syscall(0, cmd)
-            syscalls[pid] = [syscall]
-            continue
+        if self.zero_time == 0:
+            assert kind == EXECVE
+            self.zero_time = cur_time
+            self.zero_pid = pid
+            self.state(pid).syscalls.append(Syscall(0, value))
+            return []
+
+        cur_time += self.day - self.zero_time
+
+        if cur_time + DAY / 2 < self.cur_time:
+            self.day += DAY
+            cur_time += DAY
+
+        self.cur_time = cur_time
+
+        # A thread runs one syscall at a time, so the next event of a thread
+        # that started a thread clone is the end of that clone.
+        if pid in self.threads and kind != THREAD:
+            self.threads.discard(pid)
+
+            if kind == FORK:
+                return []
 
         # Execute a syscall in the current process (save its start time).
-        if cmd.startswith('execve') or cmd.startswith('<... execve resumed>'):
-            syscall = Syscall(cur_time, cmd)
-            if pid not in syscalls:
-                syscalls[pid] = []
-            syscalls[pid].append(syscall)
+        if kind == EXECVE:
+            state = self.state(pid)
+            # Children are attributed to the last execve of their parent.
+            assert not state.children
+            state.syscalls.append(Syscall(cur_time, value))
         # A syscall is finished, calculate its duration (using end time).
-        elif cmd.startswith('exit_group'):
-            syscall = syscalls[pid][-1]
+        elif kind == EXIT_GROUP:
+            state = self.states[pid]
+            syscall = state.syscalls[-1]
             assert syscall.duration == 0
             syscall.end = cur_time
             syscall.duration = cur_time - syscall.start
-        elif cmd.startswith('vfork') or cmd.startswith('<... vfork resumed>') \
-                or cmd.startswith('clone') \
-                or cmd.startswith('<... clone resumed>'):
-            
-            # Make sure the vfork call is not unfinished.
-            if '<unfinished ...>' in cmd:
-                continue
-        
-            # FIXME: what to do with these ERESTARTNOINTR kernel signals?
-            if ' ERESTARTNOINTR ' in cmd:
-                continue
-
-            pos = cmd.find(' = ')
-            assert pos > -1
-            child_pid = int(cmd[pos+3:])
-            parents[child_pid] = pid
-            syscalls[pid][-1].children.append(child_pid)
-
-    processes = {}
-
-    for pid, calls in syscalls.iteritems():
+            state.exited = True
+            return self.complete(pid)
+        elif kind == THREAD:
+            self.threads.add(pid)
+        elif kind == FORK:
+            child_pid = value
+            state = self.states[pid]
+            assert state.syscalls
+            state.children.append(child_pid)
+            self.state(child_pid).parent = pid
+            return self.complete(child_pid)
+        elif kind == WAIT:
+            child_pid, rusage = value
+            self.reaping = True
+            state = self.states.get(child_pid)
+
+            if state is None:
+                return []
+
+            state.reaped = True
+            state.rusage = rusage
+            return self.complete(child_pid)
+
+        return []
+
+    def complete(self, pid):
+        """
+        Emit the process ``pid`` if it has exited and its parent is known.
+        """
+        state = self.states[pid]
+
+        if not state.exited or (state.parent is None and pid != self.zero_pid) \
+                or (self.reaping and not state.reaped
+                    and pid != self.zero_pid):
+            return []
+
+        del self.states[pid]
+        return [(pid, self.build_process(pid, state))]
+
+    def build_process(self, pid, state):
+        calls = state.syscalls
         process_type = parse_syscall_type(calls)
 
-        if pid == zero_pid:
+        if pid == self.zero_pid:
             parent = 0
         else:
-            parent = parents[pid]
+            parent = state.parent
 
         start = calls[0].start
         end = calls[-1].end
         duration = end - start
 
         try:
-            assert not any(c.children for c in calls[:-1])
-            assert parent > 0 or pid == zero_pid
-            assert start > 0 or pid == zero_pid
+            assert parent > 0 or pid == self.zero_pid
+            assert start > 0 or pid == self.zero_pid
             assert end > 0
             assert duration > 0
         except AssertionError:
-            print pid, len(calls)
-            print calls
+            print >>stderr, pid, len(calls)
+            print >>stderr, calls
             raise
 
-        #if duration < duration_threshold:
-        #   continue
+        process = {'type': process_type, 'parent': parent, 'syscalls': calls,
+                   'start': start, 'end': end, 'duration': duration,
+                   'children': state.children}
+
+        if state.rusage:
+            process['rusage'] = state.rusage
+
+        return process
+
+    def finish(self):
+        """
+        Emit the processes that are still pending at the end of the log. This
+        raises an ``AssertionError`` for processes that did not exit. States
+        without syscalls (e.g. of a child whose ``execve`` is not in the log)
+        are dropped, since they are not processes of the build.
+        """
+        pending = self.states
+        self.states = {}
+
+        for pid in sorted(pending):
+            if pending[pid].syscalls:
+                yield pid, self.build_process(pid, pending[pid])
+
+    def running(self):
+        """
+        Generate ``(pid, process)`` pairs of the processes that are not
+        completed yet. Their end time is the time of the last parsed line and
+        they are marked as ``running``. Processes that did not execute a
+        syscall yet or whose parent is unknown are skipped.
+        """
+        for pid, state in self.states.iteritems():
+            if not state.syscalls:
+                continue
+
+            if pid == self.zero_pid:
+                parent = 0
+            elif state.parent is None:
+                continue
+            else:
+                parent = state.parent
+
+            start = state.syscalls[0].start
+            end = state.syscalls[-1].end or self.cur_time
+
+            process = {'type': parse_syscall_type(state.syscalls),
+                       'parent': parent, 'syscalls': state.syscalls,
+                       'start': start, 'end': end, 'duration': end - start,
+                       'children': state.children,
+                       'running': not state.exited}
+
+            if state.rusage:
+                process['rusage'] = state.rusage
+
+            yield pid, process
+
+
+def iter_processes(events, parser=None):
+    """
+    Generate ``(pid, process)`` pairs from a stream of events (see
+    ``parse_line``), in the order in which the processes are completed. The
+    last pair is ``('root', zero_pid)``. The events are fed to ``parser`` (a
+    new ``StraceParser`` by default).
+
+    The result of a clone that was interrupted (``<unfinished ...>``) is on a
+    separate ``<... clone resumed>`` line, which does not show the flags of
+    the clone. The resumed half of a thread clone does not create a process:
+
+    >>> log = ['100 10:00:00.000000 execve("/usr/bin/make", ["make"],'
+    ...        ' 0x7ffc /* 20 vars */) = 0',
+    ...        '100 10:00:00.100000 clone(child_stack=0x7f12,'
+    ...        ' flags=CLONE_VM|CLONE_FS|CLONE_FILES|CLONE_SIGHAND'
+    ...        '|CLONE_THREAD|CLONE_SYSVSEM <unfinished ...>',
+    ...        '100 10:00:00.100100 <... clone resumed>) = 101',
+    ...        '100 10:00:00.200000 exit_group(0) = ?']
+    >>> [pid for pid, process in iter_strace_processes(log)]
+    [100, 'root']
+    >>> [(pid, kind) for pid, t, kind, value in
+    ...  imap(parse_line, filter_lines(log))] == [(100, EXECVE),
+    ...     (100, THREAD), (100, FORK), (100, EXIT_GROUP)]
+    True
+    >>> parser = StraceParser()
+    >>> for event in imap(parse_line, filter_lines(log[:3])):
+    ...     parser.feed_event(*event)
+    []
+    []
+    []
+    >>> sorted(parser.states), parser.states[100].children
+    ([100], [])
+    """
+    if parser is None:
+        parser = StraceParser()
+
+    for event in events:
+        for item in parser.feed_event(*event):
+            yield item
 
-        processes[pid] = {'type': process_type, 'parent': parent, 
-                'syscalls': calls, 'start': start, 'end': end, 
-                'duration': duration, 'children': calls[-1].children}
+    for item in parser.finish():
+        yield item
 
-    processes['root'] = zero_pid
+    yield 'root', parser.zero_pid
 
-    return processes
+
+def iter_strace_processes(fd):
+    """
+    Generate ``(pid, process)`` pairs from a filtered strace log file, in the
+    order in which the processes are completed. The last pair is ``('root',
+    zero_pid)``, so ``dict(iter_strace_processes(fd))`` is equivalent to the
+    result of ``parse_strace_output``.
+    """
+    return iter_processes(imap(parse_line, filter_lines(fd)))
+
+
+def parse_chunk(chunk):
+    """
+    Parse the lines of a log file that start in the byte range ``[start,
+    end)`` into events. Events that do not change the parser state are
+    dropped. This is executed by the worker processes of
+    ``iter_strace_processes_parallel``.
+    """
+    path, start, end = chunk
+    events = []
+    is_relevant = relevant
+
+    with open(path, 'rb') as fd:
+        # Skip the line that started in the previous chunk.
+        if start:
+            fd.seek(start - 1)
+            fd.readline()
+
+        pos = fd.tell()
+
+        for line in fd:
+            if pos >= end:
+                break
+
+            pos += len(line)
+
+            if is_relevant(line):
+                event = parse_line(line)
+
+                if event[2] != OTHER:
+                    events.append(event)
+
+    return events
+
+
+def iter_chunk_events(path, jobs, chunk_size=CHUNK_SIZE, offset=0,
+                      size=None):
+    """
+    Generate the events of the log file at ``path``, which is split into
+    chunks of ``chunk_size`` bytes that are parsed by a pool of ``jobs``
+    worker processes (or by this process if ``jobs`` is 1). The events are
+    generated in the order of the log file. Only the lines in the byte range
+    ``[offset, size)`` are parsed, by default the whole file.
+    """
+    if size is None:
+        size = getsize(path)
+
+    chunk_size = max(1, min(chunk_size, (size - offset) // jobs + 1))
+    chunks = [(path, start, min(start + chunk_size, size))
+              for start in xrange(offset, size, chunk_size)]
+
+    if jobs == 1:
+        for events in imap(parse_chunk, chunks):
+            for event in events:
+                yield event
+
+        return
+
+    pool = Pool(jobs)
+
+    try:
+        for events in pool.imap(parse_chunk, chunks):
+            for event in events:
+                yield event
+    finally:
+        pool.terminate()
+
+
+def iter_strace_processes_parallel(path, jobs, chunk_size=CHUNK_SIZE):
+    """
+    Parallel version of ``iter_strace_processes`` for the log file at
+    ``path``. The lines are parsed by ``jobs`` worker processes, and the
+    resulting events are merged in log order into a single parser. Hence,
+    ``<unfinished ...>`` and ``resumed`` pairs and parent links that cross
+    chunk boundaries result in the same processes as the serial parser.
+    """
+    return iter_processes(iter_chunk_events(path, jobs, chunk_size))
+
+
+def iter_checkpoint_processes(path, jobs=1):
+    """
+    Version of ``iter_strace_processes`` for the log file at ``path`` that
+    uses the checkpoint of the log (see ``checkpoint``). If the log has not
+    changed since the checkpoint was written, the processes of the checkpoint
+    are generated without parsing the log. If lines have been appended, only
+    those lines are parsed (by ``jobs`` worker processes) and the checkpoint
+    is replaced. An incomplete last line is not parsed.
+
+    If the master Make process has not exited yet (the log is still being
+    written), the processes that did not complete are generated as in follow
+    mode (see ``StraceParser.running``), ending at the last parsed line.
+    """
+    checkpoint = load_checkpoint(path, StraceParser())
+    parser, finished = checkpoint.parser, checkpoint.finished
+    size = complete_size(path)
+
+    if size > checkpoint.offset:
+        for event in iter_chunk_events(path, jobs, offset=checkpoint.offset,
+                                       size=size):
+            finished.extend(parser.feed_event(*event))
+
+        checkpoint.save(size)
+
+    for item in finished:
+        yield item
+
+    master = parser.states.get(parser.zero_pid)
+
+    if master is not None and not master.exited:
+        pending = parser.running()
+    else:
+        pending = parser.finish()
+
+    for item in pending:
+        yield item
+
+    yield 'root', parser.zero_pid
+
+
+def parse_log(fd, jobs=1):
+    """
+    Parse a strace log file into a dictionary of processes, as
+    ``parse_strace_output``, and return it with the absolute time of the first
+    line of the log (see ``ptime``). The lines are parsed by ``jobs`` worker
+    processes if ``fd`` is an uncompressed file.
+    """
+    parser = StraceParser()
+
+    if jobs > 1 and isinstance(fd, file):
+        events = iter_chunk_events(fd.name, jobs)
+    else:
+        events = imap(parse_line, filter_lines(fd))
+
+    return dict(iter_processes(events, parser)), parser.zero_time
+
+
+def parse_strace_output(fd, duration_threshold):
+    """
+    Transform the strace log file into processes and a timeline. Processes are
+    returned as a dictionary, which maps pids to their corresponding process
+    structure. The timeline is a list of pids, sorted by start time of the
+    process.
+
+    The lines of the given file descriptor should contain the process id, a
+    space, the absolute start time (format in ``%H:%M:%S.%f``) of the event,
+    followed by a space and the complete ``execve`` system call.
+    """
+    return dict(iter_strace_processes(fd))
 
 
 def parse_syscall_type(syscalls):
@@ -190,13 +644,86 @@ def parse_syscall_type(syscalls):
     return syscall_type
 
 
-def dump_json(fd, processes, properties):
-    obj = {'version': 100, 'processes': processes, 'properties': properties}
-    json = JSONSyscallEncoder().encode(obj)
-    print >>fd, json
+def follow_lines(fd, poll_interval=0.25):
+    """
+    Generate the lines of a growing log file, like ``tail -f``. Incomplete
+    lines are not returned until they are completed. When no new line is
+    available, ``None`` is generated before waiting ``poll_interval`` seconds.
+    """
+    while True:
+        where = fd.tell()
+        line = fd.readline()
+
+        if line.endswith('\n'):
+            yield line
+            continue
+
+        # Rewind to the start of the incomplete line (this also resets the
+        # end of file state of the file object).
+        fd.seek(where)
+        yield None
+        sleep(poll_interval)
+
+
+def follow(args):
+    """
+    Follow a strace log file that is still being written and periodically
+    write a snapshot of the process tree to the output file. The snapshot
+    contains the completed processes and the processes that are still
+    running. Following stops when the master Make process has exited.
+    """
+    path = args.output.name
+    args.output.close()
+
+    parser = StraceParser()
+    finished = {}
+    last_snapshot = 0
+    properties = {'threshold': args.threshold, 'live': True,
+                  'interval': args.interval}
+
+    def snapshot():
+        processes = finished.items() + list(parser.running())
+        processes.append(('root', parser.zero_pid))
+        write_snapshot(path, processes, properties, args.output_format)
+
+    try:
+        for line in follow_lines(args.input):
+            if line is not None and relevant(line):
+                for pid, process in parser.feed(line):
+                    finished[pid] = process
+
+                if parser.zero_pid in finished:
+                    break
+
+            if parser.zero_time and time() - last_snapshot >= args.interval:
+                snapshot()
+                last_snapshot = time()
+    except KeyboardInterrupt:
+        pass
+
+    properties['live'] = False
+    snapshot()
 
 
 def main(args):
+    if args.follow:
+        return follow(args)
+
     properties = {'threshold': args.threshold}
-    processes = parse_strace_output(args.input, args.threshold)
-    dump_json(args.output, processes, properties)
+
+    if args.merge:
+        processes, zero_time = parse_log(args.input, args.jobs)
+        remotes = []
+
+        for host, fd in args.merge:
+            remotes.append((host,) + parse_log(fd, args.jobs))
+
+        merge_hosts(processes, zero_time, args.host, remotes, properties)
+    elif args.checkpoint:
+        processes = iter_checkpoint_processes(args.input.name, args.jobs)
+    elif args.jobs > 1:
+        processes = iter_strace_processes_parallel(args.input.name, args.jobs)
+    else:
+        processes = iter_strace_processes(args.input)
+
+    write_output(args, processes, properties)
@@ -0,0 +1,161 @@
+"""
+Construct a build order diagram from the trace file of ``bsa-shell``, the shell
+wrapper that Make runs every command of a recipe with (see ``wrapper.sh``).
+Unlike strace, the wrapper does not stop the build for every system call: it
+only appends one record per command to the trace file.
+
+Each record consists of a header with the following little-endian fields,
+followed by the NUL terminated arguments of the shell:
+
+========  ======  ===========================================================
+Field     Type    Description
+========  ======  ===========================================================
+pid       uint32  Pid of the wrapper.
+ppid      uint32  Pid of the Make process that runs the command.
+parent    uint32  Pid of the wrapper that runs this Make process (0 for the
+                  master Make process).
+status    int32   Exit status of the command.
+start     uint64  Start time of the command (monotonic clock, nanoseconds).
+end       uint64  End time of the command.
+utime     uint64  User CPU time of the command in microseconds.
+stime     uint64  System CPU time of the command in microseconds.
+maxrss    uint32  Maximum resident set size of the command in KiB.
+nvcsw     uint32  Number of voluntary context switches of the command.
+nivcsw    uint32  Number of involuntary context switches of the command.
+argc      uint32  Number of arguments.
+size      uint32  Size of the arguments in bytes.
+========  ======  ===========================================================
+
+The resource usage is that of ``wait4``, so it includes the processes that the
+command waited for (e.g. the compiler run by ``sh -c``). The wrapped commands
+become processes of the type of the command they run.
+The Make processes are derived from the ``ppid`` and ``parent`` fields; they
+start with their first command and end with their last one.
+"""
+
+import struct
+from sys import exit, stderr
+
+from backend.common import Syscall, command_type, write_output
+
+RECORD = struct.Struct('<IIIiQQQQIIIII')
+
+READ_SIZE = 1 << 20
+
+
+def iter_records(fd):
+    """
+    Generate ``(pid, ppid, parent, status, start, end, rusage, argv)`` tuples
+    of the records in a trace file, where ``rusage`` is a dictionary as in
+    ``backend.strace.parse_rusage``. A truncated record at the end of the file
+    (e.g. of an interrupted build) is ignored.
+    """
+    buf = ''
+    pos = 0
+
+    while True:
+        data = fd.read(READ_SIZE)
+
+        if not data:
+            break
+
+        buf = buf[pos:] + data
+        pos = 0
+
+        while pos + RECORD.size <= len(buf):
+            pid, ppid, parent, status, start, end, utime, stime, maxrss, \
+                    nvcsw, nivcsw, argc, size = RECORD.unpack_from(buf, pos)
+            args_end = pos + RECORD.size + size
+
+            if args_end > len(buf):
+                break
+
+            argv = buf[pos + RECORD.size:args_end - 1].split('\0')
+            rusage = {'utime': utime // 1000, 'stime': stime // 1000,
+                      'maxrss': maxrss, 'nvcsw': nvcsw, 'nivcsw': nivcsw}
+            yield pid, ppid, parent, status, start, end, rusage, argv[:argc]
+            pos = args_end
+
+
+def shell_command(argv):
+    """
+    Return the command that is run by the shell, i.e. the argument of its
+    ``-c`` option, or the whole command line otherwise.
+    """
+    if len(argv) > 2 and argv[1].startswith('-') and 'c' in argv[1]:
+        return argv[2]
+
+    return ' '.join(argv)
+
+
+def parse_wrapper_output(fd):
+    """
+    Convert a trace file into processes.
+    """
+    records = list(iter_records(fd))
+
+    if not records:
+        raise ValueError('The trace file does not contain any record.')
+
+    zero_time = min(r[4] for r in records)
+    processes = {}
+    makes = {}
+
+    for pid, ppid, parent, status, start, end, rusage, argv in records:
+        cmd = shell_command(argv)
+        syscall = Syscall((start - zero_time) // 1000000, cmd)
+        syscall.end = (end - zero_time) // 1000000
+        syscall.duration = syscall.end - syscall.start
+
+        processes[pid] = {'type': command_type(cmd), 'parent': ppid,
+                          'syscalls': [syscall], 'start': syscall.start,
+                          'end': syscall.end, 'duration': syscall.duration,
+                          'children': [], 'rusage': rusage}
+        makes.setdefault(ppid, (parent, []))[1].append(pid)
+
+    for pid, (parent, jobs) in makes.iteritems():
+        start = min(processes[c]['start'] for c in jobs)
+        end = max(processes[c]['end'] for c in jobs)
+        cmd = processes[parent]['syscalls'][0].cmd if parent in processes \
+                else 'make'
+        syscall = Syscall(start, cmd)
+        syscall.end = end
+        syscall.duration = end - start
+
+        processes[pid] = {'type': 'make',
+                          'parent': parent if parent in processes else 0,
+                          'syscalls': [syscall], 'start': start, 'end': end,
+                          'duration': end - start, 'children': jobs}
+
+    # The master Make process is the first one without a parent. Others (e.g.
+    # of a wrapper that was not run by a recorded command) are put in it.
+    roots = sorted((processes[pid]['start'], pid) for pid in makes
+                   if not processes[pid]['parent'])
+    root = roots[0][1]
+
+    for pid in makes:
+        parent = processes[pid]['parent']
+
+        if parent:
+            processes[parent]['children'].append(pid)
+        elif pid != root:
+            processes[pid]['parent'] = root
+            processes[root]['children'].append(pid)
+
+    for process in processes.itervalues():
+        process['children'].sort(key=lambda c: processes[c]['start'])
+
+    processes['root'] = root
+
+    return processes
+
+
+def main(args):
+    if args.follow or args.jobs > 1:
+        print >>stderr, 'Follow mode and -j are not supported for wrapper' \
+                ' traces.'
+        exit(1)
+
+    properties = {'threshold': args.threshold}
+    processes = parse_wrapper_output(args.input)
+    write_output(args, processes, properties)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Benchmark the converter and the viewer on synthetic strace logs (see
+``generate_strace.py``) of several sizes. For each size, the following is
+measured in a separate process:
+
+* ``parse``: lines per second of ``parse_strace_output`` and the peak RSS.
+* ``dump``: throughput and output size of ``dump_json``.
+* ``viewer``: latency of the first (cold) and following (warm) responses of
+  ``viewer.py`` for the whole build, the analysis and the dataset file.
+
+The generated logs are kept in the work directory, so later runs measure the
+same input. Run the benchmark before and after a change of a hot path and
+compare the results (optionally written as JSON with ``--json``).
+"""
+
+from argparse import ArgumentParser, FileType
+import os
+import resource
+from subprocess import PIPE, Popen
+import sys
+from time import time
+
+import simplejson as json
+
+# Number of warm requests per viewer URL.
+REQUESTS = 5
+
+
+def measure(function, *args):
+    start = time()
+    result = function(*args)
+    return result, time() - start
+
+
+def max_rss():
+    """
+    Return the peak resident set size of this process, in bytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bench_convert(log_path, output_path):
+    from backend.strace import parse_strace_output
+    from backend.common import dump_json
+
+    with open(log_path) as fd:
+        lines = sum(1 for line in fd)
+
+    with open(log_path) as fd:
+        processes, parse_time = measure(parse_strace_output, fd, 0.1)
+
+    rss = max_rss()
+
+    with open(output_path, 'w') as fd:
+        dummy, dump_time = measure(dump_json, fd, processes,
+                                   {'threshold': 0.1})
+
+    size = os.path.getsize(output_path)
+
+    return {'processes': len(processes) - 1, 'lines': lines,
+            'parse_time': parse_time, 'lines_per_second': lines / parse_time,
+            'parse_rss': rss, 'dump_time': dump_time, 'output_size': size,
+            'dump_bytes_per_second': size / dump_time}
+
+
+def bench_viewer(dataset_path):
+    import viewer
+
+    viewer.data_dir, name = os.path.split(os.path.abspath(dataset_path))
+    viewer.default_dataset = name
+
+    with open(dataset_path) as fd:
+        processes = json.load(fd)['processes']
+
+    end = max(p['end'] for pid, p in processes.iteritems() if pid != 'root')
+    del processes
+
+    urls = {'view': '%s/view/0/%d/0.1/0.1' % (viewer.proxy_url, end),
+            'analysis': viewer.proxy_url + '/analysis',
+            'data': '%s/data/%s' % (viewer.proxy_url, name)}
+    results = {}
+
+    for key, url in sorted(urls.iteritems()):
+        response, cold = measure(viewer.app.request, url)
+        assert response.status.startswith('200'), (url, response.status)
+        warm = sorted(measure(viewer.app.request, url)[1]
+                      for i in xrange(REQUESTS))
+
+        results[key] = {'cold': cold, 'warm': warm[len(warm) // 2],
+                        'size': len(response.data)}
+
+    results['rss'] = max_rss()
+
+    return results
+
+
+def run_worker(*args):
+    """
+    Run a benchmark in a new process, so its peak RSS is not influenced by
+    earlier benchmarks. Returns the decoded result.
+    """
+    worker = Popen([sys.executable, os.path.abspath(__file__), '--worker']
+                   + list(args), stdout=PIPE)
+    output = worker.communicate()[0]
+
+    if worker.returncode:
+        raise RuntimeError('Benchmark %s failed.' % ' '.join(args))
+
+    return json.loads(output)
+
+
+def generate(path, processes, seed):
+    if os.path.exists(path):
+        return
+
+    from generate_strace import Generator, build_tree
+
+    with open(path + '.tmp', 'w') as fd:
+        Generator(fd, seed=seed).run(build_tree(processes, 3, 50))
+
+    os.rename(path + '.tmp', path)
+
+
+def print_results(fd, results):
+    def mb(size):
+        return size / float(1 << 20)
+
+    print >>fd, '%10s %10s %10s %9s %9s %10s %9s %9s %9s' % ('Processes',
+            'Lines/s', 'Parse RSS', 'Dump MB/s', 'Output', 'View cold',
+            'View warm', 'Analysis', 'Data')
+
+    for r in results:
+        c, v = r['convert'], r['viewer']
+        line = '%10d %10d %8.1fMB %9.1f %7.1fMB' % (c['processes'],
+                c['lines_per_second'], mb(c['parse_rss']),
+                mb(c['dump_bytes_per_second']), mb(c['output_size']))
+
+        if v:
+            line += ' %9.3fs %8.3fs %8.3fs %8.3fs' % (v['view']['cold'],
+                    v['view']['warm'], v['analysis']['cold'],
+                    v['data']['cold'])
+
+        print >>fd, line
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('sizes', metavar='N', type=int, nargs='*',
+                        default=[10000, 100000, 1000000],
+                        help='Numbers of processes of the benchmarked logs.' \
+                        ' By default, 10k, 100k and 1M processes are used.')
+    parser.add_argument('-d', '--dir', default='bench',
+                        help='Work directory for the generated logs and' \
+                        ' converted datasets. The default is ``bench``.')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Seed of the log generator. The default is' \
+                        ' ``1``.')
+    parser.add_argument('--json', type=FileType('w'),
+                        help='Write the results as JSON to this file.')
+    parser.add_argument('--skip-viewer', action='store_true',
+                        help='Only benchmark the converter.')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        os.makedirs(args.dir)
+
+    results = []
+
+    for size in args.sizes:
+        log_path = os.path.join(args.dir, 'strace-%d-%d.log' % (size,
+                                                               args.seed))
+        dataset_path = os.path.join(args.dir, 'bsa-%d-%d.json' % (size,
+                                                                 args.seed))
+
+        print >>sys.stderr, 'Benchmarking %d processes...' % size
+        generate(log_path, size, args.seed)
+
+        result = {'size': size,
+                  'convert': run_worker('convert', log_path, dataset_path),
+                  'viewer': None}
+
+        if not args.skip_viewer:
+            result['viewer'] = run_worker('viewer', dataset_path)
+
+        results.append(result)
+
+    print_results(sys.stdout, results)
+
+    if args.json:
+        json.dump(results, args.json, indent=2)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--worker']:
+        workers = {'convert': bench_convert, 'viewer': bench_viewer}
+        print json.dumps(workers[sys.argv[2]](*sys.argv[3:]))
+    else:
+        main()
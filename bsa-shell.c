@@ -0,0 +1,167 @@
+/*
+ * Shell wrapper for build system analysis without strace. Make runs every
+ * command of a recipe through this wrapper when it is used as Make's SHELL:
+ *
+ *   $ cc -O2 -o bsa-shell bsa-shell.c
+ *   $ BSA_TRACE=$PWD/wrapper.trace make SHELL=/path/to/bsa/bsa-shell
+ *
+ * The wrapper runs the command with the real shell ($BSA_SHELL, or /bin/sh by
+ * default) and appends one binary record to the file in $BSA_TRACE when the
+ * command has finished, with its resource usage (which includes the processes
+ * that it waited for). The record is written with a single write() to a file
+ * opened with O_APPEND, so concurrent jobs do not interleave their records.
+ * See backend/wrapper.py for the record layout.
+ *
+ * Recursive makes use the wrapper as well, since variables on Make's command
+ * line are passed on to sub-makes. The pid of the wrapper is passed to the
+ * command in $BSA_PARENT, which links sub-makes to the job that runs them.
+ */
+#define _GNU_SOURCE
+#include <errno.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <spawn.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/resource.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <time.h>
+#include <unistd.h>
+
+extern char **environ;
+
+struct record {
+    uint32_t pid;
+    uint32_t ppid;
+    uint32_t parent;
+    int32_t status;
+    uint64_t start;
+    uint64_t end;
+    uint64_t utime;
+    uint64_t stime;
+    uint32_t maxrss;
+    uint32_t nvcsw;
+    uint32_t nivcsw;
+    uint32_t argc;
+    uint32_t size;
+} __attribute__((packed));
+
+static uint64_t microseconds(struct timeval *tv)
+{
+    return (uint64_t)tv->tv_sec * 1000000 + tv->tv_usec;
+}
+
+static uint64_t now(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return (uint64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+}
+
+static void write_record(const char *path, struct record *header,
+                         char **argv)
+{
+    size_t size = sizeof(*header) + header->size;
+    char *buf = malloc(size), *p;
+    int fd, i;
+
+    if (!buf)
+        return;
+
+    memcpy(buf, header, sizeof(*header));
+    p = buf + sizeof(*header);
+
+    for (i = 0; i < (int)header->argc; i++) {
+        size_t len = strlen(argv[i]) + 1;
+
+        memcpy(p, argv[i], len);
+        p += len;
+    }
+
+    fd = open(path, O_WRONLY | O_APPEND | O_CREAT | O_CLOEXEC, 0644);
+
+    if (fd >= 0) {
+        if (write(fd, buf, size) != (ssize_t)size)
+            perror("bsa-shell: write");
+
+        close(fd);
+    }
+
+    free(buf);
+}
+
+int main(int argc, char **argv)
+{
+    const char *trace = getenv("BSA_TRACE");
+    const char *shell = getenv("BSA_SHELL");
+    const char *parent = getenv("BSA_PARENT");
+    struct record header;
+    struct rusage usage;
+    char pid[16];
+    pid_t child;
+    int status, i, err;
+
+    if (!shell || !*shell)
+        shell = "/bin/sh";
+
+    argv[0] = (char *)shell;
+
+    if (!trace || !*trace) {
+        execv(shell, argv);
+        perror("bsa-shell: execv");
+        return 127;
+    }
+
+    memset(&header, 0, sizeof(header));
+    header.pid = getpid();
+    header.ppid = getppid();
+    header.parent = parent ? strtoul(parent, NULL, 10) : 0;
+    header.argc = argc;
+
+    for (i = 0; i < argc; i++)
+        header.size += strlen(argv[i]) + 1;
+
+    snprintf(pid, sizeof(pid), "%u", header.pid);
+    setenv("BSA_PARENT", pid, 1);
+
+    header.start = now();
+    err = posix_spawn(&child, shell, NULL, NULL, argv, environ);
+
+    if (err) {
+        errno = err;
+        perror("bsa-shell: posix_spawn");
+        return 127;
+    }
+
+    while (wait4(child, &status, 0, &usage) < 0)
+        if (errno != EINTR) {
+            perror("bsa-shell: wait4");
+            return 127;
+        }
+
+    header.end = now();
+    header.utime = microseconds(&usage.ru_utime);
+    header.stime = microseconds(&usage.ru_stime);
+    header.maxrss = usage.ru_maxrss;
+    header.nvcsw = usage.ru_nvcsw;
+    header.nivcsw = usage.ru_nivcsw;
+
+    if (WIFSIGNALED(status))
+        header.status = 128 + WTERMSIG(status);
+    else
+        header.status = WEXITSTATUS(status);
+
+    write_record(trace, &header, argv);
+
+    if (WIFSIGNALED(status)) {
+        signal(WTERMSIG(status), SIG_DFL);
+        kill(getpid(), WTERMSIG(status));
+    }
+
+    return header.status;
+}
@@ -0,0 +1,127 @@
+"""
+Size-bounded caches used by the viewer. The caches are shared by the threads
+of the server, so they are guarded by locks.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+
+class LRUCache(object):
+    """
+    Least recently used cache, bounded by the total size of its values. The
+    size of a value is determined by ``sizeof``, which defaults to ``len``.
+    Values larger than the maximal size of the cache are not stored.
+    """
+
+    def __init__(self, max_size, sizeof=len):
+        self.items = OrderedDict()
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, size = self.items.pop(key)
+            except KeyError:
+                return default
+
+            # Move the item to the most recently used end.
+            self.items[key] = value, size
+
+        return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+
+        with self.lock:
+            self._discard(key)
+
+            if size > self.max_size:
+                return
+
+            self.items[key] = value, size
+            self.size += size
+
+            while self.size > self.max_size:
+                key, (value, size) = self.items.popitem(last=False)
+                self.size -= size
+
+    def discard(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def resize(self, max_size):
+        """
+        Change the maximal size of the cache, which drops the least recently
+        used values that no longer fit.
+        """
+        with self.lock:
+            self.max_size = max_size
+
+            while self.size > self.max_size:
+                key, (value, size) = self.items.popitem(last=False)
+                self.size -= size
+
+    def _discard(self, key):
+        if key in self.items:
+            self.size -= self.items.pop(key)[1]
+
+
+class KeyLocks(object):
+    """
+    A lock per key, e.g. so a value that is missing from a cache is computed
+    by one thread, while the other threads that need it wait for the result
+    instead of computing it as well. Locks are removed when they are released
+    by all threads.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self.lock:
+            lock, count = self.locks.get(key, (None, 0))
+            self.locks[key] = lock or Lock(), count + 1
+            lock = self.locks[key][0]
+
+        try:
+            with lock:
+                yield
+        finally:
+            with self.lock:
+                count = self.locks[key][1] - 1
+
+                if count:
+                    self.locks[key] = lock, count
+                else:
+                    del self.locks[key]
+
+
+def cached(cache, locks, key, compute):
+    """
+    Return the value of ``key`` in the cache, or compute it with ``compute()``
+    (once, if several threads need it at the same time) and store it.
+    """
+    value = cache.get(key)
+
+    if value is None:
+        with locks.hold(key):
+            value = cache.get(key)
+
+            if value is None:
+                value = compute()
+                cache.put(key, value)
+
+    return value
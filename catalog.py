@@ -0,0 +1,117 @@
+"""
+Catalog of the converted builds in the data directory of the viewer. The
+metadata of a dataset (number of processes and wall time) is read from its
+properties, which are at the end of a JSON file and in the header of a
+columnar file, so datasets do not have to be loaded to list them.
+"""
+
+from datetime import datetime
+import os
+import struct
+from threading import Lock
+
+import simplejson as json
+
+from columnar import MAGIC
+
+# Extensions of the dataset files in the data directory.
+EXTENSIONS = ('.json', '.bsac')
+
+# Number of bytes at the end of a JSON dataset that contain its properties.
+TAIL_SIZE = 64 << 10
+
+
+def read_properties(path):
+    """
+    Return the properties of a dataset file, without loading its processes.
+    Returns ``None`` if they cannot be found.
+    """
+    with open(path, 'rb') as fd:
+        if path.endswith('.bsac'):
+            magic, header_size = struct.unpack('<4sI', fd.read(8))
+
+            if magic != MAGIC:
+                return None
+
+            return json.loads(fd.read(header_size))['properties']
+
+        fd.seek(0, os.SEEK_END)
+        fd.seek(max(0, fd.tell() - TAIL_SIZE))
+        tail = fd.read()
+
+    pos = tail.rfind('"properties": ')
+
+    if pos == -1:
+        return None
+
+    try:
+        return json.loads(tail[pos + 14:].rstrip()[:-1])
+    except ValueError:
+        return None
+
+
+class Catalog(object):
+    """
+    List of the datasets in a directory, with their metadata. The metadata of
+    a dataset is kept until its file is modified. ``load`` is called with the
+    name of a dataset whose properties do not contain its metadata (e.g. of an
+    older converter), and should return the loaded ``dataset.Dataset``.
+    """
+
+    def __init__(self, data_dir, load):
+        self.data_dir = data_dir
+        self.load = load
+        self.entries = {}
+        self.lock = Lock()
+
+    def info(self, name):
+        path = os.path.join(self.data_dir, name)
+        stat = os.stat(path)
+        entry = self.entries.get(name)
+
+        if entry is not None and entry['mtime'] == stat.st_mtime:
+            return entry
+
+        properties = read_properties(path) or {}
+
+        if 'process_count' not in properties:
+            dataset = self.load(name)
+            properties = dict(dataset.properties,
+                              process_count=len(dataset.processes),
+                              wall_time=dataset.processes[dataset.root]['end']
+                              - dataset.processes[dataset.root]['start'])
+
+        entry = self.entries[name] = {
+            'name': name, 'mtime': stat.st_mtime, 'size': stat.st_size,
+            'date': datetime.fromtimestamp(stat.st_mtime).strftime(
+                '%Y-%m-%d %H:%M'),
+            'process_count': properties['process_count'],
+            'wall_time': properties['wall_time'],
+            'live': properties.get('live', False)}
+
+        return entry
+
+    def scan(self):
+        """
+        Return the metadata of the datasets in the directory, most recently
+        modified first.
+        """
+        names = [name for name in os.listdir(self.data_dir)
+                 if os.path.splitext(name)[1] in EXTENSIONS]
+        entries = []
+
+        # The catalog is shared by the threads of the server.
+        with self.lock:
+            # Forget the datasets that have been removed.
+            for name in set(self.entries) - set(names):
+                del self.entries[name]
+
+            for name in names:
+                try:
+                    entries.append(self.info(name))
+                except (IOError, OSError, ValueError, KeyError):
+                    continue
+
+        entries.sort(key=lambda e: -e['mtime'])
+
+        return entries
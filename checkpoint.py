@@ -0,0 +1,149 @@
+"""
+Checkpoint of the parser state of a log file, so the log does not have to be
+parsed again to convert it with other options, and only the appended lines
+have to be parsed when it has grown. The checkpoint contains the parser (with
+the state of the running processes and the zero time), the completed
+processes and the byte offset up to which the log was parsed.
+
+A checkpoint is only used for the log at the same path whose first ``offset``
+bytes still have the same MD5 hash, i.e. which is unchanged or has only been
+appended to.
+"""
+
+import cPickle as pickle
+from contextlib import contextmanager
+import gc
+from hashlib import md5
+import os
+
+VERSION = 4
+
+# Number of bytes of the log file that are hashed or searched at once.
+READ_SIZE = 1 << 20
+
+
+class Checkpoint(object):
+    """
+    Checkpoint of the log file at ``path``. ``hash`` is the MD5 hash object of
+    the first ``offset`` bytes of the log, which is not saved, so only the
+    appended bytes are hashed by ``save``.
+    """
+
+    def __init__(self, path, parser):
+        self.path = os.path.abspath(path)
+        self.offset = 0
+        self.hash = md5()
+        self.digest = self.hash.hexdigest()
+        self.parser = parser
+        self.finished = []
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['hash']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.hash = None
+
+    def save(self, offset):
+        """
+        Write the checkpoint for the log that has been parsed up to
+        ``offset``. The checkpoint file is replaced atomically.
+        """
+        hash_range(self.hash, self.path, self.offset, offset)
+        self.offset = offset
+        self.digest = self.hash.hexdigest()
+
+        tmp_path = checkpoint_path(self.path) + '.tmp'
+
+        with open(tmp_path, 'wb') as fd, suspend_gc():
+            pickle.dump((VERSION, self), fd, pickle.HIGHEST_PROTOCOL)
+
+        os.rename(tmp_path, checkpoint_path(self.path))
+
+
+@contextmanager
+def suspend_gc():
+    """
+    Disable the cyclic garbage collector, which would otherwise be run many
+    times while the (acyclic) objects of a checkpoint are created.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def checkpoint_path(path):
+    return path + '.checkpoint'
+
+
+def hash_range(digest, path, start, end):
+    """
+    Update the hash object ``digest`` with the bytes ``[start, end)`` of a
+    file.
+    """
+    with open(path, 'rb') as fd:
+        fd.seek(start)
+
+        while start < end:
+            data = fd.read(min(end - start, READ_SIZE))
+
+            if not data:
+                break
+
+            digest.update(data)
+            start += len(data)
+
+
+def complete_size(path):
+    """
+    Return the size of a log file up to and including its last newline, so an
+    incomplete last line (of a log that is still being written) is not parsed.
+    """
+    with open(path, 'rb') as fd:
+        fd.seek(0, os.SEEK_END)
+        end = fd.tell()
+
+        while end > 0:
+            start = max(0, end - READ_SIZE)
+            fd.seek(start)
+            pos = fd.read(end - start).rfind('\n')
+
+            if pos != -1:
+                return start + pos + 1
+
+            end = start
+
+    return 0
+
+
+def load_checkpoint(path, parser):
+    """
+    Return the checkpoint of the log file at ``path``. If there is no valid
+    checkpoint for its current contents, an empty checkpoint with the given
+    ``parser`` is returned.
+    """
+    try:
+        with open(checkpoint_path(path), 'rb') as fd, suspend_gc():
+            version, checkpoint = pickle.load(fd)
+    except (IOError, EOFError, ValueError, TypeError, AttributeError,
+            ImportError, pickle.UnpicklingError):
+        return Checkpoint(path, parser)
+
+    if version != VERSION or checkpoint.path != os.path.abspath(path) \
+            or checkpoint.offset > os.path.getsize(path):
+        return Checkpoint(path, parser)
+
+    checkpoint.hash = md5()
+    hash_range(checkpoint.hash, path, 0, checkpoint.offset)
+
+    if checkpoint.hash.hexdigest() != checkpoint.digest:
+        return Checkpoint(path, parser)
+
+    return checkpoint
@@ -0,0 +1,346 @@
+"""
+Compact columnar dataset format. Instead of a JSON object per process, the
+processes are stored as fixed-width little-endian arrays, and every command
+string is stored once in a string table. The file can be memory mapped by the
+viewer and decoded with typed arrays by the browser (see
+``static/js/columnar.js``).
+
+Layout of a columnar file::
+
+  magic       4 bytes, ``BSAC``
+  header_size uint32
+  header      JSON object of ``header_size`` bytes (version, root pid,
+              properties, process type names and the section table)
+  sections    arrays, each one aligned at 8 bytes
+
+The section table maps a section name to its ``[offset, count, typecode]``,
+where the typecode is a ``struct`` format character. The sections are:
+
+  pid, parent, start, end   int32 per process
+  type                      uint8 per process, index in the type names
+  child_offset              int32 per process + 1, offsets in ``children``
+  children                  int32 child pids
+  syscall_offset            int32 per process + 1, offsets in ``syscall_*``
+  syscall_start             int32 per syscall
+  syscall_end               int32 per syscall
+  syscall_cmd               int32 per syscall, index in the string table
+  string_offset             uint32 per string + 1, offsets in ``strings``
+  strings                   UTF-8 encoded bytes of all strings
+  utime, stime, maxrss,     int32 per process, the resource usage of the
+  nvcsw, nivcsw             process (see ``backend.strace.parse_rusage``), or
+                            -1 if it is not known
+  host                      uint8 per process, index in the host names of the
+                            header (see ``merge``), which are empty if the
+                            processes have no host
+
+Files written before the resource usage sections were added do not contain
+them, which is the same as not knowing the resource usage of any process.
+Files written before the host section was added do not contain it nor the host
+names.
+"""
+
+from array import array
+from mmap import mmap, ACCESS_READ
+import struct
+from sys import byteorder
+
+import simplejson as json
+
+MAGIC = 'BSAC'
+VERSION = 1
+
+# Process types, in the order of their type codes.
+TYPES = ['unknown', 'make', 'cpp', 'cc', 'sh']
+
+# Section names and their struct format characters, in file order.
+SECTIONS = [
+    ('pid', 'i'), ('parent', 'i'), ('start', 'i'), ('end', 'i'),
+    ('child_offset', 'i'), ('children', 'i'), ('syscall_offset', 'i'),
+    ('syscall_start', 'i'), ('syscall_end', 'i'), ('syscall_cmd', 'i'),
+    ('string_offset', 'I'), ('utime', 'i'), ('stime', 'i'), ('maxrss', 'i'),
+    ('nvcsw', 'i'), ('nivcsw', 'i'), ('type', 'B'), ('host', 'B'),
+    ('strings', 'c'),
+]
+
+# Fields of the resource usage of a process.
+RUSAGE = ['utime', 'stime', 'maxrss', 'nvcsw', 'nivcsw']
+
+ALIGNMENT = 8
+
+
+def dump_columnar(fd, processes, properties):
+    """
+    Write the processes to ``fd`` in the columnar format. The processes are
+    either a dictionary or an iterable of ``(pid, process)`` pairs, as
+    accepted by ``backend.common.dump_json``.
+    """
+    if isinstance(processes, dict):
+        processes = processes.iteritems()
+
+    columns = dict((name, array(code)) for name, code in SECTIONS
+                   if code != 'c')
+    strings = []
+    string_ids = {}
+    type_codes = dict((t, i) for i, t in enumerate(TYPES))
+    hosts = []
+    host_codes = {}
+    root = 0
+
+    columns['child_offset'].append(0)
+    columns['syscall_offset'].append(0)
+
+    for pid, process in processes:
+        if pid == 'root':
+            root = process
+            continue
+
+        columns['pid'].append(pid)
+        columns['parent'].append(process['parent'])
+        columns['start'].append(process['start'])
+        columns['end'].append(process['end'])
+        columns['type'].append(type_codes.get(process['type'], 0))
+        columns['children'].extend(process['children'])
+        columns['child_offset'].append(len(columns['children']))
+
+        host = process.get('host')
+
+        if host is not None and host not in host_codes:
+            host_codes[host] = len(hosts)
+            hosts.append(host)
+
+        columns['host'].append(host_codes.get(host, 0))
+
+        rusage = process.get('rusage', {})
+
+        for field in RUSAGE:
+            columns[field].append(rusage.get(field, -1))
+
+        # Processes without syscalls are written with a details file.
+        for syscall in process.get('syscalls', ()):
+            string_id = string_ids.get(syscall.cmd)
+
+            if string_id is None:
+                string_id = string_ids[syscall.cmd] = len(strings)
+                strings.append(syscall.cmd)
+
+            columns['syscall_start'].append(syscall.start)
+            columns['syscall_end'].append(syscall.end)
+            columns['syscall_cmd'].append(string_id)
+
+        columns['syscall_offset'].append(len(columns['syscall_start']))
+
+    offset = 0
+    columns['string_offset'].append(0)
+
+    for i, string in enumerate(strings):
+        if isinstance(string, unicode):
+            string = strings[i] = string.encode('utf-8')
+
+        offset += len(string)
+        columns['string_offset'].append(offset)
+
+    data = {}
+
+    for name, code in SECTIONS:
+        if code == 'c':
+            data[name] = ''.join(strings)
+        else:
+            column = columns[name]
+
+            if byteorder == 'big':
+                column.byteswap()
+
+            data[name] = column.tostring()
+
+    write_sections(fd, {'version': VERSION, 'root': root, 'types': TYPES,
+                        'hosts': hosts, 'properties': properties}, data)
+
+
+def write_sections(fd, header, data):
+    """
+    Write the magic, the header and the sections in ``data`` to ``fd``. The
+    section table is added to the header.
+    """
+    table = {}
+    offset = 0
+
+    for name, code in SECTIONS:
+        size = len(data[name])
+        table[name] = [offset, size // struct.calcsize(code), code]
+        offset += size + padding(size)
+
+    # The size of the header is not known until the table is encoded, so the
+    # offsets in the table are relative to the end of the (padded) header.
+    header['sections'] = table
+    encoded = json.dumps(header)
+    header_size = len(encoded) + padding(8 + len(encoded))
+
+    fd.write(MAGIC)
+    fd.write(struct.pack('<I', header_size))
+    fd.write(encoded.ljust(header_size))
+
+    for name, code in SECTIONS:
+        fd.write(data[name])
+        fd.write('\0' * padding(len(data[name])))
+
+
+def padding(size):
+    return -size % ALIGNMENT
+
+
+class Column(object):
+    """
+    Read-only view on a section of a memory mapped columnar file.
+    """
+
+    def __init__(self, buf, offset, count, code):
+        self.buf = buf
+        self.offset = offset
+        self.count = count
+        self.format = '<' + code
+        self.size = struct.calcsize(code)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+
+        if not 0 <= i < self.count:
+            raise IndexError('column index out of range')
+
+        return struct.unpack_from(self.format, self.buf,
+                                  self.offset + i * self.size)[0]
+
+    def slice(self, start, end):
+        return struct.unpack_from('<%d%s' % (end - start, self.format[1]),
+                                  self.buf, self.offset + start * self.size)
+
+
+class ColumnarDataset(object):
+    """
+    Memory mapped columnar dataset. The columns are available as attributes
+    (e.g. ``dataset.start[i]``), and ``process`` and ``processes`` decode the
+    processes into the same structure as the JSON format. The syscalls of a
+    process can be decoded on their own with ``get``, which has the interface
+    of ``details.DetailsFile``, so the processes can be decoded without their
+    syscalls while the file stays mapped.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fd:
+            self.buf = mmap(fd.fileno(), 0, access=ACCESS_READ)
+
+        if self.buf[:4] != MAGIC:
+            raise ValueError('"%s" is not a columnar dataset.' % path)
+
+        header_size = struct.unpack_from('<I', self.buf, 4)[0]
+        self.header = json.loads(self.buf[8:8 + header_size])
+
+        if self.header['version'] != VERSION:
+            raise ValueError('Unsupported columnar dataset version %d.'
+                             % self.header['version'])
+
+        self.root = self.header['root']
+        self.properties = self.header['properties']
+        self.types = self.header['types']
+        self.hosts = self.header.get('hosts', [])
+
+        base = 8 + header_size
+
+        for name, (offset, count, code) in self.header['sections'].iteritems():
+            setattr(self, name, Column(self.buf, base + offset, count, code))
+
+        self.indices = None
+
+    def __len__(self):
+        return len(self.pid)
+
+    def close(self):
+        self.buf.close()
+
+    def string(self, i):
+        start, end = self.string_offset.slice(i, i + 2)
+        offset = self.strings.offset
+        return self.buf[offset + start:offset + end].decode('utf-8')
+
+    def syscalls(self, i):
+        """
+        Decode the syscalls of the ``i``-th process.
+        """
+        syscalls = []
+        first, last = self.syscall_offset.slice(i, i + 2)
+
+        for s in xrange(first, last):
+            s_start, s_end = self.syscall_start[s], self.syscall_end[s]
+            syscalls.append({'cmd': self.string(self.syscall_cmd[s]),
+                             'start': s_start, 'end': s_end,
+                             'duration': s_end - s_start if s_end else 0})
+
+        return syscalls
+
+    def get(self, pid):
+        """
+        Return the JSON encoded syscalls of a process, or ``None`` if the
+        process is not in the file.
+        """
+        if self.indices is None:
+            self.indices = dict((pid, i) for i, pid
+                                in enumerate(self.pid.slice(0, len(self))))
+
+        i = self.indices.get(pid)
+
+        if i is None:
+            return None
+
+        return json.dumps(self.syscalls(i))
+
+    def process(self, i, syscalls=True):
+        """
+        Decode the ``i``-th process into a ``(pid, process)`` pair. The
+        process has no syscalls if ``syscalls`` is false.
+        """
+        start, end = self.start[i], self.end[i]
+        first, last = self.child_offset.slice(i, i + 2)
+
+        process = {'type': self.types[self.type[i]],
+                   'parent': self.parent[i],
+                   'start': start, 'end': end, 'duration': end - start,
+                   'children': list(self.children.slice(first, last))}
+
+        if syscalls:
+            process['syscalls'] = self.syscalls(i)
+
+        rusage = self.rusage(i)
+
+        if rusage:
+            process['rusage'] = rusage
+
+        if self.hosts:
+            process['host'] = self.hosts[self.host[i]]
+
+        return self.pid[i], process
+
+    def rusage(self, i):
+        """
+        Return the known resource usage of the ``i``-th process.
+        """
+        if not hasattr(self, 'utime'):
+            return {}
+
+        return dict((field, getattr(self, field)[i]) for field in RUSAGE
+                    if getattr(self, field)[i] >= 0)
+
+    def processes(self, syscalls=True):
+        """
+        Decode all processes into a dictionary, as in the JSON format (without
+        syscalls if ``syscalls`` is false).
+        """
+        processes = dict(self.process(i, syscalls) for i in xrange(len(self)))
+        processes['root'] = self.root
+        return processes
+
+
+def load_columnar(path):
+    return ColumnarDataset(path)
@@ -0,0 +1,203 @@
+"""
+Compression of responses and pre-compression of dataset files. Brotli is used
+in addition to gzip if the ``brotli`` module is available. Compressed log
+files are decompressed as a stream for the converter.
+"""
+
+import cStringIO
+import gzip
+import os
+from shutil import copyfileobj
+from subprocess import Popen, PIPE
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content encodings and file extensions of pre-compressed files, in order of
+# preference.
+ENCODINGS = [('gzip', '.gz')]
+
+if brotli:
+    ENCODINGS.insert(0, ('br', '.br'))
+
+# Commands that write a compressed log file to stdout, by file extension.
+DECOMPRESSORS = {
+    '.gz': ['gzip', '-dc'],
+    '.xz': ['xz', '-dc'],
+    '.zst': ['zstd', '-dc'],
+}
+
+
+def gzip_data(data, compresslevel=9):
+    zbuf = cStringIO.StringIO()
+    zfile = gzip.GzipFile(mode='wb', fileobj=zbuf, compresslevel=compresslevel)
+    zfile.write(data)
+    zfile.close()
+    return zbuf.getvalue()
+
+
+def gzip_chunks(chunks, compresslevel=6):
+    """
+    Compress an iterable of strings into a gzip stream, which is generated in
+    chunks as the strings are compressed.
+    """
+    # A window size above 16 makes zlib write a gzip header and trailer.
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED,
+                                  16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def file_chunks(path, size):
+    """
+    Generate the contents of the file at ``path`` in chunks of ``size``
+    bytes.
+    """
+    with open(path, 'rb') as fd:
+        while True:
+            chunk = fd.read(size)
+
+            if not chunk:
+                break
+
+            yield chunk
+
+
+def compress_data(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data)
+
+    return gzip_data(data)
+
+
+def precompress(path):
+    """
+    Write a compressed copy of the file at ``path`` for each of the supported
+    encodings (e.g. ``<path>.gz``), so the viewer can serve it as-is.
+    """
+    for encoding, extension in ENCODINGS:
+        with open(path, 'rb') as src:
+            if encoding == 'gzip':
+                with gzip.open(path + extension, 'wb') as dst:
+                    copyfileobj(src, dst)
+            else:
+                with open(path + extension, 'wb') as dst:
+                    dst.write(compress_data(src.read(), encoding))
+
+
+def accepts_encoding(accepts, encoding):
+    """
+    Return whether the value of an ``Accept-Encoding`` header accepts the
+    content encoding ``encoding``. Encodings with a quality of 0 are not
+    accepted, and ``*`` stands for the encodings that are not listed.
+
+    >>> accepts_encoding('gzip, deflate', 'gzip')
+    True
+    >>> accepts_encoding('br;q=1.0, gzip;q=0', 'gzip')
+    False
+    >>> accepts_encoding('x-gzip', 'gzip'), accepts_encoding('*', 'gzip')
+    (False, True)
+    >>> accepts_encoding('*;q=0.5, gzip; q=0', 'gzip')
+    False
+    """
+    qualities = {}
+
+    for part in (accepts or '').split(','):
+        parts = part.split(';')
+        quality = 1.0
+
+        for param in parts[1:]:
+            name, _, value = param.partition('=')
+
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        qualities[parts[0].strip().lower()] = quality
+
+    return qualities.get(encoding, qualities.get('*', 0)) > 0
+
+
+def compressed_path(path, accepts):
+    """
+    Return the path and encoding of an up-to-date pre-compressed copy of the
+    file at ``path`` for a request that accepts the given encodings (the
+    value of its ``Accept-Encoding`` header). If there is no such copy,
+    ``(path, None)`` is returned.
+    """
+    mtime = os.path.getmtime(path)
+
+    for encoding, extension in ENCODINGS:
+        if not accepts_encoding(accepts, encoding) \
+                or not os.path.exists(path + extension):
+            continue
+
+        # Skip stale copies, e.g. of a snapshot in follow mode.
+        if os.path.getmtime(path + extension) >= mtime:
+            return path + extension, encoding
+
+    return path, None
+
+
+def is_compressed(path):
+    return os.path.splitext(path)[1] in DECOMPRESSORS
+
+
+class DecompressedFile(object):
+    """
+    Read-only stream of the decompressed contents of a log file compressed
+    with gzip, xz or zstd (based on its extension). The file is decompressed
+    by the command line tool in a separate process, which runs in parallel
+    with the parser, so the log is never decompressed to disk. An ``IOError``
+    is raised at the end of the stream if the tool failed (e.g. for a
+    truncated file).
+    """
+
+    def __init__(self, path):
+        self.name = path
+        command = DECOMPRESSORS[os.path.splitext(path)[1]]
+
+        try:
+            self.process = Popen(command + [path], stdout=PIPE, bufsize=-1)
+        except OSError:
+            raise IOError('"%s" is required to read "%s".'
+                          % (command[0], path))
+
+        self.fd = self.process.stdout
+
+    def __iter__(self):
+        for line in self.fd:
+            yield line
+
+        self.check()
+
+    def read(self, size=-1):
+        data = self.fd.read(size)
+
+        if not data:
+            self.check()
+
+        return data
+
+    def check(self):
+        if self.process.wait():
+            raise IOError('Decompressing "%s" failed.' % self.name)
+
+    def close(self):
+        self.fd.close()
+
+        if self.process.poll() is None:
+            self.process.terminate()
+
+        self.process.wait()
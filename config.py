@@ -8,8 +8,41 @@ proxy_url = '/viewer.py'
 # web directory where processed strace/pymake output is written to.
 data_url = base_url +  '/static/data'  
 
+# Directory on disk that corresponds to data_url.
+data_dir = 'static/data'
+
 default_dataset = 'bsa.json'
 
+# Maximal number of bytes of compressed responses kept in memory.
+response_cache_size = 32 << 20
+
+# Maximal number of bytes of dataset files kept in memory.
+data_cache_size = 128 << 20
+
+# Maximal number of bytes of memory of the parsed datasets kept in memory (as
+# estimated by dataset.Dataset.footprint). A dataset takes about 1.5 KB per
+# process, plus the syscalls if they are not in a details file.
+dataset_cache_size = 256 << 20
+
+# Number of threads of the server of ``viewer.py serve``, which is the number
+# of requests (or keep-alive connections) that are handled at the same time.
+server_threads = 128
+
+# Number of worker processes of ``viewer.py serve`` for the analysis and the
+# comparison of datasets. Every worker keeps its own copy of the datasets it
+# has loaded, so the workers and the server process each get an equal part of
+# dataset_cache_size.
+worker_processes = 2
+
+# Dataset files larger than this number of bytes are not kept in memory, but
+# streamed from disk in chunks of stream_chunk_size bytes.
+stream_threshold = 8 << 20
+stream_chunk_size = 256 << 10
+
+# Number of commands (and of critical path changes) in the comparison of two
+# datasets in the viewer, in order of impact.
+diff_report_limit = 50
+
 default_viewport = {
         # inclusive end of viewport, in milliseconds.
         'end': 40000,
@@ -17,7 +50,7 @@ default_viewport = {
         # start of viewport, in milliseconds.
         'start': 0,
 
-        # scale of the viewport, in milliseconds per pixel.
+        # scale of the viewport, in pixels per millisecond.
         'scale': 1.0 / 10,
 
         # minimal duration to show the process in the viewer, in seconds.
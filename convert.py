@@ -1,36 +1,202 @@
 #!/usr/bin/env python
 """
-Convert a PyMake or filtered strace log file to a build system analysis JSON
-format file.
+Convert a PyMake or strace log file to a build system analysis JSON format
+file. Use ``convert.py diff A B`` to compare two converted builds, and
+``convert.py query DATABASE`` to query the database written by ``--sqlite``.
 """
 
-from argparse import ArgumentParser, FileType
-from sys import exit, stdin, stdout, stderr
+from argparse import ArgumentParser, ArgumentTypeError, FileType
+from sys import argv, exit, stdin, stdout, stderr
+
+from compress import precompress, is_compressed, DecompressedFile
+
+if argv[1:2] == ['diff']:
+    import diff
+    diff.main(argv[2:])
+    exit(0)
+
+if argv[1:2] == ['query']:
+    import database
+    database.main(argv[2:])
+    exit(0)
+
+
+def host_log(value):
+    """
+    Open the log file of a ``--merge HOST=FILE`` option.
+    """
+    host, sep, path = value.partition('=')
+
+    if not sep or not host:
+        raise ArgumentTypeError('"%s" is not of the form HOST=FILE.' % value)
+
+    if not is_compressed(path):
+        return host, FileType('r')(path)
+
+    try:
+        return host, DecompressedFile(path)
+    except IOError as e:
+        raise ArgumentTypeError(str(e))
+
 
 parser = ArgumentParser(description=__doc__)
 parser.add_argument('input', metavar='FILE', type=FileType('r'), nargs='?', 
                     default=stdin,
-                    help='PyMake or filtered strace log file to convert. The' \
-                    ' default input file is stdin.')
+                    help='PyMake log, strace log or wrapper trace file to' \
+                    ' convert. Files ending in ``.gz``, ``.xz`` or ``.zst``' \
+                    ' are decompressed while they are read. The default' \
+                    ' input file is stdin.')
 parser.add_argument('-f', '--format', dest='format', default='strace',
                     help='The format of the given log files. Possible values' \
-                    ' are ``strace`` and ``pymake``. By default, ``strace``' \
-                    ' is used as input format.')
+                    ' are ``strace``, ``pymake`` and ``wrapper``. By' \
+                    ' default, ``strace`` is used as input format.')
 parser.add_argument('-o', '--output', dest='output', type=FileType('w'),
                     default=stdout,
                     help='The JSON format file will be written to' \
                     ' OUTPUT_FILE. The default output file is stdout.')
+parser.add_argument('-O', '--output-format', dest='output_format',
+                    default='json',
+                    choices=['json', 'columnar', 'chrome-trace', 'perfetto'],
+                    help='The format of the output file. Possible values are' \
+                    ' ``json``, ``columnar`` (a compact binary format, use' \
+                    ' the ``.bsac`` file extension for the viewer),' \
+                    ' ``chrome-trace`` (the Trace Event format of' \
+                    ' chrome://tracing and Perfetto) and ``perfetto``' \
+                    " (Perfetto's protobuf trace format, for very large" \
+                    ' builds). By default, ``json`` is used as output' \
+                    ' format.')
 parser.add_argument('-t', '--threshold', type=float, default=0.1,
                     help='Minimal amount of elapsed time in seconds to' \
                     ' include a process and/or syscall in the output. The' \
                     ' default threshold is ``0.1`` seconds.')
+parser.add_argument('-z', '--compress', action='store_true',
+                    help='Also write compressed copies of the output file' \
+                    ' (e.g. OUTPUT_FILE.gz), which are served as-is by the' \
+                    ' viewer.')
+parser.add_argument('--lod', action='store_true',
+                    help='Also write a level of detail pyramid to' \
+                    ' OUTPUT_FILE.lod, which is used by the viewer to show' \
+                    ' zoomed out waterfalls. Not used in follow mode.')
+parser.add_argument('--details', action='store_true',
+                    help='Write the syscalls of the processes to' \
+                    ' OUTPUT_FILE.details instead of the output file, so the' \
+                    ' viewer only loads them for the selected process. Not' \
+                    ' used in follow mode.')
+parser.add_argument('--tokens', action='store_true',
+                    help='Store the commands of the syscalls as lists of ids' \
+                    ' of their tokens (arguments), with every distinct token' \
+                    ' written once. Only for the JSON output format. Not' \
+                    ' used in follow mode.')
+parser.add_argument('--sqlite', action='store_true',
+                    help='Also write an SQLite database of the processes,' \
+                    ' their syscalls and arguments to OUTPUT_FILE.sqlite,' \
+                    ' which is queried with ``convert.py query``. Not used in' \
+                    ' follow mode.')
+parser.add_argument('--analyze', action='store_true',
+                    help='Write a report of the critical path, the number of' \
+                    ' running jobs over time and the time per process type' \
+                    ' to stderr. Not used in follow mode.')
+parser.add_argument('--simulate', nargs='?', metavar='SLOTS',
+                    const='4,8,16,32,64',
+                    type=lambda s: [int(slots) for slots in s.split(',')],
+                    help='Simulate the build with the given comma separated' \
+                    ' numbers of job slots and write the predicted wall time' \
+                    ' and utilization to stderr. By default, 4, 8, 16, 32' \
+                    ' and 64 slots are simulated. Not used in follow mode.')
+parser.add_argument('--policy', default='fifo', choices=['fifo', 'longest'],
+                    help='The order in which the simulation starts ready' \
+                    ' jobs: in order of becoming ready (``fifo``) or longest' \
+                    ' job first (``longest``). The default is ``fifo``.')
+parser.add_argument('-j', '--jobs', type=int, default=1,
+                    help='Number of worker processes that parse the input' \
+                    ' file in parallel. The input file is split into chunks' \
+                    ' at line boundaries. By default, the input is parsed by' \
+                    ' a single process. Not used in follow mode.')
+parser.add_argument('--checkpoint', action='store_true',
+                    help='Save the parsed state of a strace log to' \
+                    ' FILE.checkpoint, and use it to convert the log again' \
+                    ' (e.g. with other options) without parsing it, or to' \
+                    ' only parse the lines that have been appended since.' \
+                    ' Not used in follow mode.')
+parser.add_argument('--merge', metavar='HOST=FILE', action='append',
+                    type=host_log, default=[],
+                    help='Merge the strace log of another host of the' \
+                    ' build (e.g. of a distcc or ssh server) into the' \
+                    ' process tree. The processes of its remote jobs are' \
+                    ' moved below the processes that started them, and its' \
+                    ' clock offset is estimated from their times. Can be' \
+                    ' given once per host.')
+parser.add_argument('--host', default='local',
+                    help='Name of the host of FILE, for ``--merge``. The' \
+                    ' default is ``local``.')
+parser.add_argument('--follow', action='store_true',
+                    help='Follow a log file that is still being written, like' \
+                    ' ``tail -f``, and periodically replace OUTPUT_FILE with' \
+                    ' a snapshot of the build so far. Stops when the master' \
+                    ' Make process has exited.')
+parser.add_argument('--interval', type=float, default=5.0,
+                    help='Number of seconds between two snapshots in follow' \
+                    ' mode. The default interval is ``5`` seconds.')
 
 args = parser.parse_args()
 
-if args.format not in ['strace', 'pymake']:
+if args.format not in ['strace', 'pymake', 'wrapper']:
     print >>stderr, \
             'Format "%s" is unknown. See -h for supported formats.' % \
             args.format
     exit(1)
 
+if args.merge and (args.format != 'strace' or args.follow
+                   or args.checkpoint):
+    print >>stderr, 'The --merge option requires strace logs, and is not' \
+            ' used in follow mode or with --checkpoint.'
+    exit(1)
+
+if args.follow and (args.input is stdin or args.output is stdout):
+    print >>stderr, 'Follow mode requires an input file and an output file.'
+    exit(1)
+
+if (args.lod or args.compress or args.details or args.sqlite) \
+        and args.output is stdout:
+    print >>stderr, 'The --lod, --compress, --details and --sqlite options' \
+            ' require an output file.'
+    exit(1)
+
+if args.tokens and args.output_format != 'json':
+    print >>stderr, 'The --tokens option requires the JSON output format.'
+    exit(1)
+
+if args.details and args.output_format not in ['json', 'columnar']:
+    print >>stderr, 'The --details option requires the JSON or columnar' \
+            ' output format.'
+    exit(1)
+
+if args.jobs > 1 and args.input is stdin:
+    print >>stderr, 'Parallel parsing (-j) requires an input file.'
+    exit(1)
+
+if args.checkpoint and (args.format != 'strace' or args.input is stdin
+                        or is_compressed(args.input.name)):
+    print >>stderr, 'The --checkpoint option requires an uncompressed strace' \
+            ' log file.'
+    exit(1)
+
+if args.input is not stdin and is_compressed(args.input.name):
+    if args.follow or args.jobs > 1:
+        print >>stderr, 'Follow mode and parallel parsing (-j) require an' \
+                ' uncompressed input file.'
+        exit(1)
+
+    args.input.close()
+
+    try:
+        args.input = DecompressedFile(args.input.name)
+    except IOError as e:
+        print >>stderr, e
+        exit(1)
+
 getattr(__import__('backend.' + args.format), args.format).main(args)
+
+if args.compress:
+    args.output.close()
+    precompress(args.output.name)
@@ -0,0 +1,457 @@
+"""
+SQLite database of a converted build, for ad hoc queries such as the slowest
+compiler invocations or the total time per directory, without loading the
+dataset. ``convert.py --sqlite`` writes the database next to the output file,
+and ``convert.py query`` runs canned reports (or any SQL query) on it.
+
+Tables (times are in milliseconds, as in the datasets):
+
+* ``processes``: one row per process, with its ``type``, ``program`` (the
+  name of its executable, e.g. ``cc1plus``), ``directory`` (the directory of
+  the nearest Make process that was started with ``-C``, relative to the
+  directory of the build), its times (``self_time`` is the part of its
+  duration in which none of its children was running), ``depth`` in the
+  process tree, last ``command``, resource usage and ``host`` (``NULL`` if
+  unknown, see ``merge``).
+* ``syscalls``: the syscalls of every process, by ``pid`` and ``seq``.
+* ``tokens`` and ``arguments``: the distinct arguments of the commands, and
+  the ``position`` of every argument in the command of a process.
+* ``process_spans``: an R*Tree index of the start and end times of the
+  processes, for the processes that overlap a time window.
+* ``process_groups``: the number of processes and their total self time,
+  total and maximum duration per type, program, directory and host, from which
+  the aggregates per type, program, directory or host are summed.
+* ``properties``: the properties of the dataset, as JSON values.
+
+The indexes and the ``process_groups`` table cover the canned reports, so
+they read a few pages of the database instead of scanning all processes.
+"""
+
+from argparse import ArgumentParser
+import os
+import posixpath
+import re
+import shlex
+import sqlite3
+from sys import exit, stderr, stdout
+
+import simplejson as json
+
+from analysis import covered, iter_items, last_command
+
+SCHEMA = '''
+CREATE TABLE processes (
+    pid INTEGER PRIMARY KEY, parent INTEGER, type TEXT, program TEXT,
+    directory TEXT, start INTEGER, end INTEGER, duration INTEGER,
+    self_time INTEGER, depth INTEGER, command TEXT, utime INTEGER,
+    stime INTEGER, maxrss INTEGER, nvcsw INTEGER, nivcsw INTEGER,
+    host TEXT);
+CREATE TABLE syscalls (
+    pid INTEGER, seq INTEGER, start INTEGER, end INTEGER, duration INTEGER,
+    cmd TEXT, PRIMARY KEY (pid, seq)) WITHOUT ROWID;
+CREATE TABLE tokens (id INTEGER PRIMARY KEY, token TEXT UNIQUE);
+CREATE TABLE arguments (
+    token INTEGER, pid INTEGER, position INTEGER,
+    PRIMARY KEY (token, pid, position)) WITHOUT ROWID;
+CREATE VIRTUAL TABLE process_spans USING rtree(pid, start, end);
+CREATE TABLE process_groups (
+    type TEXT, program TEXT, directory TEXT, host TEXT, count INTEGER,
+    duration INTEGER, self_time INTEGER, max_duration INTEGER);
+CREATE TABLE properties (name TEXT PRIMARY KEY, value TEXT);
+'''
+
+# Created after the rows are inserted, which is faster than updating them for
+# every row.
+INDEXES = '''
+CREATE INDEX processes_duration ON processes (duration);
+CREATE INDEX processes_self_time ON processes (self_time);
+CREATE INDEX processes_cpu ON processes (utime + stime);
+CREATE INDEX processes_maxrss ON processes (maxrss);
+CREATE INDEX processes_parent ON processes (parent);
+CREATE INDEX processes_type ON processes (type, duration);
+CREATE INDEX processes_program ON processes (program, duration);
+'''
+
+# Argv list of an ``execve`` line, e.g. ``["gcc", "-O2"]``, and its
+# arguments. strace appends ``...`` to truncated arguments.
+ARGV = re.compile(r'\[((?:\s*"[^"\\]*(?:\\.[^"\\]*)*"(?:\.\.\.)?,?)*)')
+ARGUMENT = re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)"')
+
+# Sort keys of the ``top`` report.
+ORDERS = {
+    'duration': 'duration',
+    'self': 'self_time',
+    'cpu': 'utime + stime',
+    'rss': 'maxrss',
+}
+
+
+def command_arguments(cmd):
+    """
+    Return the executable and the arguments of a command. For an ``execve``
+    line, these are its path and argv (without the environment), otherwise the
+    command is split like a shell command line.
+    """
+    if cmd.startswith('execve("'):
+        executable = cmd[8:cmd.find('"', 8)]
+        match = ARGV.match(cmd, cmd.find('[', 8))
+
+        if not match:
+            return executable, []
+
+        return executable, [arg.decode('string_escape') if '\\' in arg else arg
+                            for arg in ARGUMENT.findall(match.group(1))]
+
+    try:
+        args = shlex.split(cmd.lstrip('@-+ \t'))
+    except ValueError:
+        args = cmd.split()
+
+    # Skip environment variable assignments, e.g. ``LANG=C gcc ...``.
+    while args and '=' in args[0] and not args[0].startswith('/'):
+        args = args[1:]
+
+    return (args[0] if args else ''), args
+
+
+def make_directory(directory, args):
+    """
+    Return the directory of a Make process with the given arguments, that was
+    started in ``directory``.
+    """
+    for i, arg in enumerate(args):
+        if arg in ('-C', '--directory') and i + 1 < len(args):
+            path = args[i + 1]
+        elif arg.startswith('--directory='):
+            path = arg[12:]
+        elif arg.startswith('-C') and len(arg) > 2:
+            path = arg[2:]
+        else:
+            continue
+
+        directory = posixpath.normpath(posixpath.join(directory, path))
+
+    return directory
+
+
+def tree_order(processes):
+    """
+    Return the pids of the processes in depth-first order from the root
+    process, followed by the processes that are not in its tree (e.g. of a
+    partial build) in order of their start time.
+    """
+    order = []
+    stack = [processes['root']] if processes.get('root') in processes else []
+
+    while stack:
+        pid = stack.pop()
+        order.append(pid)
+        stack.extend(c for c in processes[pid].get('children', ())
+                     if c in processes)
+
+    if len(order) < len(processes) - ('root' in processes):
+        visited = set(order)
+        order.extend(sorted((pid for pid, _ in iter_items(processes)
+                             if pid not in visited),
+                            key=lambda pid: processes[pid]['start']))
+
+    return order
+
+
+def process_rows(processes, table):
+    """
+    Generate the rows of the processes table, and add the arguments of the
+    processes to the ``arguments`` list of ``table``. Parents are visited
+    before their children, so the depth and directory of a process are
+    derived from those of its parent.
+    """
+    tokens, arguments = table
+    depths = {}
+    directories = {}
+
+    for pid in tree_order(processes):
+        process = processes[pid]
+        parent = process['parent']
+        cmd = last_command(process)
+        executable, args = command_arguments(cmd)
+        directory = directories.get(parent, '.')
+
+        if process['type'] == 'make':
+            directory = make_directory(directory, args)
+
+        depths[pid] = depths.get(parent, -1) + 1
+        directories[pid] = directory
+
+        for position, arg in enumerate(args):
+            token = tokens.get(arg)
+
+            if token is None:
+                token = tokens[arg] = len(tokens)
+
+            arguments.append((token, pid, position))
+
+        children = [(processes[c]['start'], processes[c]['end'])
+                    for c in process.get('children', ()) if c in processes]
+        self_time = process['duration'] - covered(children, process['start'],
+                                                  process['end'])
+        rusage = process.get('rusage') or {}
+
+        yield (pid, parent, process['type'], posixpath.basename(executable),
+               directory, process['start'], process['end'],
+               process['duration'], self_time, depths[pid], cmd,
+               rusage.get('utime'), rusage.get('stime'), rusage.get('maxrss'),
+               rusage.get('nvcsw'), rusage.get('nivcsw'), process.get('host'))
+
+
+def syscall_rows(processes):
+    for pid, process in iter_items(processes):
+        for seq, syscall in enumerate(process.get('syscalls', ())):
+            if not isinstance(syscall, dict):
+                syscall = syscall.to_dict()
+
+            yield (pid, seq, syscall['start'], syscall['end'],
+                   syscall['duration'], syscall['cmd'])
+
+
+def dump_database(path, processes, properties):
+    """
+    Write the processes (a dictionary that maps pids to processes) and the
+    properties of a dataset to a new SQLite database at ``path``. The database
+    is written to a temporary file first, which replaces ``path`` when it is
+    complete.
+    """
+    tmp_path = path + '.tmp'
+
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    db = sqlite3.connect(tmp_path)
+    db.text_factory = str
+    db.execute('PRAGMA journal_mode = OFF')
+    db.execute('PRAGMA synchronous = OFF')
+    db.executescript(SCHEMA)
+
+    tokens, arguments = {}, []
+
+    db.executemany('INSERT INTO processes VALUES (%s)' % ', '.join('?' * 17),
+                   process_rows(processes, (tokens, arguments)))
+    db.executemany('INSERT INTO syscalls VALUES (?, ?, ?, ?, ?, ?)',
+                   syscall_rows(processes))
+    db.executemany('INSERT INTO tokens VALUES (?, ?)',
+                   ((i, token) for token, i in tokens.iteritems()))
+    arguments.sort()
+    db.executemany('INSERT INTO arguments VALUES (?, ?, ?)', arguments)
+    db.execute('INSERT INTO process_spans SELECT pid, start, end'
+               ' FROM processes')
+    db.execute('INSERT INTO process_groups SELECT type, program, directory,'
+               ' host, COUNT(*), SUM(duration), SUM(self_time), MAX(duration)'
+               ' FROM processes GROUP BY type, program, directory, host')
+    db.executemany('INSERT INTO properties VALUES (?, ?)',
+                   ((name, json.dumps(value))
+                    for name, value in properties.iteritems()))
+    db.executescript(INDEXES)
+    db.execute('ANALYZE')
+    db.commit()
+    db.close()
+
+    os.rename(tmp_path, path)
+
+
+def filters(args):
+    """
+    Return the SQL condition and parameters of the process filters of the
+    command line.
+    """
+    conditions, params = [], []
+
+    for column in ('type', 'program', 'directory', 'host'):
+        value = getattr(args, column)
+
+        if value is not None:
+            conditions.append('%s = ?' % column)
+            params.append(value)
+
+    if args.arg is not None:
+        conditions.append('pid IN (SELECT pid FROM arguments'
+                          ' WHERE token = (SELECT id FROM tokens'
+                          ' WHERE token = ?))')
+        params.append(args.arg)
+
+    return ' AND '.join(conditions) or '1', params
+
+
+def top(db, args):
+    where, params = filters(args)
+    order = ORDERS[args.by]
+
+    return db.execute('''
+        SELECT pid, type, program, directory, start / 1000.0,
+               duration / 1000.0, self_time / 1000.0,
+               (utime + stime) / 1000.0, maxrss / 1024.0, command
+        FROM processes WHERE %s AND %s IS NOT NULL
+        ORDER BY %s DESC LIMIT ?''' % (where, order, order),
+        params + [args.limit])
+
+
+def groups(db, args):
+    where, params = filters(args)
+
+    # The groups table does not know the arguments of the processes.
+    if args.arg is not None:
+        table = '(SELECT pid, type, program, directory, host, 1 AS count,' \
+                ' duration, self_time, duration AS max_duration' \
+                ' FROM processes)'
+    else:
+        table = 'process_groups'
+
+    return db.execute('''
+        SELECT %s, SUM(count), SUM(duration) / 1000.0,
+               SUM(self_time) / 1000.0, SUM(duration) / 1000.0 / SUM(count),
+               MAX(max_duration) / 1000.0
+        FROM %s WHERE %s GROUP BY 1
+        ORDER BY 3 DESC LIMIT ?''' % (args.group, table, where),
+        params + [args.limit])
+
+
+def window(db, args):
+    where, params = filters(args)
+    start, end = args.start * 1000, args.end * 1000
+
+    # The R*Tree stores 32-bit floats, so its results are checked against the
+    # exact times of the processes.
+    return db.execute('''
+        SELECT pid, type, program, directory, p.start / 1000.0,
+               p.end / 1000.0, duration / 1000.0, command
+        FROM process_spans s JOIN processes p USING (pid)
+        WHERE s.end >= ? AND s.start <= ? AND p.end >= ? AND p.start <= ?
+              AND %s
+        ORDER BY p.start LIMIT ?''' % where,
+        [start, end, start, end] + params + [args.limit])
+
+
+REPORTS = {
+    'top': (top, ['Pid', 'Type', 'Program', 'Directory', 'Start (s)',
+                  'Duration (s)', 'Self (s)', 'CPU (s)', 'RSS (MiB)',
+                  'Command']),
+    'groups': (groups, [None, 'Count', 'Total (s)', 'Self (s)', 'Mean (s)',
+                        'Max (s)']),
+    'window': (window, ['Pid', 'Type', 'Program', 'Directory', 'Start (s)',
+                        'End (s)', 'Duration (s)', 'Command']),
+}
+
+
+def format_value(value, width=60):
+    if value is None:
+        return '-'
+    elif isinstance(value, float):
+        return '%.3f' % value
+
+    value = str(value)
+
+    return value if len(value) <= width else value[:width - 3] + '...'
+
+
+def print_table(fd, header, rows):
+    """
+    Write the rows of a query to ``fd`` as a table with aligned columns.
+    Numbers are aligned to the right.
+    """
+    numeric = [all(isinstance(row[i], (int, long, float, type(None)))
+                   for row in rows) for i in xrange(len(header))]
+    rows = [[format_value(value) for value in row] for row in rows]
+    widths = [max([len(h)] + [len(row[i]) for row in rows])
+              for i, h in enumerate(header)]
+
+    def line(values):
+        return '  '.join(v.rjust(w) if n else v.ljust(w)
+                         for v, w, n in zip(values, widths, numeric)).rstrip()
+
+    print >>fd, line(header)
+
+    for row in rows:
+        print >>fd, line(row)
+
+
+def main(argv):
+    parser = ArgumentParser(prog='convert.py query',
+                            description='Query the SQLite database of a' \
+                            ' converted build (see ``--sqlite``).')
+    parser.add_argument('database', metavar='DATABASE',
+                        help='SQLite database of the build.')
+    reports = parser.add_subparsers(dest='report')
+
+    process_filters = ArgumentParser(add_help=False)
+    process_filters.add_argument('--type',
+                                 help='Only include processes of this type,' \
+                                 ' e.g. ``cpp``.')
+    process_filters.add_argument('--program',
+                                 help='Only include processes of this' \
+                                 ' executable, e.g. ``cc1plus``.')
+    process_filters.add_argument('--directory',
+                                 help='Only include processes in this' \
+                                 ' directory (of a ``make -C``).')
+    process_filters.add_argument('--host',
+                                 help='Only include processes that ran on' \
+                                 ' this host (see ``convert.py --merge``).')
+    process_filters.add_argument('--arg',
+                                 help='Only include processes with this' \
+                                 ' argument, e.g. ``--arg=-O2`` (an argument' \
+                                 ' that starts with ``-`` has to be given' \
+                                 ' with ``=``).')
+    process_filters.add_argument('-n', '--limit', type=int, default=20,
+                                 help='Number of rows of the report. The' \
+                                 ' default is ``20``.')
+
+    report = reports.add_parser('top', parents=[process_filters],
+                                help='The processes with the longest' \
+                                ' duration, self time, CPU time or maximum' \
+                                ' RSS.')
+    report.add_argument('--by', default='duration', choices=sorted(ORDERS),
+                        help='The order of the processes. The default is' \
+                        ' ``duration``.')
+
+    report = reports.add_parser('groups', parents=[process_filters],
+                                help='The number of processes and their' \
+                                ' total, self, mean and maximum time per' \
+                                ' process type, program, directory or' \
+                                ' host.')
+    report.add_argument('--group', default='type',
+                        choices=['type', 'program', 'directory', 'host'],
+                        help='The column to group the processes by. The' \
+                        ' default is ``type``.')
+
+    report = reports.add_parser('window', parents=[process_filters],
+                                help='The processes that were running in a' \
+                                ' time window, in order of their start.')
+    report.add_argument('start', type=float,
+                        help='Start of the window in seconds.')
+    report.add_argument('end', type=float,
+                        help='End of the window in seconds.')
+
+    report = reports.add_parser('sql', help='Run an SQL query.')
+    report.add_argument('query', help='The SQL query.')
+
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print >>stderr, 'Database "%s" does not exist.' % args.database
+        exit(1)
+
+    db = sqlite3.connect(args.database)
+    db.text_factory = str
+
+    try:
+        if args.report == 'sql':
+            cursor = db.execute(args.query)
+            header = [d[0] for d in cursor.description or ()]
+        else:
+            query, header = REPORTS[args.report]
+            cursor = query(db, args)
+
+            if header[0] is None:
+                header = [args.group.capitalize()] + header[1:]
+    except sqlite3.Error as e:
+        print >>stderr, 'Query failed: %s' % e
+        exit(1)
+
+    print_table(stdout, header, cursor.fetchall())
@@ -0,0 +1,216 @@
+"""
+Server-side access to converted datasets, which are loaded from the JSON or
+columnar format files written by ``convert.py``.
+"""
+
+from copy import copy
+import os
+
+import simplejson as json
+
+from cache import KeyLocks, LRUCache
+from columnar import load_columnar
+from config import dataset_cache_size
+from details import DetailsFile
+from interval import IntervalIndex
+from lod import load_pyramid
+from tokens import expand_processes
+
+# Estimated number of bytes of memory of a loaded process (its dictionary and
+# its entry in the interval index) and of a loaded syscall (without its
+# command), see ``Dataset.footprint``.
+PROCESS_FOOTPRINT = 1500
+SYSCALL_FOOTPRINT = 550
+
+
+class Dataset(object):
+    """
+    Processes of a dataset, indexed by pid, with an interval index on their
+    start and end times and optionally a level of detail pyramid. The syscalls
+    of the processes are not loaded if the dataset has a details file or is
+    a columnar file, which are read on demand (see ``syscalls`` and
+    ``with_syscalls``).
+    """
+
+    def __init__(self, processes, properties, pyramid=None, details=None):
+        self.root = processes.pop('root')
+        self.processes = processes
+        self.properties = properties
+        self.pyramid = pyramid
+        self.details = details
+        self.index = IntervalIndex((p['start'], p['end'], pid)
+                                   for pid, p in processes.iteritems())
+
+    def __len__(self):
+        return len(self.processes)
+
+    def view(self, start, end, scale, threshold):
+        """
+        Select the processes that overlap the inclusive time range ``[start,
+        end]`` (in milliseconds) and last at least ``threshold`` seconds. The
+        ancestors of the selected processes are included as well, so the
+        result is a tree with the same root as the dataset. The children of
+        the returned processes are limited to the selected processes.
+
+        If the dataset has a pyramid and the ``scale`` (in pixels per
+        millisecond) is not finer than its finest level, the bars of the
+        matching level are returned instead.
+        """
+        if self.pyramid and self.pyramid.level(scale):
+            return self.pyramid.view(start, end, scale, threshold)
+
+        threshold *= 1000
+        selected = set()
+
+        for pid in self.index.overlap(start, end):
+            if self.processes[pid]['duration'] < threshold:
+                continue
+
+            while pid and pid not in selected:
+                selected.add(pid)
+                pid = self.processes[pid]['parent']
+
+        processes = {'root': self.root}
+
+        for pid in selected:
+            process = dict(self.processes[pid])
+            process['children'] = [c for c in process['children']
+                                   if c in selected]
+
+            if self.details:
+                process.pop('syscalls', None)
+
+            processes[pid] = process
+
+        return processes
+
+    def syscalls(self, pid):
+        """
+        Return the JSON encoded syscalls of a process, or ``None`` if the
+        process does not exist.
+        """
+        if pid not in self.processes:
+            return None
+
+        if self.details:
+            return self.details.get(pid)
+
+        return json.dumps(self.processes[pid]['syscalls'])
+
+    def with_syscalls(self):
+        """
+        Return the dataset with the syscalls of all processes, for analyses
+        that need the commands of the processes. The syscalls are loaded from
+        the details file into a copy of the dataset, so the dataset itself
+        (e.g. in the cache of ``load_cached``) does not grow.
+        """
+        if not self.details:
+            return self
+
+        dataset = copy(self)
+        dataset.processes = {}
+
+        for pid, process in self.processes.iteritems():
+            if not process.get('syscalls'):
+                process = dict(process, syscalls=json.loads(
+                        self.details.get(pid) or '[]'))
+
+            dataset.processes[pid] = process
+
+        return dataset
+
+    def footprint(self):
+        """
+        Return the estimated number of bytes of memory of the dataset. The
+        syscalls in a details file do not count, since they are not loaded.
+        """
+        size = PROCESS_FOOTPRINT * len(self.processes)
+
+        for process in self.processes.itervalues():
+            for syscall in process.get('syscalls', ()):
+                cmd = syscall['cmd'] if isinstance(syscall, dict) \
+                        else syscall.cmd
+                size += SYSCALL_FOOTPRINT + len(cmd)
+
+        return size
+
+
+def load_dataset(path):
+    """
+    Load a dataset file. Columnar datasets are recognized by their ``.bsac``
+    extension, other files are parsed as JSON. The pyramid of the dataset is
+    loaded from ``<path>.lod``, if it exists, and its details from
+    ``<path>.details`` if it was written with a details file. A columnar file
+    stays mapped and is its own details file, so the syscalls of its
+    processes are only decoded when they are requested.
+    """
+    pyramid = None
+
+    if os.path.exists(path + '.lod'):
+        pyramid = load_pyramid(path + '.lod')
+
+    def details(properties):
+        if properties.get('details'):
+            return DetailsFile(path + '.details')
+
+    if path.endswith('.bsac'):
+        columnar = load_columnar(path)
+        processes = columnar.processes(syscalls=False)
+        details_file = details(columnar.properties)
+
+        if details_file:
+            columnar.close()
+
+        return Dataset(processes, columnar.properties, pyramid,
+                       details_file or columnar)
+
+    with open(path) as fd:
+        data = json.load(fd)
+
+    # JSON object keys are strings, whereas pids are integers elsewhere.
+    processes = dict((int(pid) if pid != 'root' else pid, process)
+                     for pid, process in data['processes'].iteritems())
+
+    if 'strings' in data:
+        expand_processes(processes, data['strings'])
+
+    return Dataset(processes, data['properties'], pyramid,
+                   details(data['properties']))
+
+
+# Datasets loaded by this process, which map a path to the modification time,
+# footprint and dataset. The cache is bounded by the total footprint of the
+# datasets.
+datasets = LRUCache(dataset_cache_size, sizeof=lambda entry: entry[1])
+loading = KeyLocks()
+
+
+def limit_cache(max_size):
+    """
+    Limit the datasets kept in memory by this process to a total footprint of
+    ``max_size`` bytes, e.g. the share of a worker process (see
+    ``workers.start``).
+    """
+    datasets.resize(max_size)
+
+
+def load_cached(path):
+    """
+    Return the modification time and the loaded dataset of the file at
+    ``path``. The dataset is kept in memory until the file is modified, and
+    it is loaded once if several threads need it at the same time.
+    """
+    stat = os.stat(path)
+    entry = datasets.get(path)
+
+    if entry is None or entry[0] != stat.st_mtime:
+        with loading.hold(path):
+            stat = os.stat(path)
+            entry = datasets.get(path)
+
+            if entry is None or entry[0] != stat.st_mtime:
+                dataset = load_dataset(path)
+                entry = stat.st_mtime, dataset.footprint(), dataset
+                datasets.put(path, entry)
+
+    return entry[0], entry[2]
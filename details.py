@@ -0,0 +1,129 @@
+"""
+Details file of a dataset, which contains the syscalls of its processes, so
+the dataset itself only contains the timeline (pid, parent, start, end, type
+and children of the processes). The viewer serves the syscalls of a single
+process with a lookup in the index of the details file.
+
+Layout of a details file (``<dataset>.details``)::
+
+  magic     4 bytes, ``BSAD``
+  records   JSON encoded list of syscalls of each process, back to back
+  padding   to align the index at 8 bytes
+  index     uint64 record offset per process, followed by a uint32 record
+            length per process and a uint32 pid per process, sorted by pid
+  trailer   uint64 offset of the index, uint32 number of processes, magic
+"""
+
+from bisect import bisect_left
+from mmap import mmap, ACCESS_READ
+import struct
+
+from columnar import Column, padding
+
+MAGIC = 'BSAD'
+
+TRAILER = struct.Struct('<QI4s')
+
+
+class DetailsWriter(object):
+    """
+    Write the records of a details file to ``fd`` one process at a time. The
+    index is written by ``finish``.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.fd.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.index = []
+
+    def add(self, pid, record):
+        self.index.append((pid, self.offset, len(record)))
+        self.fd.write(record)
+        self.offset += len(record)
+
+    def finish(self):
+        self.index.sort()
+        count = len(self.index)
+
+        self.fd.write('\0' * padding(self.offset))
+        index_offset = self.offset + padding(self.offset)
+
+        self.fd.write(struct.pack('<%dQ' % count,
+                                  *[offset for pid, offset, size
+                                    in self.index]))
+        self.fd.write(struct.pack('<%dI' % count,
+                                  *[size for pid, offset, size in self.index]))
+        self.fd.write(struct.pack('<%dI' % count,
+                                  *[pid for pid, offset, size in self.index]))
+        self.fd.write(TRAILER.pack(index_offset, count, MAGIC))
+
+
+def split_details(processes, writer, encode):
+    """
+    Generate the ``(pid, process)`` pairs of the processes without their
+    syscalls, and add the syscalls (encoded as JSON by ``encode``) to the
+    details ``writer``. The processes are either a dictionary or an iterable
+    of ``(pid, process)`` pairs, as accepted by ``backend.common.dump_json``.
+    The given processes are not modified.
+
+    >>> from cStringIO import StringIO
+    >>> writer = DetailsWriter(StringIO())
+    >>> processes = {'root': 1, 1: {'start': 0, 'syscalls': ['execve']}}
+    >>> sorted(split_details(processes, writer, repr))
+    [(1, {'start': 0}), ('root', 1)]
+    >>> list(split_details(iter([(1, processes[1])]), writer, repr))
+    [(1, {'start': 0})]
+    >>> [pid for pid, offset, size in writer.index]
+    [1, 1]
+    """
+    if isinstance(processes, dict):
+        processes = processes.iteritems()
+
+    for pid, process in processes:
+        if pid != 'root':
+            writer.add(pid, encode(process['syscalls']))
+            process = dict(process)
+            del process['syscalls']
+
+        yield pid, process
+
+
+class DetailsFile(object):
+    """
+    Memory mapped details file.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fd:
+            self.buf = mmap(fd.fileno(), 0, access=ACCESS_READ)
+
+        index_offset, count, magic = TRAILER.unpack_from(
+                self.buf, len(self.buf) - TRAILER.size)
+
+        if self.buf[:4] != MAGIC or magic != MAGIC:
+            raise ValueError('"%s" is not a details file.' % path)
+
+        self.offsets = Column(self.buf, index_offset, count, 'Q')
+        self.sizes = Column(self.buf, index_offset + 8 * count, count, 'I')
+        self.pids = Column(self.buf, index_offset + 12 * count, count, 'I')
+
+    def __len__(self):
+        return len(self.pids)
+
+    def get(self, pid):
+        """
+        Return the JSON encoded syscalls of a process, or ``None`` if the
+        process is not in the file.
+        """
+        i = bisect_left(self.pids, pid)
+
+        if i == len(self.pids) or self.pids[i] != pid:
+            return None
+
+        offset = self.offsets[i]
+        return self.buf[offset:offset + self.sizes[i]]
+
+    def close(self):
+        self.buf.close()
+
@@ -0,0 +1,247 @@
+"""
+Comparison of two converted builds, to find performance regressions. Processes
+are grouped in both builds by their normalized command: the path and
+arguments of their ``execve``, without the environment and with temporary
+file names and other run-specific numbers replaced. Grouping is done with
+dictionaries keyed by the normalized command, so it scales linearly with the
+number of processes.
+"""
+
+from argparse import ArgumentParser
+import re
+from sys import stdout
+
+from analysis import critical_path, iter_items, last_command, type_times
+from database import command_arguments
+from dataset import load_dataset
+
+# Patterns of run-specific parts of a command, with their replacement.
+NORMALIZE_PATTERNS = [
+    # Temporary files, e.g. /tmp/ccR2xE1a.s
+    (re.compile(r'/tmp/[^",\s]+'), '/tmp/*'),
+    # Addresses, e.g. child_stack=0x7f2a5c
+    (re.compile(r'0x[0-9a-fA-F]+'), '0x*'),
+    # Pids and other numbers that are part of a file name, e.g. conftest.123
+    (re.compile(r'(?<=[._-])\d{3,}\b'), '*'),
+]
+
+
+def normalize_command(cmd):
+    """
+    Normalize a command into a key that is equal for the same command in
+    different builds. The key of an ``execve`` system call consists of its
+    path and arguments (see ``database.command_arguments``), so the
+    environment and the result of the call are left out in every format of
+    strace.
+
+    >>> normalize_command('execve("/usr/bin/gcc", ["gcc", "-c", "a.c", "-o",'
+    ...                   ' "/tmp/ccR2xE1a.o"], [/* 20 vars */]) = 0')
+    '/usr/bin/gcc -c a.c -o /tmp/*'
+    >>> normalize_command('execve("/usr/bin/gcc", ["gcc", "-c", "a.c", "-o",'
+    ...                   ' "/tmp/ccW4u9Zb.o"], 0x7ffd2c0a8e48 /* 21 vars */)'
+    ...                   ' = 0')
+    '/usr/bin/gcc -c a.c -o /tmp/*'
+    """
+    executable, args = command_arguments(cmd)
+    key = ' '.join([executable] + args[1:])
+
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        key = pattern.sub(replacement, key)
+
+    return key
+
+
+def command_key(process):
+    """
+    Return the normalized command of the last ``execve`` of a process. The
+    first half of a split ``execve`` has the same key as a whole one:
+
+    >>> command_key({'syscalls': [
+    ...     {'cmd': 'execve("/usr/bin/gcc", ["gcc", "-c", "a.c"],'
+    ...             ' 0x7ffd2c0a8e48 /* 21 vars */ <unfinished ...>'},
+    ...     {'cmd': '<... execve resumed>) = 0'}]})
+    '/usr/bin/gcc -c a.c'
+    """
+    return normalize_command(last_command(process))
+
+
+def group_by_command(processes):
+    """
+    Map each normalized command to its processes.
+    """
+    groups = {}
+
+    for pid, process in iter_items(processes):
+        groups.setdefault(command_key(process), []).append(process)
+
+    return groups
+
+
+def compare_commands(a, b):
+    """
+    Compare the total duration of the processes of two builds per normalized
+    command, so a command that runs several times is compared as a whole.
+    Returns a list of dictionaries with the command, its type, the number of
+    processes and the total duration in both builds and the difference,
+    sorted by the absolute difference.
+    """
+    groups_a, groups_b = group_by_command(a), group_by_command(b)
+    result = []
+
+    for key in set(groups_a) | set(groups_b):
+        group_a, group_b = groups_a.get(key, []), groups_b.get(key, [])
+        duration_a = sum(p['duration'] for p in group_a)
+        duration_b = sum(p['duration'] for p in group_b)
+
+        result.append({'command': key,
+                       'type': (group_a or group_b)[0]['type'],
+                       'count_a': len(group_a), 'count_b': len(group_b),
+                       'duration_a': duration_a, 'duration_b': duration_b,
+                       'delta': duration_b - duration_a})
+
+    result.sort(key=lambda r: -abs(r['delta']))
+
+    return result
+
+
+def compare_types(a, b):
+    """
+    Compare the total and self time per process type of two builds, sorted by
+    the absolute difference of the self time.
+    """
+    types_a, types_b = type_times(a), type_times(b)
+    empty = {'count': 0, 'total': 0, 'self': 0}
+    result = []
+
+    for name in set(types_a) | set(types_b):
+        stats_a, stats_b = types_a.get(name, empty), types_b.get(name, empty)
+        result.append({'type': name,
+                       'count_a': stats_a['count'],
+                       'count_b': stats_b['count'],
+                       'total_a': stats_a['total'],
+                       'total_b': stats_b['total'],
+                       'self_a': stats_a['self'], 'self_b': stats_b['self'],
+                       'delta': stats_b['self'] - stats_a['self']})
+
+    result.sort(key=lambda r: -abs(r['delta']))
+
+    return result
+
+
+def compare_critical_paths(a, root_a, b, root_b):
+    """
+    Compare the critical paths of two builds. Returns the commands that are
+    only on the critical path of build ``a`` (``removed``) or ``b``
+    (``added``), and the duration differences of the commands on both paths,
+    sorted by their absolute difference.
+    """
+    def path_durations(processes, root):
+        durations = {}
+
+        for pid, start, end, depth in critical_path(processes, root):
+            key = command_key(processes[pid])
+            durations[key] = durations.get(key, 0) + end - start
+
+        return durations
+
+    path_a, path_b = path_durations(a, root_a), path_durations(b, root_b)
+
+    changed = [{'command': key, 'duration_a': path_a[key],
+                'duration_b': path_b[key],
+                'delta': path_b[key] - path_a[key]}
+               for key in set(path_a) & set(path_b)]
+    changed.sort(key=lambda r: -abs(r['delta']))
+
+    return {
+        'added': sorted(set(path_b) - set(path_a), key=lambda k: -path_b[k]),
+        'removed': sorted(set(path_a) - set(path_b),
+                          key=lambda k: -path_a[k]),
+        'changed': changed,
+    }
+
+
+def compare(a, b, limit=None):
+    """
+    Compare two datasets (see ``dataset.Dataset``) and return the report as a
+    dictionary, which can be encoded as JSON. If ``limit`` is given, the
+    commands and the critical path changes are limited to the ``limit``
+    entries with the largest impact. The number of compared commands is
+    ``command_count``.
+    """
+    commands = compare_commands(a.processes, b.processes)
+    path = compare_critical_paths(a.processes, a.root, b.processes, b.root)
+
+    if limit is not None:
+        path = dict((name, entries[:limit])
+                    for name, entries in path.iteritems())
+
+    return {
+        'wall_time_a': a.processes[a.root]['duration'],
+        'wall_time_b': b.processes[b.root]['duration'],
+        'command_count': len(commands),
+        'commands': commands[:limit],
+        'types': compare_types(a.processes, b.processes),
+        'critical_path': path,
+    }
+
+
+def print_report(fd, report, limit=20):
+    """
+    Write a human readable report of the result of ``compare`` to ``fd``,
+    limited to the ``limit`` entries with the largest impact per section.
+    """
+    def seconds(ms):
+        return ms / 1000.0
+
+    print >>fd, 'Wall time: %.3f s -> %.3f s (%+.3f s)' % (
+            seconds(report['wall_time_a']), seconds(report['wall_time_b']),
+            seconds(report['wall_time_b'] - report['wall_time_a']))
+    print >>fd
+    print >>fd, '%-10s %12s %12s %12s' % ('Type', 'Self A (s)', 'Self B (s)',
+                                          'Delta (s)')
+
+    for r in report['types'][:limit]:
+        print >>fd, '%-10s %12.3f %12.3f %+12.3f' % (r['type'],
+                seconds(r['self_a']), seconds(r['self_b']),
+                seconds(r['delta']))
+
+    print >>fd
+    print >>fd, '%12s %12s %12s %9s  %s' % ('A (s)', 'B (s)', 'Delta (s)',
+                                            'Count', 'Command')
+
+    for r in report['commands'][:limit]:
+        print >>fd, '%12.3f %12.3f %+12.3f %4d/%-4d  %s' % (
+                seconds(r['duration_a']), seconds(r['duration_b']),
+                seconds(r['delta']), r['count_a'], r['count_b'],
+                r['command'][:200])
+
+    path = report['critical_path']
+    print >>fd
+    print >>fd, 'Critical path changes:'
+
+    for r in path['changed'][:limit]:
+        if r['delta']:
+            print >>fd, '  %+12.3f s  %s' % (seconds(r['delta']),
+                                             r['command'][:200])
+
+    for key in path['added'][:limit]:
+        print >>fd, '  added        %s' % key[:200]
+
+    for key in path['removed'][:limit]:
+        print >>fd, '  removed      %s' % key[:200]
+
+
+def main(argv):
+    parser = ArgumentParser(prog='convert.py diff',
+                            description='Compare two converted builds.')
+    parser.add_argument('a', metavar='A', help='Dataset of the old build.')
+    parser.add_argument('b', metavar='B', help='Dataset of the new build.')
+    parser.add_argument('-n', '--limit', type=int, default=20,
+                        help='Number of entries per section of the report.' \
+                        ' The default is ``20``.')
+    args = parser.parse_args(argv)
+
+    a = load_dataset(args.a).with_syscalls()
+    b = load_dataset(args.b).with_syscalls()
+
+    print_report(stdout, compare(a, b, args.limit), args.limit)
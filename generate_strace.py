@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+Generate a synthetic filtered strace log of a recursive Make build, in the
+format written by ``strace.sh``. The build consists of a tree of Make
+processes, which run compile jobs (``sh -c`` running ``gcc`` running ``cc1``)
+and sub-makes (``sh -c`` running ``make -C``) with a limited number of job
+slots each. The log is generated with a discrete event simulation, so it is
+written in order of time without keeping the whole log in memory.
+"""
+
+from argparse import ArgumentParser, FileType
+import heapq
+from math import ceil
+import random
+from sys import stdout
+
+# Start time of the build, in microseconds after midnight. The log must not
+# cross midnight, since strace does not output the date.
+START_TIME = 10 * 3600 * 1000000
+
+COMPILERS = [('/usr/bin/gcc', 'gcc', '/usr/lib/gcc/cc1', 'cc1', '.c'),
+             ('/usr/bin/g++', 'g++', '/usr/lib/gcc/cc1plus', 'cc1plus',
+              '.cpp')]
+
+CLONE_FLAGS = 'CLONE_CHILD_CLEARTID|CLONE_CHILD_SETTID|SIGCHLD'
+
+
+def format_time(us):
+    s, us = divmod(us, 1000000)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return '%02d:%02d:%02d.%06d' % (h, m, s, us)
+
+
+def format_argv(argv):
+    return '[%s]' % ', '.join('"%s"' % arg for arg in argv)
+
+
+class Generator(object):
+    """
+    Discrete event simulation of a build, which writes the strace log lines of
+    the processes to ``fd``. Events are ``(time, sequence, function, args)``
+    tuples on a heap, and ``function(time, *args)`` is called at ``time``.
+    Lines are only written for the time of the current event, so the log is
+    in order of time.
+    """
+
+    def __init__(self, fd, jobs=12, split=0.3, argv_length=20,
+                 mean_duration=200, seed=None):
+        self.fd = fd
+        self.jobs = jobs
+        self.split = split
+        self.argv_length = argv_length
+        self.mean_duration = mean_duration
+        self.random = random.Random(seed)
+        self.events = []
+        self.sequence = 0
+        self.next_pid = 1000
+        self.lines = 0
+
+    def push(self, time, function, *args):
+        self.sequence += 1
+        heapq.heappush(self.events, (time, self.sequence, function, args))
+
+    def write(self, time, pid, line):
+        self.fd.write('%d %s %s\n' % (pid, format_time(time), line))
+        self.lines += 1
+
+    def delay(self, low=100, high=2000):
+        """
+        Return a short random delay in microseconds.
+        """
+        return self.random.randint(low, high)
+
+    def execve(self, time, pid, path, argv):
+        """
+        Write the ``execve`` of a process, which is split into an unfinished
+        and a resumed line with probability ``split``.
+        """
+        call = 'execve("%s", %s, [/* 42 vars */]' % (path, format_argv(argv))
+
+        if self.random.random() < self.split:
+            self.write(time, pid, call + ' <unfinished ...>')
+            # Resumed before the process does anything else (see fork).
+            self.push(time + self.delay(10, 90), self.write, pid,
+                      '<... execve resumed> ) = 0')
+        else:
+            self.write(time, pid, call + ') = 0')
+
+    def fork(self, time, parent, path, argv, body, done):
+        """
+        Start a child process of ``parent`` with a ``vfork`` or ``clone``.
+        After its ``execve``, ``body(time, pid, done)`` is called, which must
+        eventually let the child exit.
+        """
+        self.next_pid += 1
+        child = self.next_pid
+        exec_time = time + self.delay()
+
+        if self.random.random() < 0.5:
+            self.write(time, parent, 'clone(child_stack=0, flags=%s, '
+                       'child_tidptr=0x7f) = %d' % (CLONE_FLAGS, child))
+        elif self.random.random() < self.split:
+            self.write(time, parent, 'vfork( <unfinished ...>')
+            self.push(exec_time + self.delay(10, 200), self.write, parent,
+                      '<... vfork resumed> ) = %d' % child)
+        else:
+            self.write(time, parent, 'vfork() = %d' % child)
+
+        self.push(exec_time, self.execve, child, path, argv)
+        self.push(exec_time + self.delay(), body, child, done)
+
+    def exit(self, time, pid, done):
+        self.write(time, pid, 'exit_group(0)                     = ?')
+
+        if done is not None:
+            self.push(time + self.delay(), done)
+
+    def run_child(self, path, argv, body):
+        """
+        Return the body of a process that runs a single child process and
+        exits after it (e.g. ``sh -c``).
+        """
+        def run(time, pid, done):
+            self.fork(time, pid, path, argv, body,
+                      lambda time: self.exit(time, pid, done))
+
+        return run
+
+    def compile_job(self, path):
+        """
+        Return the body of ``sh -c 'gcc ... file.c'``, with its command line.
+        """
+        gcc_path, gcc, cc1_path, cc1, ext = self.random.choice(COMPILERS)
+        source = '%s/file%d%s' % (path, self.sequence, ext)
+        flags = ['-I%s/include%d' % (path, i) if i % 2 else '-DOPTION_%d=1' % i
+                 for i in xrange(self.argv_length)]
+        gcc_argv = [gcc, '-c', '-O2'] + flags + [source]
+        cc1_argv = [cc1, '-quiet'] + flags + [source, '-o', '/tmp/ccXyZ.s']
+        duration = int(self.random.expovariate(1.0 / self.mean_duration)
+                       * 1000) + 2000
+
+        def cc1_body(time, pid, done):
+            self.push(time + duration, self.exit, pid, done)
+
+        gcc_body = self.run_child(cc1_path, cc1_argv, cc1_body)
+        sh_body = self.run_child(gcc_path, gcc_argv, gcc_body)
+
+        return sh_body, ['/bin/sh', '-c', ' '.join(gcc_argv)]
+
+    def sub_make(self, path, jobs):
+        """
+        Return the body of ``sh -c 'make -C dir'``, with its command line.
+        """
+        argv = ['make', '-C', path]
+        sh_body = self.run_child('/usr/bin/make', argv,
+                                 self.make_body(path, jobs))
+
+        return sh_body, ['/bin/sh', '-c', ' '.join(argv)]
+
+    def make_body(self, path, jobs):
+        """
+        Return the body of a Make process, which runs its jobs with at most
+        ``self.jobs`` jobs at once. ``jobs`` is a list of compile jobs
+        (``None``) and sub-makes (lists of their jobs).
+        """
+        def run(time, pid, done):
+            state = {'running': 0, 'next': 0}
+
+            def job_done(time):
+                state['running'] -= 1
+                start_jobs(time)
+
+            def start_job(time, job):
+                if job is None:
+                    body, argv = self.compile_job(path)
+                else:
+                    body, argv = self.sub_make('%s/dir%d' % (path,
+                                               self.sequence), job)
+
+                self.fork(time, pid, '/bin/sh', argv, body, job_done)
+
+            def start_jobs(time):
+                while state['running'] < self.jobs \
+                        and state['next'] < len(jobs):
+                    time += self.delay(50, 500)
+                    self.push(time, start_job, jobs[state['next']])
+                    state['next'] += 1
+                    state['running'] += 1
+
+                if not state['running'] and state['next'] == len(jobs):
+                    self.push(time + self.delay(), self.exit, pid, done)
+
+            start_jobs(time)
+
+        return run
+
+    def run(self, jobs):
+        """
+        Write the log of a build with the given tree of jobs (see
+        ``make_body``). Returns the number of lines.
+        """
+        self.next_pid += 1
+        root = self.next_pid
+        self.execve(START_TIME, root, '/usr/bin/make',
+                    ['make', '-sj%d' % self.jobs])
+        self.push(START_TIME + self.delay(), self.make_body('/src', jobs),
+                  root, None)
+
+        while self.events:
+            time, sequence, function, args = heapq.heappop(self.events)
+            function(time, *args)
+
+        return self.lines
+
+
+def build_tree(processes, depth, jobs_per_make):
+    """
+    Return a tree of jobs (see ``Generator.make_body``) with about the given
+    number of processes. Every compile job consists of three processes and
+    every sub-make of two. The Make processes form a tree of the given depth.
+    """
+    makes = max(1, processes // (3 * jobs_per_make + 2))
+    branching = max(1, int(ceil(makes ** (1.0 / depth)))) if depth else 0
+    trees = [[] for i in xrange(makes)]
+
+    # Link the Make processes in breadth-first order.
+    for i in xrange(1, makes):
+        trees[(i - 1) // branching].append(trees[i])
+
+    compile_jobs = max(1, (processes - 2 * (makes - 1)) // 3)
+
+    for i in xrange(compile_jobs):
+        trees[i % makes].append(None)
+
+    return trees[0]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-o', '--output', type=FileType('w'), default=stdout,
+                        help='The strace log file to write. The default output' \
+                        ' file is stdout.')
+    parser.add_argument('-n', '--processes', type=int, default=10000,
+                        help='Approximate number of processes. The default is' \
+                        ' ``10000``.')
+    parser.add_argument('-d', '--depth', type=int, default=3,
+                        help='Nesting depth of recursive Make processes. The' \
+                        ' default is ``3``.')
+    parser.add_argument('-j', '--jobs', type=int, default=12,
+                        help='Number of job slots of each Make process. The' \
+                        ' default is ``12``.')
+    parser.add_argument('--jobs-per-make', type=int, default=50,
+                        help='Number of compile jobs per Make process. The' \
+                        ' default is ``50``.')
+    parser.add_argument('--split', type=float, default=0.3,
+                        help='Share of ``execve`` and ``vfork`` calls that are' \
+                        ' split into an ``<unfinished ...>`` and a' \
+                        ' ``resumed`` line. The default is ``0.3``.')
+    parser.add_argument('--argv-length', type=int, default=20,
+                        help='Number of compiler flags in each compile' \
+                        ' command. The default is ``20``.')
+    parser.add_argument('--duration', type=float, default=200,
+                        help='Mean duration of a compile job, in' \
+                        ' milliseconds. The default is ``200``.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of the random generator, to generate the' \
+                        ' same log again.')
+    args = parser.parse_args()
+
+    generator = Generator(args.output, args.jobs, args.split,
+                          args.argv_length, args.duration, args.seed)
+    generator.run(build_tree(args.processes, args.depth, args.jobs_per_make))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Static index of time intervals, used by the viewer to select the processes
+that are visible in a viewport.
+"""
+
+
+class IntervalIndex(object):
+    """
+    Index of ``(start, end, key)`` intervals. The intervals are sorted by their
+    start time and stored as an implicit balanced binary search tree: the root
+    of the range ``[lo, hi)`` is its middle element. Each node is augmented
+    with the maximal end time of its subtree, so subtrees that end before the
+    query interval are skipped. A query costs ``O(log n)`` plus the work for
+    the reported intervals.
+    """
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+
+        self.starts = [i[0] for i in intervals]
+        self.ends = [i[1] for i in intervals]
+        self.keys = [i[2] for i in intervals]
+        self.max_ends = list(self.ends)
+
+        self.build(0, len(intervals))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def build(self, lo, hi):
+        """
+        Calculate the maximal end time of the subtree of range ``[lo, hi)``.
+        """
+        if lo >= hi:
+            return None
+
+        mid = (lo + hi) // 2
+        max_end = max(self.ends[mid], self.build(lo, mid),
+                      self.build(mid + 1, hi))
+        self.max_ends[mid] = max_end
+
+        return max_end
+
+    def overlap(self, start, end):
+        """
+        Return the keys of all intervals that overlap the inclusive interval
+        ``[start, end]``, in order of their start time.
+        """
+        result = []
+        stack = [(0, len(self.keys))]
+
+        while stack:
+            lo, hi = stack.pop()
+
+            if lo >= hi:
+                continue
+
+            mid = (lo + hi) // 2
+
+            # No interval in this subtree ends after the start of the query.
+            if self.max_ends[mid] < start:
+                continue
+
+            # Intervals right of mid start after mid, so they are only
+            # visited if mid itself starts before the end of the query.
+            if self.starts[mid] <= end:
+                stack.append((mid + 1, hi))
+
+                if self.ends[mid] >= start:
+                    result.append(mid)
+
+            stack.append((lo, mid))
+
+        result.sort()
+
+        return [self.keys[i] for i in result]
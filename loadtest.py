@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+"""
+Load test of the viewer with many concurrent viewers. Every viewer is a thread
+with a keep-alive connection that does what the page of a dataset does in a
+browser, over and over: it requests the page, the catalog, a view of the whole
+build, a few zoomed in views at random positions, the analysis and the syscalls
+of some of the processes on the critical path (and optionally the dataset
+file). The viewers are spread over several client processes, so the client is
+not limited by the global interpreter lock.
+
+The throughput and the latency percentiles of every kind of request are
+reported. Start the viewer first, or let the load test start it:
+
+  ./loadtest.py --start serve -c 128 -t 30 bsa.json
+  ./loadtest.py --start dev -c 128 -t 30 bsa.json
+
+The dataset has to be in the data directory of the viewer.
+"""
+
+from argparse import ArgumentParser, FileType
+import httplib
+from multiprocessing import Pool
+import os
+import random
+import shlex
+from subprocess import Popen
+import sys
+from threading import Thread
+from time import sleep, time
+import urlparse
+import zlib
+
+import simplejson as json
+
+# Width of the waterfall in pixels, as in the browser.
+WIDTH = 1000
+
+# Number of zoomed in views, syscalls of processes and positions of the zoomed
+# in views (the views at the same position are cached by the viewer).
+ZOOMS = 3
+PROCESSES = 3
+POSITIONS = 50
+
+
+class Viewer(Thread):
+    """
+    A viewer that repeats its requests until ``deadline``. Every request is
+    recorded in ``samples`` as a ``(kind, latency, status, size)`` tuple.
+    """
+
+    def __init__(self, url, dataset, deadline, think, data, seed):
+        Thread.__init__(self)
+        self.daemon = True
+        parts = urlparse.urlsplit(url)
+        self.host = parts.netloc
+        self.base = parts.path.rstrip('/')
+        self.dataset = dataset
+        self.deadline = deadline
+        self.think = think
+        self.data = data
+        self.random = random.Random(seed)
+        self.samples = []
+        self.connection = None
+
+    def get(self, kind, path):
+        start = time()
+
+        # A request on a keep-alive connection that the server has closed
+        # (e.g. because it was idle) is sent again on a new connection, as
+        # browsers do.
+        for attempt in xrange(2):
+            reused = self.connection is not None
+
+            if not reused:
+                self.connection = httplib.HTTPConnection(self.host,
+                                                         timeout=60)
+
+            try:
+                self.connection.request('GET', self.base + path,
+                                        headers={'Accept-Encoding': 'gzip'})
+                response = self.connection.getresponse()
+                body = response.read()
+                status = response.status
+                encoding = response.getheader('Content-Encoding')
+                break
+            except (httplib.HTTPException, IOError):
+                self.connection.close()
+                self.connection = None
+                body, status, encoding = '', 0, None
+
+                if not reused:
+                    break
+
+        self.samples.append((kind, time() - start, status, len(body)))
+
+        if self.think:
+            sleep(self.random.uniform(0, 2 * self.think))
+
+        return status, body, encoding
+
+    def get_json(self, kind, path):
+        status, body, encoding = self.get(kind, path)
+
+        if status != 200:
+            return None
+
+        if encoding == 'gzip':
+            body = decompress(body)
+
+        return json.loads(body)
+
+    def run(self):
+        name = self.dataset
+
+        while time() < self.deadline:
+            self.get('index', '/?dataset=' + name)
+            end = self.wall_time()
+
+            if end is None:
+                continue
+
+            self.get('view', '/view/%s/0/%d/%r/0.1' % (
+                    name, end, float(WIDTH) / (end or 1)))
+
+            for i in xrange(ZOOMS):
+                width = end // 10 or 1
+                start = self.random.randrange(POSITIONS) * (end - width) \
+                        // POSITIONS
+                self.get('zoom', '/view/%s/%d/%d/%r/0.1' % (
+                        name, start, start + width, float(WIDTH) / width))
+
+            # The processes are chosen from the critical path, so the client
+            # does not have to decode the (large) view.
+            analysis = self.get_json('analysis', '/analysis/' + name)
+
+            if analysis:
+                pids = [p['pid'] for p in analysis['critical_path']]
+
+                for pid in self.random.sample(pids, min(PROCESSES,
+                                                        len(pids))):
+                    self.get('process', '/process/%s/%s' % (name, pid))
+
+            if self.data:
+                self.get('data', '/data/' + name)
+
+    def wall_time(self):
+        """
+        Return the end time of the build, from the catalog entry of the
+        dataset.
+        """
+        catalog = self.get_json('catalog', '/catalog') or []
+
+        for entry in catalog:
+            if entry['name'] == self.dataset:
+                return int(entry['wall_time'])
+
+
+def decompress(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def run_viewers(args):
+    """
+    Run ``count`` viewers in this process until ``deadline``, and return the
+    samples of all of them.
+    """
+    url, dataset, count, deadline, think, data, seed = args
+    viewers = [Viewer(url, dataset, deadline, think, data, seed + i)
+               for i in xrange(count)]
+
+    for viewer in viewers:
+        viewer.start()
+
+    for viewer in viewers:
+        viewer.join()
+
+    return [sample for viewer in viewers for sample in viewer.samples]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(samples, duration):
+    """
+    Return the number of requests and errors, the throughput and the latency
+    percentiles per kind of request, and of all requests (``total``).
+    """
+    kinds = {}
+
+    for sample in samples:
+        kinds.setdefault(sample[0], []).append(sample)
+        kinds.setdefault('total', []).append(sample)
+
+    result = {}
+
+    for kind, kind_samples in kinds.iteritems():
+        latencies = sorted(s[1] for s in kind_samples)
+        result[kind] = {
+            'requests': len(kind_samples),
+            'errors': sum(1 for s in kind_samples if s[2] not in (200, 304)),
+            'requests_per_second': len(kind_samples) / duration,
+            'bytes': sum(s[3] for s in kind_samples),
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1],
+        }
+
+    return result
+
+
+def print_results(fd, result):
+    print >>fd, '%-10s %9s %7s %9s %9s %9s %9s %9s' % ('Request',
+            'Requests', 'Errors', 'Req/s', 'p50 (s)', 'p95 (s)', 'p99 (s)',
+            'Max (s)')
+
+    for kind in sorted(result, key=lambda k: (k == 'total', k)):
+        r = result[kind]
+        print >>fd, '%-10s %9d %7d %9.1f %9.3f %9.3f %9.3f %9.3f' % (kind,
+                r['requests'], r['errors'], r['requests_per_second'],
+                r['p50'], r['p95'], r['p99'], r['max'])
+
+
+def start_server(mode, url, server_args):
+    """
+    Start ``viewer.py`` in the given mode (``serve`` or ``dev``) on the port
+    of ``url``, and wait until it responds.
+    """
+    parts = urlparse.urlsplit(url)
+    port = str(parts.port or 80)
+    viewer = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'viewer.py')
+    if mode == 'serve':
+        command = [sys.executable, viewer, 'serve', port] \
+                + shlex.split(server_args)
+    else:
+        command = [sys.executable, viewer, port]
+
+    server = Popen(command)
+
+    for i in xrange(100):
+        try:
+            connection = httplib.HTTPConnection(parts.netloc, timeout=1)
+            connection.request('GET', parts.path.rstrip('/') + '/catalog')
+            connection.getresponse().read()
+            return server
+        except (httplib.HTTPException, IOError):
+            if server.poll() is not None:
+                break
+
+            sleep(0.1)
+
+    server.terminate()
+    raise RuntimeError('The viewer did not start.')
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('dataset', metavar='NAME',
+                        help='File name of a dataset in the data directory' \
+                        ' of the viewer.')
+    parser.add_argument('--url', default='http://localhost:8080/viewer.py',
+                        help='Base URL of the viewer. The default is' \
+                        ' ``http://localhost:8080/viewer.py``.')
+    parser.add_argument('-c', '--concurrency', type=int, default=128,
+                        help='Number of concurrent viewers. The default is' \
+                        ' ``128``.')
+    parser.add_argument('-t', '--time', type=float, default=30,
+                        help='Duration of the test in seconds. The default' \
+                        ' is ``30``.')
+    parser.add_argument('-p', '--processes', type=int, default=4,
+                        help='Number of client processes. The default is' \
+                        ' ``4``.')
+    parser.add_argument('--think', type=float, default=0,
+                        help='Mean number of seconds that a viewer waits' \
+                        ' after every request. The default is ``0``.')
+    parser.add_argument('--data', action='store_true',
+                        help='Also request the dataset file, as the viewer' \
+                        ' does for columnar datasets.')
+    parser.add_argument('--start', choices=['serve', 'dev'],
+                        help='Start the viewer on the port of the URL with' \
+                        ' ``viewer.py serve`` or the development server, and' \
+                        ' stop it after the test. Run the load test in the' \
+                        ' directory of the viewer.')
+    parser.add_argument('--server-args', default='',
+                        help='Options of ``viewer.py serve`` for' \
+                        ' ``--start serve``, e.g. ``"-w 4"``.')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Seed of the random positions of the views.' \
+                        ' The default is ``1``.')
+    parser.add_argument('--json', type=FileType('w'),
+                        help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    server = None
+
+    if args.start:
+        server = start_server(args.start, args.url, args.server_args)
+
+    try:
+        processes = max(1, min(args.processes, args.concurrency))
+        pool = Pool(processes)
+        deadline = time() + args.time
+        start = time()
+        jobs = [(args.url, args.dataset,
+                 args.concurrency // processes
+                 + (i < args.concurrency % processes),
+                 deadline, args.think, args.data, args.seed + i * 1000)
+                for i in xrange(processes)]
+        samples = [s for result in pool.map(run_viewers, jobs)
+                   for s in result]
+        duration = time() - start
+        pool.close()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    result = summarize(samples, duration)
+    print_results(sys.stdout, result)
+
+    if args.json:
+        json.dump(result, args.json, indent=2)
+
+
+if __name__ == '__main__':
+    main()
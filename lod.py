@@ -0,0 +1,195 @@
+"""
+Level of detail pyramid of a dataset. For a number of zoom levels, the
+processes that are narrower than one pixel are merged with their sub-pixel
+siblings into summary bars, and the resulting bars are divided into tiles of a
+fixed width in pixels. The viewer serves the tiles of the level that matches
+the requested scale, so the number of bars depends on the number of pixels on
+screen instead of the number of processes.
+
+Bars have the same fields as processes (without syscalls and children). Summary
+bars have type ``summary`` and the additional fields ``count`` (number of
+merged processes, including their descendants), ``types`` (number of merged
+processes per type) and ``total`` (sum of their durations).
+"""
+
+import simplejson as json
+
+# Scales of the zoom levels in pixels per millisecond, from fine to coarse. The
+# finest level is coarser than the scale of ``default_viewport`` in config.py,
+# so the first view of a dataset shows its processes instead of summary bars.
+SCALES = [1.0 / 100, 1.0 / 1000, 1.0 / 10000, 1.0 / 100000]
+
+# Width of a tile in pixels.
+TILE_WIDTH = 4096
+
+
+def subtree_sizes(processes, root):
+    """
+    Calculate the number of processes in the subtree of each process.
+    """
+    sizes = {}
+    order = []
+    stack = [root]
+
+    while stack:
+        pid = stack.pop()
+        order.append(pid)
+        stack.extend(c for c in processes[pid]['children'] if c in processes)
+
+    # Children are visited after their parent, so walk back to front.
+    for pid in reversed(order):
+        sizes[pid] = 1 + sum(sizes[c] for c in processes[pid]['children']
+                             if c in sizes)
+
+    return sizes
+
+
+def process_bar(pid, process):
+    bar = {'id': pid, 'parent': process['parent'], 'type': process['type'],
+           'start': process['start'], 'end': process['end'],
+           'duration': process['duration']}
+
+    if 'rusage' in process:
+        bar['rusage'] = process['rusage']
+
+    if 'host' in process:
+        bar['host'] = process['host']
+
+    return bar
+
+
+def aggregate(processes, root, scale, sizes):
+    """
+    Return the bars of the zoom level with the given scale. Children that last
+    less than one pixel are merged into a summary bar with their sub-pixel
+    siblings that start at most one pixel after the end of the summary.
+    """
+    min_duration = 1 / scale
+    bars = [process_bar(root, processes[root])]
+    stack = [root]
+
+    while stack:
+        pid = stack.pop()
+        children = sorted((processes[c]['start'], c)
+                          for c in processes[pid]['children']
+                          if c in processes)
+        summary = None
+
+        for start, c in children:
+            child = processes[c]
+
+            if child['duration'] >= min_duration:
+                bars.append(process_bar(c, child))
+                stack.append(c)
+                continue
+
+            if summary is None or start > summary['end'] + min_duration:
+                summary = {'id': 's%d' % len(bars), 'parent': pid,
+                           'type': 'summary', 'start': start,
+                           'end': child['end'], 'count': 0, 'types': {},
+                           'total': 0}
+                bars.append(summary)
+
+            summary['end'] = max(summary['end'], child['end'])
+            summary['duration'] = summary['end'] - summary['start']
+            summary['count'] += sizes[c]
+            summary['total'] += child['duration']
+            summary['types'][child['type']] = \
+                    summary['types'].get(child['type'], 0) + 1
+
+    return bars
+
+
+def build_pyramid(processes, root, scales=SCALES, tile_width=TILE_WIDTH):
+    """
+    Build the pyramid of a dataset. ``processes`` maps pids to processes (the
+    ``root`` item is not required).
+    """
+    sizes = subtree_sizes(processes, root)
+    levels = []
+
+    for scale in scales:
+        span = int(tile_width / scale)
+        tiles = {}
+
+        for bar in aggregate(processes, root, scale, sizes):
+            for i in xrange(bar['start'] // span, bar['end'] // span + 1):
+                tiles.setdefault(i, []).append(bar)
+
+        levels.append({'scale': scale, 'span': span, 'tiles': tiles})
+
+    return Pyramid(root, levels)
+
+
+class Pyramid(object):
+
+    def __init__(self, root, levels):
+        self.root = root
+        self.levels = levels
+
+    def level(self, scale):
+        """
+        Return the finest level that is not finer than ``scale``, or ``None``
+        if the scale is finer than the finest level.
+        """
+        if scale > self.levels[0]['scale']:
+            return None
+
+        for level in self.levels:
+            if level['scale'] <= scale:
+                return level
+
+        return self.levels[-1]
+
+    def view(self, start, end, scale, threshold):
+        """
+        Select the bars of the level for ``scale`` that overlap ``[start,
+        end]``, in the same structure as ``Dataset.view``. Processes shorter
+        than ``threshold`` seconds are left out (summary bars are kept).
+        """
+        level = self.level(scale)
+        span = level['span']
+        threshold *= 1000
+        bars = {}
+
+        for i in xrange(start // span, end // span + 1):
+            for bar in level['tiles'].get(i, ()):
+                if bar['end'] < start or bar['start'] > end:
+                    continue
+
+                if bar['type'] != 'summary' and bar['duration'] < threshold:
+                    continue
+
+                bars[bar['id']] = bar
+
+        children = {}
+
+        for bar in sorted(bars.itervalues(), key=lambda bar: bar['start']):
+            children.setdefault(bar['parent'], []).append(bar['id'])
+
+        # Only return the bars that are connected to the root.
+        processes = {'root': self.root}
+        stack = [self.root] if self.root in bars else []
+
+        while stack:
+            pid = stack.pop()
+            processes[pid] = dict(bars[pid], children=children.get(pid, []))
+            stack.extend(processes[pid]['children'])
+
+        return processes
+
+
+def dump_pyramid(fd, pyramid):
+    json.dump({'version': 1, 'root': pyramid.root,
+               'levels': pyramid.levels}, fd)
+
+
+def load_pyramid(path):
+    with open(path) as fd:
+        data = json.load(fd)
+
+    for level in data['levels']:
+        level['tiles'] = dict((int(i), tile)
+                              for i, tile in level['tiles'].iteritems())
+
+    return Pyramid(data['root'], data['levels'])
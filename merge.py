@@ -0,0 +1,198 @@
+"""
+Merge of the strace logs of a build that runs jobs on several hosts, e.g. with
+distcc, icecream or ssh. The log of the host that runs Make only shows the
+wrapper process of a remote job, which waits while the job runs on another
+host. The processes of the job are taken from the log of that host and moved
+below the wrapper, so the combined process tree shows where the time went.
+
+A remote job is matched with its wrapper by its command: the command of the
+remote process (with its executable as a base name, and temporary file names
+and numbers normalized as in ``diff``) is the end of the command of the
+wrapper, e.g. ``gcc -c a.c`` for ``ssh host gcc -c a.c``. Wrappers and remote
+processes with the same command are matched in order of their start time.
+
+Every matched job is a request from the local host (sent at the start of the
+wrapper, ``t1``) that is received by the remote host (at the start of the job,
+``t2``) and answered when the job ends (``t3``), after which the wrapper ends
+(``t4``). As in NTP, the clock offset of the remote host is ``((t2 - t1) +
+(t3 - t4)) / 2``, which is exact if the request and the response take the
+same time. The offset is the median of the offsets of the quarter of the jobs
+with the shortest round trip time ``(t4 - t1) - (t3 - t2)``, which have the
+smallest error.
+
+The pids of the processes of a host are unique on that host only, so the pids
+of the ``n``-th merged host get ``n << HOST_PID_BITS`` added. Every process
+gets the name of its ``host``. Processes of the merged hosts that are not part
+of a remote job (e.g. the daemon that runs the jobs) are left out.
+"""
+
+import posixpath
+from sys import stderr
+
+from analysis import host_utilization, iter_items, last_command
+from backend.common import Syscall
+from database import command_arguments
+from diff import NORMALIZE_PATTERNS
+
+# Number of bits of a pid on Linux (the maximum of ``pid_max`` is 2 ** 22).
+HOST_PID_BITS = 22
+
+# Number of milliseconds in a day.
+DAY = 24 * 3600 * 1000
+
+
+def job_key(args):
+    """
+    Return the key by which a remote job is matched: its normalized command.
+    """
+    first, _, rest = ' '.join(args).strip().partition(' ')
+    key = posixpath.basename(first) + (' ' + rest if rest else '')
+
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        key = pattern.sub(replacement, key)
+
+    return key
+
+
+def match_jobs(processes, remote):
+    """
+    Return the ``(wrapper pid, job pid)`` pairs of the processes of the remote
+    host that were started by the local processes (see the module docstring).
+    """
+    candidates = {}
+
+    for pid, process in iter_items(remote):
+        executable, args = command_arguments(last_command(process))
+
+        if args:
+            candidates.setdefault(job_key(args), []).append(pid)
+
+    programs = set(key.partition(' ')[0] for key in candidates)
+    wrappers = {}
+
+    for pid, process in iter_items(processes):
+        executable, args = command_arguments(last_command(process))
+
+        for i in xrange(1, len(args)):
+            program = posixpath.basename(args[i].partition(' ')[0])
+
+            if program in programs:
+                key = job_key(args[i:])
+
+                if key in candidates:
+                    wrappers.setdefault(key, []).append(pid)
+                    break
+
+    pairs = []
+
+    for key, pids in wrappers.iteritems():
+        pids.sort(key=lambda pid: processes[pid]['start'])
+        candidates[key].sort(key=lambda pid: remote[pid]['start'])
+        pairs.extend(zip(pids, candidates[key]))
+
+    return pairs
+
+
+def clock_offset(pairs, processes, remote, shift=0):
+    """
+    Estimate the offset of the clock of the remote host from the matched jobs,
+    after the times of the remote host have been shifted by ``shift``
+    milliseconds. Returns 0 if no jobs are matched.
+    """
+    samples = []
+
+    for wrapper, job in pairs:
+        t1, t4 = processes[wrapper]['start'], processes[wrapper]['end']
+        t2, t3 = remote[job]['start'] + shift, remote[job]['end'] + shift
+        samples.append(((t4 - t1) - (t3 - t2), ((t2 - t1) + (t3 - t4)) / 2.0))
+
+    # A negative round trip time means that the job was not matched with its
+    # wrapper, or that the clocks of the hosts run at a different rate.
+    samples = sorted([s for s in samples if s[0] >= 0] or samples)
+
+    if not samples:
+        return 0
+
+    offsets = sorted(offset for delay, offset
+                     in samples[:max(1, len(samples) // 4)])
+
+    return int(round(offsets[len(offsets) // 2]))
+
+
+def graft(processes, wrapper, remote, job, host, number, shift):
+    """
+    Copy the process ``job`` of the remote host and its descendants into
+    ``processes`` below the process ``wrapper``, with their pids made unique
+    and their times shifted by ``shift`` milliseconds.
+    """
+    offset = number << HOST_PID_BITS
+    processes[wrapper]['children'].append(offset + job)
+    stack = [job]
+
+    while stack:
+        pid = stack.pop()
+        process = dict(remote[pid])
+        children = [c for c in process['children'] if c in remote]
+        stack.extend(children)
+
+        process['host'] = host
+        process['parent'] = wrapper if pid == job else \
+                offset + process['parent']
+        process['children'] = [offset + c for c in children]
+        process['start'] += shift
+        process['end'] += shift
+        process['syscalls'] = [Syscall(s.start + shift, s.cmd,
+                                       s.end + shift if s.end else 0,
+                                       s.duration)
+                               for s in process['syscalls']]
+
+        processes[offset + pid] = process
+
+
+def merge_hosts(processes, zero_time, host, remotes, properties):
+    """
+    Merge the processes of the remote hosts into ``processes``, the processes
+    of the host ``host`` whose log started at ``zero_time``. ``remotes`` is a
+    list of ``(host, processes, zero time)`` tuples, see
+    ``backend.strace.parse_log``. The hosts, their clock offsets, number of
+    remote jobs and utilization are added to the properties as ``hosts``.
+    """
+    for pid, process in iter_items(processes):
+        process['host'] = host
+
+    offsets = {host: 0}
+    counts = {host: 0}
+
+    for number, (name, remote, remote_zero) in enumerate(remotes, 1):
+        shift = remote_zero - zero_time
+
+        # Times of day (strace -tt) of hosts whose logs started on different
+        # days are a day apart, and epoch times (strace -ttt) of the other
+        # host are compared by their time of day. The rest of the offset of
+        # the clocks (e.g. another time zone) is estimated from the jobs.
+        if remote_zero < DAY or zero_time < DAY:
+            shift = (shift + DAY // 2) % DAY - DAY // 2
+
+        pairs = match_jobs(processes, remote)
+        offset = clock_offset(pairs, processes, remote, shift)
+
+        if not pairs:
+            print >>stderr, 'No remote jobs of host "%s" were found, its' \
+                    ' clock is assumed to be in sync.' % name
+
+        for wrapper, job in pairs:
+            graft(processes, wrapper, remote, job, name, number,
+                  shift - offset)
+
+        offsets[name] = offset
+        counts[name] = len(pairs)
+
+    utilization = host_utilization(processes)
+    properties['hosts'] = []
+
+    for name in [host] + [remote[0] for remote in remotes]:
+        stats = utilization.get(name, {'jobs': 0, 'job_time': 0, 'max': 0,
+                                       'mean': 0.0})
+        stats.update(name=name, clock_offset=offsets[name],
+                     remote_jobs=counts[name])
+        properties['hosts'].append(stats)
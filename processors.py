@@ -1,31 +1,81 @@
 #from models import engine
 #from sqlalchemy.orm import scoped_session, sessionmaker
-import cStringIO
-import gzip
+from hashlib import sha1
 import web
 
+from cache import KeyLocks, LRUCache, cached
+from compress import accepts_encoding, gzip_data
+from config import response_cache_size
+
+# Compressed responses, which map an ETag to the compressed response body.
+compressed_responses = LRUCache(response_cache_size)
+compressing = KeyLocks()
+
 #def load_sqlalchemy(handler):
 #    web.ctx.orm = scoped_session(sessionmaker(bind=engine))
 #    return handler()
 
+def accepts_gzip():
+    """
+    Return whether the client accepts gzip, i.e. whether ``gzip_response``
+    compresses the response.
+    """
+    return accepts_encoding(web.ctx.env.get('HTTP_ACCEPT_ENCODING'), 'gzip')
+
+def check_etag(etag, encoding=None):
+    """
+    Set the ETag header of the response and respond with ``304 Not Modified``
+    if the client has a copy with the same ETag. The ETag of a response that
+    is encoded (by the handler with ``encoding``, otherwise by
+    ``gzip_response``) is suffixed with the encoding, since the encoded body
+    is another representation of the resource.
+    """
+    if encoding is None and accepts_gzip():
+        encoding = 'gzip'
+
+    if encoding:
+        etag = '%s-%s"' % (etag[:-1], encoding)
+
+    web.webapi.header('ETag', etag)
+    web.webapi.header('Vary', 'Accept-Encoding', unique=True)
+
+    if web.ctx.env.get('HTTP_IF_NONE_MATCH', None) == etag:
+        raise web.notmodified()
+
+def response_header(name):
+    name = name.lower()
+
+    for key, value in web.ctx.headers:
+        if key.lower() == name:
+            return value
+
 def gzip_response(handler):
     resp = handler()
 
-    accepts = web.ctx.env.get('HTTP_ACCEPT_ENCODING', None)
-
-    if not accepts or accepts.find('gzip') == -1:
-        return resp 
+    # Responses that are compressed already (e.g. pre-compressed datasets),
+    # and streamed responses.
+    if response_header('Content-Encoding') or hasattr(resp, 'next'):
+        return resp
 
     resp = str(resp)
 
+    # Handlers can set an ETag derived from their arguments (see
+    # ``check_etag``). Otherwise, the ETag is derived from the response body.
+    etag = response_header('ETag')
+
+    if not etag:
+        check_etag('"%s"' % sha1(resp).hexdigest())
+        etag = response_header('ETag')
+
+    if not accepts_gzip():
+        return resp
+
     web.webapi.header('Content-Encoding', 'gzip')
 
-    zbuf = cStringIO.StringIO()
-    zfile = gzip.GzipFile(mode='wb', fileobj=zbuf, compresslevel=9)
-    zfile.write(resp)
-    zfile.close()
-    data = zbuf.getvalue()
+    # zlib releases the global interpreter lock while it compresses, so other
+    # threads are not blocked by the compression of a large response.
+    data = cached(compressed_responses, compressing, etag,
+                  lambda: gzip_data(resp))
 
     web.webapi.header('Content-Length', str(len(data)))
-    web.webapi.header('Vary','Accept-Encoding', unique=True)
     return data
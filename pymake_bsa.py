@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Run PyMake with hooks that log the makes and the commands of their recipes to
+the file in ``$BSA_LOG`` (``pymake.log`` by default), which is converted with
+``convert.py -f pymake``. See ``backend/pymake.py`` for the log format.
+
+The ``pymake`` package is imported from ``$PYMAKE_DIR`` if set, e.g.:
+
+  $ PYMAKE_DIR=/path/to/pymake /path/to/bsa/pymake_bsa.py -sj12
+"""
+
+from itertools import count
+import os
+import sys
+import time
+
+import simplejson as json
+
+# Environment variable with the id of the job that runs a recursive make.
+PARENT_JOB = 'BSA_PARENT_JOB'
+
+
+class EventLog(object):
+    def __init__(self, path):
+        self.fd = open(path, 'a')
+        self.ids = count()
+
+    def new_id(self):
+        return '%d-%d' % (os.getpid(), next(self.ids))
+
+    def write(self, event, **kwargs):
+        kwargs['event'] = event
+        kwargs['time'] = time.time()
+
+        # Every event is written at once, since recursive makes in other
+        # processes append to the same file.
+        self.fd.write(json.dumps(kwargs) + '\n')
+        self.fd.flush()
+
+
+def install(log):
+    """
+    Install the hooks in PyMake's Makefile and job execution.
+    """
+    from pymake import data
+
+    makefile_init = data.Makefile.__init__
+
+    def init(self, *args, **kwargs):
+        makefile_init(self, *args, **kwargs)
+        env = kwargs.get('env') or getattr(self, 'env', None) or os.environ
+        self.bsa_id = log.new_id()
+        log.write('make', id=self.bsa_id, parent=env.get(PARENT_JOB),
+                  cwd=self.workdir)
+
+    data.Makefile.__init__ = init
+
+    getcommandsforrule = data.getcommandsforrule
+
+    def commands(rule, target, makefile, prereqs, stem):
+        for command in getcommandsforrule(rule, target, makefile, prereqs,
+                                          stem):
+            command.bsa = {'make': makefile.bsa_id, 'target': target.target,
+                           'prerequisites': list(prereqs)}
+            yield command
+
+    data.getcommandsforrule = commands
+
+    call = data._CommandWrapper.__call__
+
+    def run(self, cb):
+        job = log.new_id()
+        log.write('start', id=job, command=self.cline,
+                  location=str(self.loc), **getattr(self, 'bsa', {}))
+
+        env = self.kwargs.get('env')
+
+        if env is not None:
+            self.kwargs['env'] = dict(env, **{PARENT_JOB: job})
+
+        def done(*args, **kwargs):
+            log.write('end', id=job, status=kwargs.get('error') and 1 or 0)
+            return cb(*args, **kwargs)
+
+        return call(self, done)
+
+    data._CommandWrapper.__call__ = run
+
+
+if __name__ == '__main__':
+    if 'PYMAKE_DIR' in os.environ:
+        sys.path.insert(0, os.environ['PYMAKE_DIR'])
+
+    import pymake.command
+    import pymake.process
+
+    # Recursive makes in other directories append to the same log.
+    log = os.environ['BSA_LOG'] = os.path.abspath(
+            os.environ.get('BSA_LOG', 'pymake.log'))
+    install(EventLog(log))
+
+    pymake.command.main(sys.argv[1:], os.environ, os.getcwd(), cb=sys.exit)
+    pymake.process.ParallelContext.spin()
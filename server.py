@@ -0,0 +1,86 @@
+"""
+Production server of the viewer, which is started with ``viewer.py serve``.
+Unlike the development server of web.py (``viewer.py [PORT]``), it does not
+reload modules for every request, and it handles many viewers at once:
+
+* Requests are handled by a pool of threads (one per request or keep-alive
+  connection), so a slow request does not block other viewers.
+* The views, analyses and comparisons of datasets are computed by a pool of
+  worker processes (see ``workers``), so they do not stall the threads of the
+  server by holding the global interpreter lock.
+* Large dataset files are sent in chunks while they are read and compressed
+  (see ``viewer.data``), and zlib compresses without holding the global
+  interpreter lock.
+
+Use ``loadtest.py`` to measure the throughput of the server.
+"""
+
+from argparse import ArgumentParser, ArgumentTypeError
+from sys import stderr
+
+import web
+from web.httpserver import LogMiddleware, StaticMiddleware
+from web.wsgiserver import CherryPyWSGIServer
+
+from config import server_threads, worker_processes
+import workers
+
+
+def address(value):
+    try:
+        return web.validip(value)
+    except ValueError:
+        raise ArgumentTypeError('"%s" is not a port or IP:PORT.' % value)
+
+
+def main(app, argv):
+    parser = ArgumentParser(prog='viewer.py serve',
+                            description='Serve the viewer to many concurrent' \
+                            ' clients.')
+    parser.add_argument('address', metavar='ADDRESS', nargs='?',
+                        type=address, default=('0.0.0.0', 8080),
+                        help='Port or IP:PORT to listen on. The default is' \
+                        ' ``8080``.')
+    parser.add_argument('-t', '--threads', type=int, default=server_threads,
+                        help='Number of requests or keep-alive connections' \
+                        ' that are handled at the same time. The default is' \
+                        ' ``%d``.' % server_threads)
+    parser.add_argument('-w', '--workers', type=int,
+                        default=worker_processes,
+                        help='Number of worker processes for views,' \
+                        ' analyses and comparisons of datasets, or ``0`` to' \
+                        ' compute them in the threads of the server. The' \
+                        ' default is ``%d``.' % worker_processes)
+    parser.add_argument('--backlog', type=int, default=256,
+                        help='Number of connections that can wait for a' \
+                        ' thread. The default is ``256``.')
+    parser.add_argument('--timeout', type=int, default=10,
+                        help='Seconds after which idle keep-alive' \
+                        ' connections are closed. The default is ``10``.')
+    parser.add_argument('--access-log', action='store_true',
+                        help='Log every request to stderr.')
+    args = parser.parse_args(argv)
+
+    func = StaticMiddleware(app.wsgifunc())
+
+    if args.access_log:
+        func = LogMiddleware(func)
+
+    # The workers are forked, so they are started before the threads.
+    if args.workers > 0:
+        workers.start(args.workers)
+
+    server = CherryPyWSGIServer(args.address, func, numthreads=args.threads,
+                                server_name='localhost',
+                                request_queue_size=args.backlog,
+                                timeout=args.timeout)
+
+    print >>stderr, 'http://%s:%d/ (%d threads, %d workers)' % (
+            args.address + (args.threads, args.workers))
+
+    try:
+        server.start()
+    except (KeyboardInterrupt, SystemExit):
+        server.stop()
+    finally:
+        workers.stop()
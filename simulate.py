@@ -0,0 +1,333 @@
+"""
+Simulation of a recorded build with a different number of job slots (the
+``-j`` option of Make), to predict its wall time and utilization.
+
+The recorded process tree is turned into a schedule model:
+
+* The jobs of a Make process are its children. A job that does not run
+  another Make process occupies a job slot for its recorded duration. A job
+  that does run a Make process (e.g. ``sh -c 'make -C dir'``) does not occupy
+  a slot, but finishes after the Make processes in it have finished.
+* A Make process finishes after all of its jobs have finished, plus the
+  recorded time between the end of its last job and its own end.
+* A job that started while all slots were occupied in the recorded build was
+  waiting for a slot, so it is assumed to be ready together with the previous
+  job of the same Make process. Otherwise, a job depends on the job of the
+  same Make process that ended last before it started (keeping the recorded
+  gap between both), or it is started at its recorded offset from the start
+  of its Make process.
+* Make processes within a job either depend on the Make process that ended
+  before they started, or are started at their recorded offset in the job.
+
+The model is replayed with a list scheduler that starts ready jobs as soon as
+a slot is free, in the order of the given policy.
+"""
+
+from bisect import bisect_left
+import heapq
+
+from analysis import concurrency, profile
+
+# Numbers of job slots that are simulated by default.
+DEFAULT_SLOTS = [4, 8, 16, 32, 64]
+
+POLICIES = ['fifo', 'longest']
+
+
+class Node(object):
+    """
+    Job or Make process in the schedule model. ``trigger`` is a ``(node,
+    event, delay)`` tuple: the node becomes ready ``delay`` milliseconds after
+    ``event`` (``ready`` or ``finish``) of ``node``.
+    """
+    __slots__ = ('pid', 'start', 'end', 'duration', 'uses_slot', 'trigger',
+                 'children', 'tail', 'owner', 'dependents', 'pending',
+                 'ready_time', 'finish_time')
+
+    def __init__(self, pid, process, uses_slot):
+        self.pid = pid
+        self.start = process['start']
+        self.end = process['end']
+        self.duration = process['duration']
+        self.uses_slot = uses_slot
+        self.trigger = None
+        self.children = []
+        self.tail = 0
+        self.owner = None
+        self.dependents = {'ready': [], 'finish': []}
+
+
+def outer_makes(processes, pid):
+    """
+    Return the Make processes in the subtree of ``pid`` (excluding ``pid``)
+    that are not inside another Make process of that subtree.
+    """
+    makes = []
+    stack = list(processes[pid]['children'])
+
+    while stack:
+        c = stack.pop()
+
+        if c not in processes:
+            continue
+
+        if processes[c]['type'] == 'make':
+            makes.append(c)
+        else:
+            stack.extend(processes[c]['children'])
+
+    return makes
+
+
+def build_model(processes, root, recorded_slots=None):
+    """
+    Build the schedule model of a recorded build. ``recorded_slots`` is the
+    number of job slots of the recorded build, which defaults to the maximal
+    number of jobs that were running at the same time.
+    """
+    nodes = {}
+    contains_make = {}
+
+    def node(pid, uses_slot):
+        n = nodes[pid] = Node(pid, processes[pid], uses_slot)
+        return n
+
+    # Determine which jobs occupy a slot.
+    jobs = []
+    makes = [root]
+    stack = [root]
+
+    while stack:
+        make = stack.pop()
+
+        for c in processes[make]['children']:
+            if c not in processes:
+                continue
+
+            inner = outer_makes(processes, c)
+            contains_make[c] = inner
+            jobs.append((make, c))
+
+            if processes[c]['type'] == 'make':
+                makes.append(c)
+                stack.append(c)
+            else:
+                makes.extend(inner)
+                stack.extend(inner)
+
+    slot_jobs = [(processes[c]['start'], processes[c]['end'])
+                 for _, c in jobs
+                 if processes[c]['type'] != 'make' and not contains_make[c]]
+    steps = concurrency(slot_jobs)
+    step_times = [t for t, count in steps]
+
+    if recorded_slots is None:
+        recorded_slots = max([count for t, count in steps] or [1])
+
+    def running_before(time):
+        i = bisect_left(step_times, time) - 1
+        return steps[i][1] if i >= 0 else 0
+
+    for pid in makes:
+        if pid not in nodes:
+            node(pid, False)
+
+    for make, c in jobs:
+        if c not in nodes:
+            node(c, processes[c]['type'] != 'make' and not contains_make[c])
+
+    make_jobs = {}
+
+    for make, c in jobs:
+        make_jobs.setdefault(make, []).append(nodes[c])
+
+    # Jobs of each Make process.
+    for make, children in make_jobs.iteritems():
+        owner = nodes[make]
+        children.sort(key=lambda n: n.start)
+        owner.children = children
+        ended = sorted(children, key=lambda n: n.end)
+        ends = [n.end for n in ended]
+
+        for i, job in enumerate(children):
+            job.owner = owner
+            waited = job.uses_slot and running_before(job.start) \
+                    >= recorded_slots
+
+            if waited and i:
+                job.trigger = children[i - 1], 'ready', 0
+                continue
+
+            j = bisect_left(ends, job.start) - 1
+
+            if j >= 0:
+                pred = ended[j]
+                job.trigger = pred, 'finish', job.start - pred.end
+            else:
+                job.trigger = owner, 'ready', job.start - owner.start
+
+    # Make processes inside jobs.
+    for make, c in jobs:
+        if processes[c]['type'] == 'make':
+            continue
+
+        container = nodes[c]
+        inner = sorted((nodes[m] for m in contains_make[c]),
+                       key=lambda n: n.start)
+        container.children = inner
+
+        for i, m in enumerate(inner):
+            m.owner = container
+            prev = inner[i - 1] if i else None
+
+            if prev and m.start >= prev.end:
+                m.trigger = prev, 'finish', m.start - prev.end
+            else:
+                m.trigger = container, 'ready', m.start - container.start
+
+    for n in nodes.itervalues():
+        if n.children:
+            n.tail = max(0, n.end - max(c.end for c in n.children))
+
+        if n.trigger:
+            pred, event, delay = n.trigger
+            pred.dependents[event].append((n, max(0, delay)))
+
+    return nodes, recorded_slots
+
+
+def simulate(processes, root, slots, policy='fifo', recorded_slots=None,
+             model=None):
+    """
+    Simulate the build with the given number of job slots. Returns the
+    predicted wall time and the number of running jobs over time, as a step
+    function of ``(time, count)`` tuples.
+    """
+    if model is None:
+        model = build_model(processes, root, recorded_slots)
+
+    nodes, recorded_slots = model
+
+    for n in nodes.itervalues():
+        n.pending = len(n.children)
+        n.ready_time = n.finish_time = None
+
+    events = []
+    queue = []
+    sequence = [0]
+    running = [0]
+    steps = []
+
+    def push(time, kind, n):
+        sequence[0] += 1
+        heapq.heappush(events, (time, sequence[0], kind, n))
+
+    def record(time):
+        if steps and steps[-1][0] == time:
+            steps[-1] = time, running[0]
+        else:
+            steps.append((time, running[0]))
+
+    def finish(time, n):
+        n.finish_time = time
+
+        for dependent, delay in n.dependents['finish']:
+            push(time + delay, 'ready', dependent)
+
+        owner = n.owner
+
+        if owner is not None:
+            owner.pending -= 1
+
+            if not owner.pending:
+                last = max(c.finish_time for c in owner.children)
+                push(max(last + owner.tail, owner.ready_time), 'finish',
+                     owner)
+
+    start = processes[root]['start']
+    push(start, 'ready', nodes[root])
+
+    while events:
+        time, seq, kind, n = heapq.heappop(events)
+
+        if kind == 'ready':
+            n.ready_time = time
+
+            for dependent, delay in n.dependents['ready']:
+                push(time + delay, 'ready', dependent)
+
+            if n.uses_slot:
+                if policy == 'longest':
+                    key = -n.duration, n.start
+                else:
+                    key = time, n.start
+
+                heapq.heappush(queue, (key, n.pid, n))
+            elif not n.children:
+                push(time + n.duration, 'finish', n)
+        elif kind == 'finish':
+            if n.uses_slot:
+                running[0] -= 1
+                record(time)
+
+            finish(time, n)
+
+        # Start ready jobs on the free slots, once all events of this moment
+        # have been handled.
+        if events and events[0][0] == time:
+            continue
+
+        while queue and running[0] < slots:
+            key, pid, job = heapq.heappop(queue)
+            running[0] += 1
+            push(time + job.duration, 'finish', job)
+
+        record(time)
+
+    return nodes[root].finish_time - start, steps
+
+
+def simulate_levels(processes, root, levels=DEFAULT_SLOTS, policy='fifo',
+                    recorded_slots=None, buckets=60):
+    """
+    Simulate the build for each number of job slots in ``levels``. Returns a
+    dictionary with the number of slots of the recorded build and a list of
+    results, with the predicted wall time, the mean utilization of the slots
+    and the utilization curve (in ``buckets`` buckets) for each level.
+    """
+    model = build_model(processes, root, recorded_slots)
+    results = []
+
+    for slots in levels:
+        wall_time, steps = simulate(processes, root, slots, policy,
+                                    model=model)
+        start = processes[root]['start']
+        curve = [(t, count / slots) for t, count in
+                 profile(steps, start, start + wall_time, buckets)]
+        utilization = sum(u for t, u in curve) / (len(curve) or 1)
+
+        results.append({'slots': slots, 'wall_time': wall_time,
+                        'utilization': utilization, 'curve': curve})
+
+    return {'recorded_slots': model[1],
+            'recorded_wall_time': processes[root]['duration'],
+            'policy': policy, 'results': results}
+
+
+def print_report(fd, result):
+    """
+    Write a human readable report of the result of ``simulate_levels`` to
+    ``fd``. The utilization curve is drawn with one character per bucket.
+    """
+    shades = ' .:-=+*#%@'
+
+    print >>fd, 'Recorded: %.3f s with %d slots. Policy: %s.' % (
+            result['recorded_wall_time'] / 1000.0, result['recorded_slots'],
+            result['policy'])
+
+    for r in result['results']:
+        curve = ''.join(shades[min(len(shades) - 1,
+                                   int(u * (len(shades) - 1) + 0.5))]
+                        for t, u in r['curve'])
+        print >>fd, '  -j%-3d %10.3f s %5.1f%% |%s|' % (r['slots'],
+                r['wall_time'] / 1000.0, 100 * r['utilization'], curve)
@@ -0,0 +1,103 @@
+/*
+ * Decoder of the columnar dataset format (see columnar.py). The decoded
+ * dataset has the same structure as a JSON dataset.
+ */
+var decode_utf8 = function(bytes, start, end) {
+    var s = '';
+
+    // Convert in slices, since apply() has a limited number of arguments.
+    for(var i = start; i < end; i += 8192) {
+        s += String.fromCharCode.apply(null,
+                bytes.subarray(i, Math.min(i + 8192, end)));
+    }
+
+    return decodeURIComponent(escape(s));
+};
+
+// Fields of the resource usage of a process (-1 if it is not known).
+var columnar_rusage = ['utime', 'stime', 'maxrss', 'nvcsw', 'nivcsw'];
+
+var decode_columnar = function(buffer) {
+    var bytes = new Uint8Array(buffer),
+        magic = decode_utf8(bytes, 0, 4);
+
+    if( magic != 'BSAC' )
+        throw 'Not a columnar dataset.';
+
+    var header_size = new DataView(buffer).getUint32(4, true),
+        header = $.parseJSON(decode_utf8(bytes, 8, 8 + header_size)),
+        base = 8 + header_size,
+        c = {};
+
+    // Sections are aligned, so typed arrays can be used as views on the
+    // buffer. Note: the file is little-endian, as are all common browsers.
+    for(var name in header.sections) {
+        var section = header.sections[name],
+            type = section[2] == 'i' ? Int32Array
+                 : section[2] == 'I' ? Uint32Array : Uint8Array;
+
+        c[name] = new type(buffer, base + section[0], section[1]);
+    }
+
+    var strings = {}, processes = {root: header.root};
+
+    var string = function(i) {
+        if( !(i in strings) ) {
+            strings[i] = decode_utf8(bytes,
+                    c.strings.byteOffset + c.string_offset[i],
+                    c.strings.byteOffset + c.string_offset[i + 1]);
+        }
+        return strings[i];
+    };
+
+    for(var i = 0; i < c.pid.length; i++) {
+        var syscalls = [], children = [];
+
+        for(var s = c.syscall_offset[i]; s < c.syscall_offset[i + 1]; s++) {
+            syscalls.push({
+                cmd: string(c.syscall_cmd[s]),
+                start: c.syscall_start[s],
+                end: c.syscall_end[s],
+                duration: c.syscall_end[s]
+                          ? c.syscall_end[s] - c.syscall_start[s] : 0
+            });
+        }
+
+        for(var p = c.child_offset[i]; p < c.child_offset[i + 1]; p++)
+            children.push(c.children[p]);
+
+        processes[c.pid[i]] = {
+            type: header.types[c.type[i]],
+            parent: c.parent[i],
+            syscalls: syscalls,
+            start: c.start[i],
+            end: c.end[i],
+            duration: c.end[i] - c.start[i],
+            children: children
+        };
+
+        // Files of older converters do not contain the resource usage.
+        if( c.utime ) {
+            var rusage = {}, known = false;
+
+            for(var f = 0; f < columnar_rusage.length; f++) {
+                var field = columnar_rusage[f];
+
+                if( c[field][i] >= 0 ) {
+                    rusage[field] = c[field][i];
+                    known = true;
+                }
+            }
+
+            if( known )
+                processes[c.pid[i]].rusage = rusage;
+        }
+
+        // Only merged builds of several hosts have host names.
+        if( header.hosts && header.hosts.length )
+            processes[c.pid[i]].host = header.hosts[c.host[i]];
+    }
+
+    return {version: 100, processes: processes,
+            properties: header.properties};
+};
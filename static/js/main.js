@@ -1,9 +1,20 @@
-
 var Interface = function(container, waterfall) {
+    var interface = this;
+
     this.container = container;
     this.waterfall = waterfall;
 
-    $(this.container).click(this.dispatch_event)[0].interface = this;
+    $(this.container).click(function(evt) { interface.dispatch_event(evt); })
+        .mousemove(function(evt) {
+            waterfall.set_hover(waterfall.hit(evt.pageX, evt.pageY));
+        })
+        .mouseleave(function() { waterfall.set_hover(null); })
+        .bind('mousewheel DOMMouseScroll', function(evt) {
+            interface.zoom(evt);
+        })
+        .bind('select_process', function(evt, pid) {
+            interface.load_syscalls(pid);
+        });
 }
 
 $.extend(Interface.prototype, {
@@ -11,41 +22,120 @@ $.extend(Interface.prototype, {
 
     dispatch_event: function(evt) {
         // Only dispatch events for processes.
-        if( evt.target.id && evt.target.id[0] == 'p' ) {
-            evt.currentTarget.interface.load_syscalls(evt.target.id.substr(1));
-            evt.currentTarget.interface.expand_or_collapse(evt.target.id.substr(1));
+        var pid = this.waterfall.hit(evt.pageX, evt.pageY);
+
+        if( pid !== null ) {
+            this.load_syscalls(pid);
+            this.expand_or_collapse(pid);
         }
     },
 
     expand_or_collapse: function(pid) {
-        $('#p' + pid).toggleClass('expanded');
+        this.waterfall.toggle(pid);
+    },
+
+    zoom: function(evt) {
+        // Zoom the timeline with the mouse wheel while the control key is
+        // held down (instead of zooming the page).
+        var original = evt.originalEvent,
+            delta = original.wheelDelta || -original.detail;
+
+        if( !evt.ctrlKey || !delta )
+            return;
+
+        evt.preventDefault();
+        this.waterfall.zoom(delta > 0 ? 1.25 : 0.8, evt.pageX);
     },
 
     load_syscalls: function(pid){
+        var process = this.waterfall.data.processes[pid];
         syscalls = this.waterfall.process_syscalls[pid];
 
-        if( this.previous_process )
-            $('#p' + this.previous_process).removeClass('selected');
+        this.waterfall.select(pid);
+        this.previous_process = pid;
+
+        // Bars of a level of detail pyramid do not contain syscalls.
+        if( !syscalls || !syscalls.length ) {
+            $('#process').html(this.describe_bar(pid, process));
 
-        $('#p' + pid).addClass('selected');
+            // Syscalls of datasets with a details file are loaded on demand.
+            if( process && process.type != 'summary'
+                    && this.waterfall.details_url )
+                this.load_details(pid);
+
+            return;
+        }
         
         duration = syscalls.slice(-1)[0].duration / 1000;
 
         html = '<p class=description>Process #' + pid 
                + ' &mdash; Process duration: ' + duration + ' sec.' 
-               + '</p>';
+               + this.describe_rusage(process) + '</p>';
 
         for(s in syscalls) {
             syscall = syscalls[s]
-            cmd = syscall.cmd.replace('&', '&amp;')
-                             .replace('<', '&lt;')
-                             .replace('>', '&gt;');
+            cmd = this.waterfall.command(syscall).replace('&', '&amp;')
+                                                 .replace('<', '&lt;')
+                                                 .replace('>', '&gt;');
             html += '<p><span class=cmd>' + cmd + '</span></p>';
         }
 
         $('#process').html(html);
         $('#process p:first-child').each(function(){this.scrollIntoView();});
+    },
 
-        this.previous_process = pid;
+    load_details: function(pid) {
+        $.ajax({
+            context: this,
+            dataType: 'json',
+            url: this.waterfall.details_url + pid,
+            success: function(syscalls) {
+                this.waterfall.process_syscalls[pid] = syscalls;
+
+                // Only show the syscalls if the process is still selected.
+                if( this.previous_process == pid && syscalls.length )
+                    this.load_syscalls(pid);
+            }
+        });
+    },
+
+    describe_rusage: function(process) {
+        // The resource usage includes the processes that the process waited
+        // for (e.g. the compiler run by a shell).
+        var rusage = process && process.rusage, html = '';
+
+        if( !rusage )
+            return html;
+
+        if( 'utime' in rusage )
+            html += ' &mdash; CPU time: ' + (rusage.utime / 1000)
+                    + ' sec. user, ' + (rusage.stime / 1000) + ' sec. system';
+
+        if( 'maxrss' in rusage )
+            html += ' &mdash; Max. RSS: ' + (rusage.maxrss / 1024).toFixed(1)
+                    + ' MiB';
+
+        if( 'nvcsw' in rusage )
+            html += ' &mdash; Context switches: ' + rusage.nvcsw
+                    + ' voluntary, ' + rusage.nivcsw + ' involuntary';
+
+        return html;
+    },
+
+    describe_bar: function(pid, process) {
+        if( process.type != 'summary' ) {
+            return '<p class=description>Process #' + pid
+                   + ' &mdash; Process duration: ' + (process.duration / 1000)
+                   + ' sec.' + this.describe_rusage(process) + '</p>';
+        }
+
+        var types = [];
+
+        for(var t in process.types)
+            types.push(process.types[t] + ' ' + t);
+
+        return '<p class=description>' + process.count + ' processes'
+               + ' &mdash; Total time: ' + (process.total / 1000) + ' sec.'
+               + ' &mdash; Types: ' + types.join(', ') + '</p>';
     }
 });
@@ -1,16 +1,78 @@
-var Waterfall = function(viewport, dataset_url){
+var Waterfall = function(viewport, dataset_url, options){
     this.viewport = viewport;
+    this.expanded = {};
+    this.linked = [];
+    $.extend(this, options);
+    this.init_canvas();
     this.load(dataset_url);
 };
 
 $.extend(Waterfall.prototype, {
     dataset_url: null,
 
+    // Element that contains the waterfall and element for the properties of
+    // the dataset (if any).
+    container: '#waterfall',
+    properties: '#properties',
+
+    // URL prefix of the syscalls of a process (followed by its pid), for
+    // datasets that are converted with a details file.
+    details_url: null,
+
+    // Height of a bar and of a row (a bar and the space below it) in pixels.
+    bar_height: 4,
+    row_height: 5,
+
+    // Colors of the bars per process type. If color is set, it is used for
+    // all bars (e.g. of an overlay).
+    colors: {make: '#ccc', sh: '#c99', cpp: '#9c9', summary: '#ddd'},
+    default_color: '#bbe',
+    color: null,
+
+    // Bars are colored by process type (color_mode 'type'), or from light to
+    // dark red by CPU utilization ('cpu', CPU time divided by duration) or
+    // maximum resident set size ('rss', relative to the largest one). The
+    // children of a process are ordered by start time (sort_mode 'start'),
+    // or by CPU time ('cpu') or maximum resident set size ('rss'), largest
+    // first. Processes without resource usage are grey in these modes. In
+    // merged builds of several hosts, bars can be colored by the host that
+    // ran the process ('host'), in the order of the hosts of the properties.
+    color_mode: 'type',
+    sort_mode: 'start',
+    unknown_color: '#ddd',
+    host_palette: ['#bbe', '#9c9', '#c99', '#dc8', '#c9c', '#9cc', '#e96',
+                   '#99c'],
+
+    // Processes below the children of the root are only shown if one of
+    // their ancestors (other than the root) is expanded, unless expand_all
+    // is set.
+    expand_all: false,
+
+    // Waterfalls that share the viewport of this waterfall, which are resized
+    // when it is zoomed (e.g. the overlay of a comparison).
+    linked: null,
+
+    // Number of laid out processes and rows of the waterfall.
+    count: 0,
+    rows: 0,
+    max_end: 0,
+    width: 0,
+    height: 0,
+
+    selected: null,
+    hover: null,
+    draw_scheduled: false,
+
     load: function(dataset_url) {
         this.dataset_url = dataset_url;
         html = '<span class="loading">Loading "' + this.dataset_url + '"...</span>';
-        $('#waterfall .loading').remove();
-        $('#waterfall').append(html);
+        $(this.container + ' .loading').remove();
+        $(this.container).append(html);
+
+        if( /\.bsac$/.test(this.dataset_url) ) {
+            this.load_columnar();
+            return;
+        }
 
         $.ajax({
             context: this,
@@ -21,83 +83,489 @@ $.extend(Waterfall.prototype, {
         });
     },
 
+    load_columnar: function() {
+        // jQuery does not support binary responses, so use a plain request.
+        var xhr = new XMLHttpRequest(), waterfall = this;
+
+        xhr.open('GET', this.dataset_url, true);
+        xhr.responseType = 'arraybuffer';
+        xhr.onload = function() {
+            if( xhr.status != 200 )
+                return waterfall.load_error(xhr, 'error', xhr.statusText);
+
+            waterfall.load_success(decode_columnar(xhr.response), 'success');
+        };
+        xhr.onerror = function() {
+            waterfall.load_error(xhr, 'error', xhr.statusText);
+        };
+        xhr.send();
+    },
+
     load_error: function(xhr, textStatus, errorThrown) {
         html = '<span class="error">Loading "' + this.dataset_url + '" failed.'
                + '<br/> Error: ' + xhr.status + ' ' + errorThrown + '</span>';
-        $('#waterfall .loading').remove();
-        $('#waterfall').append(html);
+        $(this.container + ' .loading').remove();
+        $(this.container).append(html);
     },
 
     load_success: function(data, textStatus) {
-        $('#waterfall .loading').remove();
-        
+        $(this.container + ' .loading').remove();
+
         this.data = data;
         this.parse_data(data);
 
-        $('#waterfall div:first').click();
+        // Select the root process.
+        if( this.count )
+            $(this.container).trigger('select_process', [this.pids[0]]);
+
+        this.schedule_reload(data.properties);
+    },
+
+    schedule_reload: function(properties) {
+        // Datasets written in follow mode are replaced periodically until the
+        // build has finished.
+        if( !properties.live )
+            return;
+
+        var waterfall = this;
+
+        setTimeout(function(){ waterfall.reload(); },
+                   properties.interval * 1000);
+    },
+
+    reload: function() {
+        $.ajax({
+            cache: false,
+            context: this,
+            dataType: 'json',
+            url: this.dataset_url,
+            error: this.load_error,
+            success: function(data, textStatus) {
+                this.data = data;
+                this.parse_data(data);
+                this.schedule_reload(data.properties);
+            }
+        });
+    },
+
+    set_modes: function(color_mode, sort_mode) {
+        this.color_mode = color_mode;
+        this.sort_mode = sort_mode;
+
+        if( this.data ) {
+            this.layout(this.data);
+            this.update_rows();
+        }
     },
 
     parse_data: function(data) {
-        var html = '', pid;
+        this.layout(data);
+        this.update_rows();
 
-        this.process_syscalls = {};
+        if( this.properties ) {
+            html = this.construct_properties(data.properties);
+            $(this.properties).html(html);
+        }
+    },
 
-        pid = data.processes.root.toString();
-        html = this.parse_process(data, pid);
-        $('#waterfall').html(html);
+    init_canvas: function() {
+        // The waterfall is drawn on a canvas of at most the size of the
+        // browser window, which is moved along when the page is scrolled.
+        var waterfall = this,
+            redraw = function() { waterfall.schedule_draw(); };
 
-        html = this.construct_properties(data.properties);
-        $('#properties').html(html);
+        this.canvas = $('<canvas></canvas>').css({position: 'absolute',
+                                                  left: 0, top: 0})[0];
+        this.context = this.canvas.getContext('2d');
+        $(this.container).append(this.canvas);
+        $(window).scroll(redraw).resize(redraw);
     },
 
-    parse_process: function(data, pid) {
-        var html = '';
+    layout: function(data) {
+        // Lay the process tree out once into flat arrays, in depth first
+        // order (the order of the rows). Processes shorter than the threshold
+        // are left out with their descendants.
+        var processes = data.processes,
+            threshold = data.properties.threshold * 1000,
+            size = 0, n = 0, pid, process, depth, i,
+            stack = [processes.root.toString(), 0];
+
+        this.max_rss = 0;
+        this.host_colors = {};
+
+        for(i = 0; i < (data.properties.hosts || []).length; i++)
+            this.host_colors[data.properties.hosts[i].name] =
+                this.host_palette[i % this.host_palette.length];
+
+        for(pid in processes) {
+            size++;
+
+            if( processes[pid].rusage && processes[pid].rusage.maxrss )
+                this.max_rss = Math.max(this.max_rss,
+                                        processes[pid].rusage.maxrss);
+        }
+
+        this.pids = [];
+        this.index = {};
+        this.bar_colors = [];
+        this.process_syscalls = {};
+        this.start = new Float64Array(size);
+        this.end = new Float64Array(size);
+        this.depth = new Uint16Array(size);
+        this.subtree_end = new Int32Array(size);
 
-        if( pid in data.processes ) {
-            var process = data.processes[pid];
+        while( stack.length ) {
+            depth = stack.pop();
+            pid = stack.pop();
+
+            if( !(pid in processes) ) {
+                if( window.console && console.log )
+                    console.log('process #' + pid + ' not in data.processes.');
+
+                continue;
+            }
+
+            process = processes[pid];
             this.process_syscalls[pid] = process.syscalls;
-        
-            if( process.duration < data.properties.threshold * 1000 )
-                return html;
 
-            html = this.construct_bar(data, pid);
+            if( process.duration < threshold )
+                continue;
+
+            this.pids.push(pid);
+            this.index[pid] = n;
+            this.start[n] = process.start;
+            this.end[n] = process.end;
+            this.depth[n] = depth;
+            this.bar_colors.push(this.bar_color(process));
+            n++;
+
+            // Push the children in reverse, so the first child is laid out
+            // first.
+            var children = this.sort_children(processes, process.children);
+
+            for(i = children.length - 1; i >= 0; i--)
+                stack.push(children[i].toString(), depth + 1);
         }
-        else if(console && console.log) {
-            console.log('process #' + pid + ' not in data.processes.');
+
+        this.count = n;
+        this.max_end = 0;
+
+        for(i = 0; i < n; i++)
+            this.max_end = Math.max(this.max_end, this.end[i]);
+
+        // The subtree of a process ends at the next process that is not
+        // deeper in the tree.
+        stack = [];
+
+        for(i = 0; i < n; i++) {
+            while( stack.length
+                    && this.depth[stack[stack.length - 1]] >= this.depth[i] )
+                this.subtree_end[stack.pop()] = i;
+
+            stack.push(i);
+        }
+
+        while( stack.length )
+            this.subtree_end[stack.pop()] = n;
+
+        this.first_row = new Int32Array(n + 1);
+        this.row_index = new Int32Array(n);
+    },
+
+    resource: function(process, mode) {
+        // Return the CPU time or maximum resident set size of a process, or
+        // -1 if it is not known.
+        var rusage = process.rusage;
+
+        if( !rusage )
+            return -1;
+
+        if( mode == 'cpu' )
+            return 'utime' in rusage ? rusage.utime + rusage.stime : -1;
+
+        return 'maxrss' in rusage ? rusage.maxrss : -1;
+    },
+
+    sort_children: function(processes, children) {
+        if( this.sort_mode == 'start' )
+            return children;
+
+        var waterfall = this, mode = this.sort_mode,
+            key = function(pid) {
+                return pid in processes
+                       ? waterfall.resource(processes[pid], mode) : -1;
+            };
+
+        return children.slice().sort(function(a, b) {
+            return key(b) - key(a);
+        });
+    },
+
+    bar_color: function(process) {
+        if( this.color )
+            return this.color;
+
+        if( this.color_mode == 'type' || process.type == 'summary' )
+            return this.colors[process.type] || this.default_color;
+
+        if( this.color_mode == 'host' )
+            return this.host_colors[process.host] || this.unknown_color;
+
+        var value = this.resource(process, this.color_mode);
+
+        if( value < 0 )
+            return this.unknown_color;
+
+        // Scale the value to [0, 1]: the CPU utilization, or the resident set
+        // size relative to the largest one.
+        if( this.color_mode == 'cpu' )
+            value = process.duration ? value / process.duration : 0;
+        else
+            value = this.max_rss ? value / this.max_rss : 0;
+
+        value = Math.min(1, value);
+
+        // From light blue (#bbe) to dark red (#c33).
+        return 'rgb(' + Math.round(187 + 17 * value) + ','
+               + Math.round(187 - 136 * value) + ','
+               + Math.round(238 - 187 * value) + ')';
+    },
+
+    update_rows: function() {
+        // Assign rows to the visible processes. first_row[i] is the number of
+        // visible processes before process i, which is its row if it is
+        // visible, and row_index maps rows back to processes.
+        var rows = 0, open_until = 0;
+
+        for(var i = 0; i < this.count; i++) {
+            this.first_row[i] = rows;
+
+            if( this.expand_all || this.depth[i] <= 1 || i < open_until ) {
+                this.row_index[rows++] = i;
+
+                if( this.depth[i] >= 1 && this.expanded[this.pids[i]] )
+                    open_until = Math.max(open_until, this.subtree_end[i]);
+            }
         }
-    
-        return html;
+
+        this.first_row[this.count] = rows;
+        this.rows = rows;
+        this.update_size();
+    },
+
+    update_size: function() {
+        this.width = Math.max(0, Math.ceil((this.max_end - this.viewport.start)
+                                           * this.viewport.scale) + 1);
+        this.height = this.rows * this.row_height;
+        $(this.container).css({width: this.width, height: this.height});
+        this.schedule_draw();
     },
 
-    construct_bar: function(data, pid) {
-        // TODO: currently the parent's left and width are calculated for each
-        // child, which is rather inefficient. Try to cache the calculations.
-        var process = data.processes[pid],
-            left = (process.start - this.viewport.start) * this.viewport.scale,
-            width = (process.end - process.start) * this.viewport.scale;
+    visible: function(i) {
+        return this.first_row[i] < this.rows
+               && this.row_index[this.first_row[i]] == i;
+    },
+
+    schedule_draw: function() {
+        if( this.draw_scheduled )
+            return;
+
+        var waterfall = this,
+            request = window.requestAnimationFrame
+                      || function(f) { setTimeout(f, 16); };
+
+        this.draw_scheduled = true;
+        request(function() { waterfall.draw(); });
+    },
 
-        if( process.parent ) {
-            var parent = data.processes[process.parent.toString()];
-            left -= (parent.start - this.viewport.start) * this.viewport.scale;
+    draw: function() {
+        // Only the rows and the part of the timeline that are in the browser
+        // window are drawn.
+        this.draw_scheduled = false;
+
+        var win = $(window), offset = $(this.container).offset(),
+            width = Math.min(win.width(), this.width),
+            height = Math.min(win.height(), this.height),
+            left = Math.max(0, Math.min(win.scrollLeft() - offset.left,
+                                        this.width - width)),
+            top = Math.max(0, Math.min(win.scrollTop() - offset.top,
+                                       this.height - height)),
+            ratio = window.devicePixelRatio || 1,
+            ctx = this.context,
+            scale = this.viewport.scale,
+            origin = this.viewport.start + left / scale,
+            first = Math.floor(top / this.row_height),
+            last = Math.min(this.rows,
+                            Math.ceil((top + height) / this.row_height)),
+            color = null, i;
+
+        if( this.canvas.width != width * ratio
+                || this.canvas.height != height * ratio ) {
+            this.canvas.width = width * ratio;
+            this.canvas.height = height * ratio;
+            $(this.canvas).css({width: width, height: height});
         }
 
-        left = Math.ceil(left);
-        width = Math.ceil(width);
+        $(this.canvas).css({left: left, top: top});
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+        ctx.clearRect(0, 0, width, height);
+
+        for(var r = first; r < last; r++) {
+            i = this.row_index[r];
+
+            var x = Math.floor((this.start[i] - origin) * scale),
+                w = Math.max(1, Math.ceil((this.end[i] - this.start[i])
+                                          * scale));
 
-        html = '<div id=p' + pid + ' class=' + process.type
-               + ' style="margin-left:' + left + 'px;width:' + width + 'px;">';
+            if( x + w < 0 || x > width )
+                continue;
 
-        for(var c = 0; c < process.children.length; c++) {
-            html += this.parse_process(data, process.children[c.toString()]);
+            if( this.bar_colors[i] != color ) {
+                color = this.bar_colors[i];
+                ctx.fillStyle = color;
+            }
+
+            ctx.fillRect(x, r * this.row_height - top, w, this.bar_height);
+        }
+
+        // The root process is not outlined when it is expanded, since it does
+        // not change which processes are shown.
+        for(var pid in this.expanded) {
+            if( pid in this.index && this.depth[this.index[pid]] >= 1 )
+                this.outline(this.index[pid], '#99c', origin, top);
         }
 
-        return html + '</div>';
+        if( this.hover in this.index )
+            this.outline(this.index[this.hover], '#999', origin, top);
+
+        if( this.selected in this.index )
+            this.outline(this.index[this.selected], '#777', origin, top);
+    },
+
+    outline: function(i, color, origin, top) {
+        // Outline a process and its visible descendants.
+        if( !this.visible(i) )
+            return;
+
+        var scale = this.viewport.scale,
+            x = Math.floor((this.start[i] - origin) * scale),
+            w = Math.max(1, Math.ceil((this.end[i] - this.start[i]) * scale)),
+            y = this.first_row[i] * this.row_height - top,
+            h = (this.first_row[this.subtree_end[i]] - this.first_row[i])
+                * this.row_height - 1;
+
+        this.context.strokeStyle = color;
+        this.context.lineWidth = 1;
+        this.context.strokeRect(x - 0.5, y - 0.5, w + 1, h + 1);
+    },
+
+    hit: function(page_x, page_y) {
+        // Return the pid of the process whose bar is at the given position
+        // of the page, or null.
+        var offset = $(this.container).offset(),
+            x = page_x - offset.left,
+            r = Math.floor((page_y - offset.top) / this.row_height);
+
+        if( r < 0 || r >= this.rows )
+            return null;
+
+        var i = this.row_index[r],
+            scale = this.viewport.scale,
+            left = (this.start[i] - this.viewport.start) * scale,
+            width = Math.max(1, (this.end[i] - this.start[i]) * scale);
+
+        // Narrow bars get a margin of a pixel, so they can be clicked.
+        if( x < left - 1 || x > left + width + 1 )
+            return null;
+
+        return this.pids[i];
+    },
+
+    select: function(pid) {
+        this.selected = pid;
+        this.schedule_draw();
+    },
+
+    set_hover: function(pid) {
+        if( pid === this.hover )
+            return;
+
+        this.hover = pid;
+        $(this.container).css('cursor', pid === null ? 'auto' : 'pointer');
+        this.schedule_draw();
+    },
+
+    toggle: function(pid) {
+        if( this.expanded[pid] )
+            delete this.expanded[pid];
+        else
+            this.expanded[pid] = true;
+
+        this.update_rows();
+    },
+
+    zoom: function(factor, page_x) {
+        // Zoom the timeline in or out, keeping the time at page_x in place.
+        // The viewport is shared with the linked waterfalls.
+        var win = $(window),
+            x = page_x - $(this.container).offset().left,
+            waterfalls = [this].concat(this.linked);
+
+        this.viewport.scale *= factor;
+
+        for(var w = 0; w < waterfalls.length; w++)
+            waterfalls[w].update_size();
+
+        win.scrollLeft(win.scrollLeft() + x * (factor - 1));
+
+        if( this.properties && this.data ) {
+            html = this.construct_properties(this.data.properties);
+            $(this.properties).html(html);
+        }
+    },
+
+    command: function(syscall) {
+        // Datasets converted with --tokens store a command as the list of
+        // ids of its tokens in the string table of the dataset.
+        if( typeof syscall.cmd == 'string' )
+            return syscall.cmd;
+
+        var strings = this.data.strings, cmd = '';
+
+        for(var i = 0; i < syscall.cmd.length; i++)
+            cmd += strings[syscall.cmd[i]];
+
+        return cmd;
     },
 
     construct_properties: function(properties) {
         return '<p>Displayed timeline from ' + (this.viewport.start / 1000.0)
                + ' up to ' + (this.viewport.end / 1000.0) + ' seconds. Scale'
                + ' is ' + (1.0/this.viewport.scale) + ' ms/pixel and duration'
-               + ' threshold is ' + properties.threshold + ' seconds.</p>';
+               + ' threshold is ' + properties.threshold + ' seconds.</p>'
+               + this.construct_hosts(properties.hosts);
+    },
+
+    construct_hosts: function(hosts) {
+        // Utilization and clock offset of the hosts of a merged build, with
+        // their colors in the 'host' color mode.
+        if( !hosts || !hosts.length )
+            return '';
+
+        var html = [];
+
+        for(var i = 0; i < hosts.length; i++) {
+            var host = hosts[i];
+
+            html.push('<span class=swatch style="background: '
+                      + (this.host_colors[host.name] || this.unknown_color)
+                      + '"></span>' + $('<span>').text(host.name).html()
+                      + ': ' + host.jobs + ' jobs, ' + (host.job_time / 1000)
+                      + ' sec., ' + host.mean.toFixed(2) + ' running on'
+                      + ' average, clock offset ' + host.clock_offset
+                      + ' ms');
+        }
+
+        return '<p>Hosts &mdash; ' + html.join('; ') + '.</p>';
     }
 });
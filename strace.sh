@@ -1,2 +1,2 @@
 #!/bin/sh
-strace -qftts 1024 -e trace=process -o strace.log make -sj12 $@
+strace -qftts 1024 -e trace=process -e 'abbrev=!wait4' -o strace.log make -sj12 $@
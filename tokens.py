@@ -0,0 +1,79 @@
+"""
+Dictionary encoding of the commands of the syscalls. Most commands of a
+C/C++ build repeat the same compiler path and flags, so a command is split
+into tokens (an argument with the separators that follow it), and every
+distinct token is stored once in a string table. A command is stored as the
+list of ids of its tokens, which are concatenated to expand it again.
+"""
+
+from copy import copy
+import re
+
+TOKEN = re.compile(r'[^ ,"\[\]]*[ ,"\[\]]*')
+
+
+class TokenTable(object):
+    """
+    String table of the tokens, which assigns ids in order of first use.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def encode(self, cmd):
+        """
+        Return the list of token ids of a command.
+        """
+        ids = []
+
+        for token in TOKEN.findall(cmd):
+            if not token:
+                continue
+
+            i = self.ids.get(token)
+
+            if i is None:
+                i = self.ids[token] = len(self.strings)
+                self.strings.append(token)
+
+            ids.append(i)
+
+        return ids
+
+
+def expand(ids, strings):
+    """
+    Return the command of a list of token ids.
+    """
+    return ''.join([strings[i] for i in ids])
+
+
+def encode_processes(processes, table):
+    """
+    Generate the ``(pid, process)`` pairs of the processes with the commands
+    of their syscalls (``Syscall`` objects or dictionaries) encoded by
+    ``table``. The given processes are not modified.
+    """
+    for pid, process in processes:
+        if pid != 'root' and process.get('syscalls'):
+            process = dict(process)
+            syscalls = process['syscalls'] = map(copy, process['syscalls'])
+
+            for syscall in syscalls:
+                if isinstance(syscall, dict):
+                    syscall['cmd'] = table.encode(syscall['cmd'])
+                else:
+                    syscall.cmd = table.encode(syscall.cmd)
+
+        yield pid, process
+
+
+def expand_processes(processes, strings):
+    """
+    Expand the encoded commands of the processes in place.
+    """
+    for pid, process in processes.iteritems():
+        if pid != 'root':
+            for syscall in process.get('syscalls', ()):
+                syscall['cmd'] = expand(syscall['cmd'], strings)
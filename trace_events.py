@@ -0,0 +1,398 @@
+"""
+Export of a converted build to trace viewers: the Trace Event format (the
+JSON format of ``chrome://tracing``, which is also opened by Perfetto) and
+Perfetto's protobuf trace format, which scales to millions of events.
+
+Every Make process is a process in the trace, named by its command line. The
+jobs of a Make process and the processes they run are slices of its threads:
+a process that runs within the time of its parent is nested in the slice of
+its parent on the same thread, and other processes are put on the first
+thread that is idle when they start. So the threads of a Make process are its
+busy job slots, and the processes that a job runs are nested in the job.
+Processes that do not belong to a Make process (e.g. the first process of a
+trace of a shell) are traced like a Make process.
+
+Times are converted from milliseconds to microseconds (Trace Event format) or
+nanoseconds (Perfetto), relative to the start of the build. Perfetto's
+timestamps are unsigned, so they are relative to the earliest process instead
+if it started before the build, e.g. on a host of a merged build whose clock
+is behind (see ``merge``).
+
+The threads of a process in the trace are only known once the processes are
+laid out in order of their start time, and whether a process belongs to a Make
+process depends on its ancestors, which finish after it. Hence all processes
+are collected before the first event is written, so the memory use grows with
+the size of the build as for the JSON format. Only the encoded events are not
+kept in memory: they are written in chunks of ``WRITE_SIZE`` bytes.
+"""
+
+from heapq import heappop, heappush
+
+import simplejson as json
+from simplejson.encoder import encode_basestring_ascii as quote
+
+from analysis import iter_items, last_command
+from database import command_arguments
+
+# Number of bytes of encoded events that are written to the output at once.
+WRITE_SIZE = 1 << 20
+
+# Kinds of the events of ``iter_trace``.
+PROCESS, THREAD, BEGIN, END = range(4)
+
+# Field numbers of the messages of ``perfetto/trace/trace.proto``.
+TRACE_PACKET = 1
+PACKET_TIMESTAMP = 8
+PACKET_SEQUENCE_ID = 10
+PACKET_TRACK_EVENT = 11
+PACKET_TRACK_DESCRIPTOR = 60
+TRACK_UUID = 1
+TRACK_PROCESS = 3
+TRACK_THREAD = 4
+PROCESS_PID = 1
+PROCESS_NAME = 6
+THREAD_PID = 1
+THREAD_TID = 2
+THREAD_NAME = 5
+EVENT_ANNOTATIONS = 4
+EVENT_TYPE = 9
+EVENT_TRACK_UUID = 11
+EVENT_CATEGORIES = 22
+EVENT_NAME = 23
+ANNOTATION_INT = 4
+ANNOTATION_STRING = 6
+ANNOTATION_NAME = 10
+SLICE_BEGIN = 1
+SLICE_END = 2
+
+# Sequence id of all packets, which are written by a single "producer".
+SEQUENCE_ID = 1
+
+# Track uuids of threads, above the uuids of processes (which are their pids).
+THREAD_UUID = 1 << 32
+
+
+class TraceProcess(object):
+    """
+    Threads of a process in the trace. ``lanes`` contains the stack of open
+    slices of every thread as ``(pid, end)`` pairs, ``tids`` the thread id of
+    every thread, ``idle`` the heap of the threads without open slices, and
+    ``busy`` the heap of the ``(end, thread)`` pairs of the outermost open
+    slice of every other thread.
+    """
+
+    __slots__ = ('pid', 'lanes', 'tids', 'idle', 'busy')
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.lanes = []
+        self.tids = []
+        self.idle = []
+        self.busy = []
+
+
+def trace_pids(processes):
+    """
+    Return a dictionary that maps the pid of every process to the pid of the
+    process in the trace that it belongs to: its nearest Make ancestor (or
+    itself), or its oldest known ancestor if it has no Make ancestor.
+    """
+    result = {}
+
+    for pid, process in iter_items(processes):
+        path = []
+
+        while pid not in result:
+            path.append(pid)
+            process = processes[pid]
+            parent = process['parent']
+
+            if process['type'] == 'make' or parent not in processes \
+                    or parent == pid:
+                result[pid] = pid
+                break
+
+            pid = parent
+
+        for p in path:
+            result[p] = result[pid]
+
+    return result
+
+
+def iter_trace(processes):
+    """
+    Generate the events of the trace of the processes (a dictionary that maps
+    pids to processes), in order of time per thread:
+
+    * ``(PROCESS, pid, process)``: a new process in the trace, for the given
+      (Make) process.
+    * ``(THREAD, pid, tid, number)``: a new thread of process ``pid``, with
+      the number of the thread within the process.
+    * ``(BEGIN, pid, tid, process_pid, process)``: the start of the slice of a
+      process, at ``process['start']``.
+    * ``(END, pid, tid, end)``: the end of the innermost open slice of the
+      thread.
+    """
+    trace_pid = trace_pids(processes)
+    traced = {}
+    lane_of = {}
+
+    for pid, process in sorted(iter_items(processes),
+                               key=lambda item: (item[1]['start'],
+                                                 -item[1]['end'], item[0])):
+        trace = traced.get(trace_pid[pid])
+
+        if trace is None:
+            trace = traced[trace_pid[pid]] = TraceProcess(trace_pid[pid])
+            yield PROCESS, trace.pid, processes[trace.pid]
+
+        start, end = process['start'], process['end']
+        parent = process['parent']
+        lane = None
+
+        # Nest the process in the slice of its parent, if that is the
+        # innermost open slice of its thread.
+        parent_lane = lane_of.get(parent)
+
+        if parent_lane is not None and parent_lane[0] is trace:
+            stack = trace.lanes[parent_lane[1]]
+
+            while stack and stack[-1][0] != parent and stack[-1][1] <= start:
+                yield END, trace.pid, trace.tids[parent_lane[1]], \
+                        stack.pop()[1]
+
+            if stack and stack[-1][0] == parent and end <= stack[-1][1]:
+                lane = parent_lane[1]
+
+        if lane is None:
+            while trace.busy and trace.busy[0][0] <= start:
+                i = heappop(trace.busy)[1]
+
+                for events in close_lane(trace, i):
+                    yield events
+
+                heappush(trace.idle, i)
+
+            if trace.idle:
+                lane = heappop(trace.idle)
+            else:
+                lane = len(trace.lanes)
+                trace.lanes.append([])
+                trace.tids.append(pid)
+                yield THREAD, trace.pid, pid, lane
+
+            heappush(trace.busy, (end, lane))
+
+        trace.lanes[lane].append((pid, end))
+        lane_of[pid] = trace, lane
+
+        yield BEGIN, trace.pid, trace.tids[lane], pid, process
+
+    for trace in traced.itervalues():
+        for i in xrange(len(trace.lanes)):
+            for events in close_lane(trace, i):
+                yield events
+
+
+def close_lane(trace, i):
+    stack = trace.lanes[i]
+
+    while stack:
+        yield END, trace.pid, trace.tids[i], stack.pop()[1]
+
+
+def describe(process):
+    """
+    Return the name of the executable of a process (e.g. ``cc1plus``), for the
+    name of its slice, and its command line.
+    """
+    executable, args = command_arguments(last_command(process))
+
+    return (executable.rsplit('/', 1)[-1] or process['type'],
+            ' '.join(args) or executable)
+
+
+def summarized(processes):
+    """
+    Return the processes as a dictionary. An iterable of ``(pid, process)``
+    pairs (see ``backend.common.summarize``) is consumed completely, since
+    ``iter_trace`` lays out the processes in order of their start time.
+    """
+    return processes if isinstance(processes, dict) else dict(processes)
+
+
+def dump_chrome_trace(fd, processes, properties):
+    """
+    Write the processes to ``fd`` in the Trace Event format (JSON object
+    format with begin and end events). The processes are either a dictionary
+    or an iterable of ``(pid, process)`` pairs, which is collected into a
+    dictionary first. The properties are written as ``otherData``. Encoded
+    events are written in chunks of ``WRITE_SIZE`` bytes.
+    """
+    processes = summarized(processes)
+    chunk = []
+    size = 0
+
+    fd.write('{"traceEvents": [\n')
+
+    for i, event in enumerate(iter_trace(processes)):
+        kind = event[0]
+
+        if kind == BEGIN:
+            _, pid, tid, process_pid, process = event
+            name, command = describe(process)
+            args = '"pid": %d, "command": %s' % (process_pid, quote(command))
+
+            if 'host' in process:
+                args += ', "host": %s' % quote(process['host'])
+
+            for field, value in sorted(process.get('rusage', {}).iteritems()):
+                args += ', "%s": %d' % (field, value)
+
+            item = '{"name": %s, "cat": "%s", "ph": "B", "ts": %d,' \
+                   ' "pid": %d, "tid": %d, "args": {%s}}' % (
+                           quote(name), process['type'],
+                           process['start'] * 1000, pid, tid, args)
+        elif kind == END:
+            item = '{"ph": "E", "ts": %d, "pid": %d, "tid": %d}' \
+                    % (event[3] * 1000, event[1], event[2])
+        elif kind == PROCESS:
+            item = '{"name": "process_name", "ph": "M", "pid": %d,' \
+                   ' "args": {"name": %s}}' % (event[1],
+                                               quote(describe(event[2])[1]))
+        else:
+            item = '{"name": "thread_name", "ph": "M", "pid": %d,' \
+                   ' "tid": %d, "args": {"name": "job %d"}}' % (
+                           event[1], event[2], event[3])
+
+        item = (',\n' if i else '') + item
+
+        chunk.append(item)
+        size += len(item)
+
+        if size >= WRITE_SIZE:
+            fd.write(''.join(chunk))
+            chunk = []
+            size = 0
+
+    fd.write(''.join(chunk))
+    fd.write('\n], "displayTimeUnit": "ms", "otherData": %s}\n'
+             % json.dumps(properties))
+
+
+def varint(value):
+    """
+    Encode an integer as a protobuf varint. Negative values are encoded as
+    64-bit two's complement, as protobuf does for ``int64`` fields.
+
+    >>> varint(1), varint(300)
+    ('\\x01', '\\xac\\x02')
+    >>> varint(-1) == '\\xff' * 9 + '\\x01'
+    True
+    """
+    value &= 0xffffffffffffffff
+    data = []
+
+    while value > 0x7f:
+        data.append(chr(value & 0x7f | 0x80))
+        value >>= 7
+
+    data.append(chr(value))
+
+    return ''.join(data)
+
+
+def field_int(number, value):
+    return varint(number << 3) + varint(value)
+
+
+def field_bytes(number, data):
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+
+    return varint(number << 3 | 2) + varint(len(data)) + data
+
+
+def packet(*fields):
+    data = ''.join(fields) + field_int(PACKET_SEQUENCE_ID, SEQUENCE_ID)
+
+    return field_bytes(TRACE_PACKET, data)
+
+
+def dump_perfetto(fd, processes, properties):
+    """
+    Write the processes to ``fd`` in Perfetto's protobuf trace format, as a
+    track descriptor per process and thread of the trace and a track event
+    per begin and end of a slice. The processes are collected as in
+    ``dump_chrome_trace``. The properties are not written. Encoded packets are
+    written in chunks of ``WRITE_SIZE`` bytes.
+    """
+    processes = summarized(processes)
+    chunk = []
+    size = 0
+
+    # Timestamps of packets are unsigned.
+    origin = min([0] + [p['start'] for pid, p in iter_items(processes)])
+
+    for event in iter_trace(processes):
+        kind = event[0]
+
+        if kind == BEGIN:
+            _, pid, tid, process_pid, process = event
+            name, command = describe(process)
+            annotations = [
+                field_bytes(ANNOTATION_NAME, 'pid')
+                + field_int(ANNOTATION_INT, process_pid),
+                field_bytes(ANNOTATION_NAME, 'command')
+                + field_bytes(ANNOTATION_STRING, command),
+            ]
+
+            if 'host' in process:
+                annotations.append(field_bytes(ANNOTATION_NAME, 'host')
+                                   + field_bytes(ANNOTATION_STRING,
+                                                 process['host']))
+
+            for field, value in sorted(process.get('rusage', {}).iteritems()):
+                annotations.append(field_bytes(ANNOTATION_NAME, field)
+                                   + field_int(ANNOTATION_INT, value))
+
+            item = packet(
+                field_int(PACKET_TIMESTAMP,
+                          (process['start'] - origin) * 1000000),
+                field_bytes(PACKET_TRACK_EVENT,
+                    field_int(EVENT_TYPE, SLICE_BEGIN)
+                    + field_int(EVENT_TRACK_UUID, THREAD_UUID + tid)
+                    + field_bytes(EVENT_CATEGORIES, process['type'])
+                    + field_bytes(EVENT_NAME, name)
+                    + ''.join(field_bytes(EVENT_ANNOTATIONS, annotation)
+                              for annotation in annotations)))
+        elif kind == END:
+            item = packet(
+                field_int(PACKET_TIMESTAMP, (event[3] - origin) * 1000000),
+                field_bytes(PACKET_TRACK_EVENT,
+                    field_int(EVENT_TYPE, SLICE_END)
+                    + field_int(EVENT_TRACK_UUID, THREAD_UUID + event[2])))
+        elif kind == PROCESS:
+            item = packet(field_bytes(PACKET_TRACK_DESCRIPTOR,
+                field_int(TRACK_UUID, event[1])
+                + field_bytes(TRACK_PROCESS,
+                    field_int(PROCESS_PID, event[1])
+                    + field_bytes(PROCESS_NAME, describe(event[2])[1]))))
+        else:
+            item = packet(field_bytes(PACKET_TRACK_DESCRIPTOR,
+                field_int(TRACK_UUID, THREAD_UUID + event[2])
+                + field_bytes(TRACK_THREAD,
+                    field_int(THREAD_PID, event[1])
+                    + field_int(THREAD_TID, event[2])
+                    + field_bytes(THREAD_NAME, 'job %d' % event[3]))))
+
+        chunk.append(item)
+        size += len(item)
+
+        if size >= WRITE_SIZE:
+            fd.write(''.join(chunk))
+            chunk = []
+            size = 0
+
+    fd.write(''.join(chunk))
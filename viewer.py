@@ -1,20 +1,234 @@
 #!/usr/bin/env python
-from config import proxy_url, default_viewport, default_dataset
-from templates import templates
-from processors import gzip_response #, load_sqlalchemy
+import sys
 import web
 
+# The production server (see server.py) does not reload modules or recompile
+# templates for every request, which depends on web.config.debug when the app
+# and the templates are created.
+if __name__ == '__main__' and sys.argv[1:2] == ['serve']:
+    web.config.debug = False
+
+from config import proxy_url, default_viewport, default_dataset, data_dir, \
+        response_cache_size, data_cache_size, stream_threshold, \
+        stream_chunk_size, diff_report_limit
+from cache import KeyLocks, LRUCache, cached
+from catalog import Catalog
+from compress import accepts_encoding, compressed_path, file_chunks, \
+        gzip_chunks
+from dataset import load_cached
+from templates import templates
+from processors import gzip_response, check_etag #, load_sqlalchemy
+from hashlib import sha1
+import os
+import simplejson as json
+import workers
+
 urls = (proxy_url + '/?', 'index',  
-        # <base_url>/view/<start>/<end>/<scale>/<threshold>
-        proxy_url + '/view/%d/%d/%d/%d', 'view')
+        # <base_url>/catalog
+        proxy_url + '/catalog', 'catalog_list',
+        # <base_url>/view/[<file name>/]<start>/<end>/<scale>/<threshold>
+        proxy_url + r'/view/(\d+)/(\d+)/([\d.]+)/([\d.]+)', 'default_view',
+        proxy_url + r'/view/([^/]+)/(\d+)/(\d+)/([\d.]+)/([\d.]+)', 'view',
+        # <base_url>/analysis[/<file name>]
+        proxy_url + '/analysis', 'default_analysis',
+        proxy_url + r'/analysis/([^/]+)', 'analysis',
+        # <base_url>/process/<file name>/<pid>
+        proxy_url + r'/process/([^/]+)/(\d+)', 'process',
+        # <base_url>/diff/<file name>/<file name>[/report[?limit=<n>]]
+        proxy_url + r'/diff/([^/]+)/([^/]+)', 'diff',
+        proxy_url + r'/diff/([^/]+)/([^/]+)/report', 'diff_report',
+        # <base_url>/data/<file name>
+        proxy_url + r'/data/([^/]+)', 'data')
 
 app = web.application(urls, globals())
 app.add_processor(gzip_response)
 #app.add_processor(load_sqlalchemy)
 
+# JSON response bodies, which map an ETag to the body (see cached_json).
+views = LRUCache(response_cache_size)
+computing = KeyLocks()
+
+# Contents of (pre-compressed) dataset files, which map a path and
+# modification time to the file contents. Files larger than stream_threshold
+# are streamed instead.
+files = LRUCache(data_cache_size)
+reading = KeyLocks()
+
+content_types = {'.json': 'application/json', '.lod': 'application/json',
+                 '.bsac': 'application/octet-stream'}
+
+
+def dataset_path(name):
+    """
+    Return the path of the given file in the data directory, or respond with
+    ``404 Not Found`` if it does not exist.
+    """
+    path = os.path.join(data_dir, name)
+
+    if not os.path.isfile(path):
+        raise web.notfound()
+
+    return path
+
+
+def get_dataset(name):
+    """
+    Return the modification time and the loaded dataset of the given file in
+    the data directory. The dataset is reloaded when the file has been
+    modified.
+    """
+    return load_cached(dataset_path(name))
+
+
+# Datasets in the data directory, with their metadata.
+catalog = Catalog(data_dir, lambda name: get_dataset(name)[1])
+
+
+def cached_json(key, compute):
+    """
+    Respond with the JSON body returned by ``compute()``. The response body
+    is cached with an ETag derived from ``key``, which should contain the
+    modification times of the datasets that are used. Concurrent requests for
+    the same body wait for the first one to compute it.
+    """
+    etag = '"%s"' % sha1(repr(key)).hexdigest()
+
+    web.header('Content-Type', 'application/json')
+    check_etag(etag)
+
+    return cached(views, computing, etag, compute)
+
+
 class index:
     def GET(self):
-        return templates.index(default_dataset, default_viewport)
+        dataset = web.input(dataset=default_dataset).dataset
+        return templates.index(dataset, default_viewport, catalog.scan())
+
+
+class catalog_list:
+    def GET(self):
+        web.header('Content-Type', 'application/json')
+        return json.dumps(catalog.scan())
+
+
+class view:
+    def GET(self, name, start, end, scale, threshold):
+        path = dataset_path(name)
+        key = 'view', name, os.path.getmtime(path), start, end, scale, \
+                threshold
+
+        return cached_json(key, lambda: workers.run(workers.encode_view, path,
+                int(start), int(end), float(scale), float(threshold)))
+
+
+class default_view(view):
+    def GET(self, *args):
+        return view.GET(self, default_dataset, *args)
+
+
+class analysis:
+    def GET(self, name):
+        path = dataset_path(name)
+        key = 'analysis', name, os.path.getmtime(path)
+
+        return cached_json(key, lambda: workers.run(workers.encode_analysis,
+                                                    path))
+
+
+class default_analysis(analysis):
+    def GET(self):
+        return analysis.GET(self, default_dataset)
+
+
+class process:
+    def GET(self, name, pid):
+        mtime, dataset = get_dataset(name)
+        syscalls = dataset.syscalls(int(pid))
+
+        if syscalls is None:
+            raise web.notfound()
+
+        web.header('Content-Type', 'application/json')
+        check_etag('"%s"' % sha1(repr((name, mtime, pid))).hexdigest())
+
+        return syscalls
+
+
+class diff:
+    def GET(self, a, b):
+        return templates.diff(a, b, default_viewport)
+
+
+class diff_report:
+    def GET(self, a, b):
+        path_a, path_b = dataset_path(a), dataset_path(b)
+
+        limit = web.input(limit=diff_report_limit).limit
+
+        if not str(limit).isdigit():
+            raise web.badrequest()
+
+        limit = int(limit)
+
+        key = 'diff', a, os.path.getmtime(path_a), b, \
+                os.path.getmtime(path_b), limit
+
+        return cached_json(key, lambda: workers.run(workers.encode_diff,
+                                                    path_a, path_b, limit))
+
+
+class data:
+    def GET(self, name):
+        path = os.path.join(data_dir, name)
+
+        if not os.path.isfile(path):
+            raise web.notfound()
+
+        accepts = web.ctx.env.get('HTTP_ACCEPT_ENCODING', '')
+        path, encoding = compressed_path(path, accepts)
+        stat = os.stat(path)
+
+        # Large files are sent in chunks as they are read, instead of as one
+        # string, and compressed while they are sent if there is no
+        # pre-compressed copy.
+        stream = stat.st_size > stream_threshold
+
+        if stream and not encoding and accepts_encoding(accepts, 'gzip'):
+            compress, encoding = True, 'gzip'
+        else:
+            compress = False
+
+        extension = os.path.splitext(name)[1]
+        web.header('Content-Type',
+                   content_types.get(extension, 'application/octet-stream'))
+
+        if encoding:
+            web.header('Content-Encoding', encoding)
+
+        # Files that are not encoded here are compressed by gzip_response,
+        # unless they are streamed (which only happens if the client does not
+        # accept gzip).
+        check_etag('"%x-%x"' % (int(stat.st_mtime), stat.st_size), encoding)
+
+        if stream:
+            chunks = file_chunks(path, stream_chunk_size)
+
+            if compress:
+                return gzip_chunks(chunks)
+
+            web.header('Content-Length', str(stat.st_size))
+            return chunks
+
+        def read():
+            with open(path, 'rb') as fd:
+                return fd.read()
+
+        return cached(files, reading, (path, stat.st_mtime), read)
 
 if __name__ == '__main__':
-    app.run()
+    # ``viewer.py serve`` runs the production server, see server.py.
+    if sys.argv[1:2] == ['serve']:
+        import server
+        server.main(app, sys.argv[2:])
+    else:
+        app.run()
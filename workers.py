@@ -0,0 +1,105 @@
+"""
+CPU-heavy work of the viewer: the views, analyses and comparisons of datasets,
+encoded as JSON. Python code and the JSON encoder hold the global interpreter
+lock, so a thread of the server that analyzes a large build stalls all other
+requests. In the serving mode of the viewer (see ``server``), the work is
+therefore done by a pool of worker processes. Workers load the datasets
+themselves (see ``dataset.load_cached``), so only file names and encoded
+responses are passed between the processes. The server process and the
+workers share ``config.dataset_cache_size``: each of them keeps the datasets it
+has loaded up to an equal part of it.
+
+Without a pool (e.g. in the development server of ``viewer.py``), the work is
+done by the calling thread.
+"""
+
+from multiprocessing import Pool
+import signal
+
+import simplejson as json
+
+from analysis import analyze
+from config import dataset_cache_size
+from dataset import limit_cache, load_cached
+from diff import compare
+from tokens import TokenTable, encode_processes
+
+# Pool of worker processes, see ``start``.
+pool = None
+
+
+def ignore_interrupts():
+    # The server stops the workers when it is interrupted.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def start(processes):
+    """
+    Start a pool of ``processes`` worker processes. Start the pool before the
+    threads of the server, since the workers are forked.
+    """
+    global pool
+
+    # The server process loads datasets as well (e.g. for the syscalls of a
+    # process). The workers inherit the limit of the cache.
+    limit_cache(dataset_cache_size // (processes + 1))
+    pool = Pool(processes, ignore_interrupts)
+
+
+def stop():
+    global pool
+
+    if pool is not None:
+        pool.terminate()
+        pool.join()
+        pool = None
+
+
+def run(task, *args):
+    """
+    Return the result of ``task(*args)``, computed by a worker process if the
+    pool has been started. The calling thread waits for the result without
+    holding the global interpreter lock.
+    """
+    if pool is None:
+        return task(*args)
+
+    return pool.apply(task, args)
+
+
+def encode_view(path, start, end, scale, threshold):
+    """
+    Return the processes of the dataset at ``path`` in a viewport (see
+    ``dataset.Dataset.view``), encoded as a JSON dataset.
+    """
+    mtime, dataset = load_cached(path)
+    processes = dataset.view(start, end, scale, threshold)
+
+    properties = dict(dataset.properties)
+    properties['threshold'] = threshold
+    result = {'version': 100, 'properties': properties}
+
+    # The string table only contains the tokens of the selected processes.
+    if properties.get('tokens'):
+        table = TokenTable()
+        processes = dict(encode_processes(processes.iteritems(), table))
+        result['strings'] = table.strings
+
+    result['processes'] = processes
+
+    return json.dumps(result)
+
+
+def encode_analysis(path):
+    mtime, dataset = load_cached(path)
+    dataset = dataset.with_syscalls()
+
+    return json.dumps(analyze(dataset.processes, dataset.root))
+
+
+def encode_diff(path_a, path_b, limit):
+    mtime_a, dataset_a = load_cached(path_a)
+    mtime_b, dataset_b = load_cached(path_b)
+
+    return json.dumps(compare(dataset_a.with_syscalls(),
+                              dataset_b.with_syscalls(), limit))
@@ -0,0 +1,7 @@
+#!/bin/sh
+BSA=$(dirname $(readlink -f $0))
+# Rebuild the wrapper when its source (and thereby its record format) changed.
+test $BSA/bsa-shell -nt $BSA/bsa-shell.c ||
+    cc -O2 -o $BSA/bsa-shell $BSA/bsa-shell.c || exit 1
+rm -f wrapper.trace
+BSA_TRACE=$PWD/wrapper.trace make -sj12 SHELL=$BSA/bsa-shell $@